@@ -1,66 +1,209 @@
-import os
-from cachefiles import latestValidUserFileOrNew, loadDataFromFile
-from apitools import fetchDataForUser
+from collections import namedtuple
+import heapq
+import itertools
+import math
+from types import MappingProxyType
+from cachefiles import iterUserList, similarMediaForUser
 import constants
+import expansion
+from mediastore import loadMedia
+from output import writePropertyFiles
+import profiling
+from records import Entry, Property, detachedRecs
+import resultcache
+
+
+# --candidates: whether recs come from AniList's recommendations, from the similar titles
+# index built by similarity.py, or both
+CANDIDATE_SOURCES = {
+    "recs": (True, False),
+    "similar": (False, True),
+    "both": (True, True),
+}
+
+
+def needsRecommendations(candidates, expand=1):
+    # whether titles have to be fetched with their recommendations: they're the
+    # candidates, or --expand walks them
+    return CANDIDATE_SOURCES[candidates][0] or expand > 1
+
+
+# everything scoring needs from one user's cached list that doesn't depend on which angles
+# are used, so it can be kept around and ranked again with other flags
+UserState = namedtuple(
+    "UserState",
+    [
+        "userName",
+        "propertyRatings",
+        "recommendations",
+        "origins",
+        "userList",
+        "userIndex",
+        "meanScore",
+        "userProfile",
+    ],
+)
+
+
+def scoreRecommendationList(
+    userName,
+    use,
+    backend="python",
+    limit=None,
+    propertyFiles=False,
+    resultCache=True,
+    candidates="recs",
+    expand=1,
+    directory=".",
+):
+    # everything after the fetch. it only reads the cache, so it can run in another process.
+    # with a limit, only the best recs are ranked and returned: enough of them that
+    # `limit` are left once titles in constants.WATCHED_STATUSES are filtered out.
+    # propertyFiles writes the user's ratings per tag, studio, genre, decade and staff
+    # into directory. with resultCache, a list scored before with the same flags is read
+    # back instead.
+    # candidates picks where recs come from, see CANDIDATE_SOURCES, and expand how many
+    # hops into the recommendation graph they may be
+    contentKey = (
+        resultcache.contentKey(userName, candidates=candidates, expand=expand)
+        if resultCache
+        else None
+    )
+    rankingKey = None
+    if contentKey is not None:
+        rankingKey = resultcache.resultKey(
+            "ranking", contentKey, sorted(use.items()), backend, limit
+        )
+        with profiling.stage("initial", scoring=True, user=userName):
+            cached = resultcache.get(rankingKey)
+        if cached is not None:
+            finalRecs, finalOrigins, userList, userIndex, propertyRatings = cached
+            print(f"loaded {len(userList)} scored titles for {userName} from the result cache")
+            if propertyFiles:
+                with profiling.stage("properties", user=userName):
+                    writePropertyFiles(
+                        userName=userName,
+                        propertyRatings=propertyRatings,
+                        directory=directory,
+                    )
+            return finalRecs, finalOrigins, userList, userIndex
+
+    state = loadUserState(
+        userName=userName, contentKey=contentKey, candidates=candidates, expand=expand
+    )
+    finalRecs, finalOrigins = rankUserState(
+        state=state, use=use, backend=backend, limit=limit
+    )
 
+    if propertyFiles:
+        with profiling.stage("properties", user=userName):
+            writePropertyFiles(
+                userName=userName,
+                propertyRatings=state.propertyRatings,
+                directory=directory,
+            )
 
-def generateJointList(userData):
-    userDicts = [{rec["recMedia"]["id"]: rec for rec in d["list"]} for d in userData]
-    userScores = [
-        {entry["media"]["id"]: entry["score"] for entry in d["userList"]}
-        for d in userData
-    ]
-    dictsUnion = {}
-    for d in userDicts:
-        dictsUnion = dictsUnion | d
-
-    jointList = [value for (key, value) in dictsUnion.items()]
-    for rec in jointList:
-        score = 0
-        for i, d in enumerate(userDicts):
-            mediaId = rec["recMedia"]["id"]
-            userRating = userScores[i].get(mediaId) or 0
-            if userRating > 0:
-                score += userRating
-            else:
-                score += d.get(mediaId, {"recScore": 0})["recScore"]
-        rec["recScore"] = score / len(userDicts)
-
-    return jointList
-
-
-def getRecommendationList(userName, use, refresh):
-    if not userName:
-        return None, None
-
-    userFile = latestValidUserFileOrNew(userName=userName, clean=True)
-    userList = []
-
-    if refresh or not os.path.exists(userFile):
-        userList = fetchDataForUser(userName)
-    else:
-        userList = loadDataFromFile(userFile)
-
-    print(f"loaded {len(userList)} titles for {userName}")
+    if rankingKey is not None:
+        finalRecs = detachedRecs(finalRecs)
+        resultcache.put(
+            rankingKey,
+            (finalRecs, finalOrigins, state.userList, state.userIndex, state.propertyRatings),
+        )
 
-    meanScore = calculateMeanScore(userList)
+    return finalRecs, finalOrigins, state.userList, state.userIndex
+
+
+def loadUserState(userName, contentKey=None, candidates="recs", expand=1):
+    # a single pass over the cached entries collects the mean score, the index and every
+    # sum calculateBiases needs. "initial" includes the time spent reading the cache,
+    # which is also reported on its own as "load". with a contentKey (resultcache.contentKey)
+    # the state is read from and kept in the result cache. expand > 1 adds titles up to
+    # that many hops away in the stored recommendation graph, see expandRecommendations
+    stateKey = None if contentKey is None else resultcache.resultKey("state", contentKey)
+    with profiling.stage("initial", scoring=True, user=userName):
+        cached = None if stateKey is None else resultcache.get(stateKey)
+        if cached is not None:
+            state = cached._replace(userName=userName)
+            print(f"loaded {len(state.userList)} titles for {userName} from the result cache")
+        else:
+            withRecommendations, withSimilar = CANDIDATE_SOURCES[candidates]
+            aggregator = UserListAggregator(
+                similarMedia=similarMediaForUser(userName=userName) if withSimilar else None
+            )
+            for entry in profiling.timedIter(
+                "load",
+                iterUserList(userName=userName, withRecommendations=withRecommendations),
+                user=userName,
+            ):
+                aggregator.add(entry)
+            if withSimilar:
+                aggregator.resolveCandidates(
+                    loadMedia(aggregator.unresolvedCandidates(), withRecommendations=False)
+                )
+
+            print(f"loaded {len(aggregator.userList)} titles for {userName}")
+
+            propertyRatings, recommendations, origins = aggregator.finalize()
+            if expand > 1:
+                with profiling.stage("expand", user=userName):
+                    recommendations += expandRecommendations(
+                        recommendations, origins, aggregator.userIndex, depth=expand
+                    )
+            state = UserState(
+                userName=userName,
+                propertyRatings=propertyRatings,
+                recommendations=recommendations,
+                origins=origins,
+                userList=aggregator.userList,
+                userIndex=aggregator.userIndex,
+                meanScore=aggregator.meanScore,
+                userProfile=None,
+            )
+            if stateKey is not None:
+                # the profile is cheap to compile again and is left out of the cache
+                resultcache.put(
+                    stateKey,
+                    state._replace(recommendations=detachedRecs(state.recommendations)),
+                )
+
+        print(f"{userName} gives a mean score of {state.meanScore}")
+
+    return state._replace(
+        userProfile=compileUserProfile(
+            propertyRatings=state.propertyRatings, userMean=state.meanScore
+        )
+    )
 
-    print(f"{userName} gives a mean score of {meanScore}")
 
-    propertyRatings, recommendations, origins = calculateInitial(
-        userList=userList, meanScore=meanScore
-    )
+def rankUserState(state, use, backend="python", limit=None):
+    # scores and ranks the recs of a loaded user, normalized so the best one gets 100.
+    # the state is left untouched, so it can be ranked again
+    if limit is not None:
+        limit += sum(
+            1
+            for entry in state.userIndex.values()
+            if entry.status in constants.WATCHED_STATUSES
+        )
 
-    finalRecs, finalOrigins = calculateBiases(
-        propertyRatings=propertyRatings,
-        recs=recommendations,
-        use=use,
-        recOrigins=origins,
-        userMean=meanScore,
-    )
+    # calculateBiases adds the angles it finds to each rec's origins, next to the ones
+    # from the list itself
+    origins = {mediaId: dict(angles) for mediaId, angles in state.origins.items()}
+
+    profiling.count("candidates scored", len(state.recommendations))
+    with profiling.stage("biases", scoring=True, user=state.userName):
+        finalRecs, finalOrigins = calculateBiases(
+            propertyRatings=state.propertyRatings,
+            recs=state.recommendations,
+            use=use,
+            recOrigins=origins,
+            userMean=state.meanScore,
+            userProfile=state.userProfile,
+            backend=backend,
+            limit=limit,
+        )
 
     if not finalRecs:
-        return [], {}, userList
+        return [], {}
 
     exponent = 0.25
     topScore = (finalRecs[0]["recScore"] + 1) ** exponent
@@ -68,29 +211,56 @@ def getRecommendationList(userName, use, refresh):
     for rec in finalRecs:
         rec["recScore"] = round(((rec["recScore"] + 1) ** exponent) / topScore * 100, 2)
 
-    with open(f"{userName}-tags.txt", "w", encoding="utf-8") as f:
-        for tag in propertyRatings["tags"]:
-            print(f"{tag['tag']['name']}: {tag['score']}%", file=f)
+    return finalRecs, finalOrigins
+
+
+def expandRecommendations(recs, origins, userIndex, depth):
+    # recs for the titles that the direct candidates in recs lead to within `depth` hops
+    # of the list, from the recommendations already in the store, so no requests are
+    # made. they're scored by expansion.expandCandidates, which keeps the walk within
+    # constants.EXPANSION_NODE_BUDGET, and are liked for the same titles on the list as
+    # the candidate they were reached from
+    mediaAngle = list(constants.ANGLES.keys())[1]
+    found = expansion.expandCandidates(
+        seeds={rec["recMedia"].id: rec["recScore"] for rec in recs},
+        exclude=userIndex,
+        graph=expansion.RecommendationGraph(),
+        depth=depth,
+    )
+    profiling.count("candidates expanded", len(found))
+    mediaById = loadMedia(list(found), withRecommendations=False)
+    expanded = []
+    for mediaId, (score, seed) in found.items():
+        if mediaId not in mediaById:
+            continue
+        expanded.append({"recScore": score, "recMedia": mediaById[mediaId]})
+        likedFor = origins.get(seed, {}).get(mediaAngle)
+        if likedFor:
+            origins.setdefault(mediaId, {})[mediaAngle] = dict(likedFor)
+    return expanded
 
-    with open(f"{userName}-studios.txt", "w", encoding="utf-8") as f:
-        for studio in propertyRatings["studios"]:
-            print(f"{studio['studio']['name']}: {studio['score']}%", file=f)
 
-    with open(f"{userName}-genres.txt", "w", encoding="utf-8") as f:
-        for genre in propertyRatings["genres"]:
-            print(f"{genre['genre']}: {genre['score']}%", file=f)
+def unwatchedRecs(recs, userIndex):
+    # the recs for titles the user hasn't watched yet (constants.WATCHED_STATUSES), lazily
+    for rec in recs:
+        entry = userIndex.get(rec["recMedia"].id)
+        if entry is None or entry.status not in constants.WATCHED_STATUSES:
+            yield rec
 
-    with open(f"{userName}-decades.txt", "w", encoding="utf-8") as f:
-        for decade in propertyRatings["decades"]:
-            print(f"{decade['decade']}: {decade['score']}%", file=f)
 
-    with open(f"{userName}-staff.txt", "w", encoding="utf-8") as f:
-        for staff in propertyRatings["staff"]:
-            print(
-                f"{staff['staff']['name']['userPreferred']}: {staff['score']}%", file=f
-            )
+def numpyBackendAvailable():
+    # imports numpy and scipy, so it's only asked once the numpy backend was chosen
+    import vectorscoring
+
+    return vectorscoring.AVAILABLE
+
 
-    return finalRecs, finalOrigins, userList
+def indexUserList(userList):
+    # map media id -> list entry, keeping the first entry like a linear scan would
+    userIndex = {}
+    for entry in userList:
+        userIndex.setdefault(entry.mediaId, entry)
+    return userIndex
 
 
 def calculateMeanScore(userList):
@@ -98,7 +268,7 @@ def calculateMeanScore(userList):
     scoresCount = 0
 
     for ratedAni in userList:
-        score = ratedAni["score"]
+        score = ratedAni.score
         if score <= 0:
             continue
         scoresTotal += score
@@ -111,27 +281,35 @@ def calculateMeanScore(userList):
 
 
 def calculateAveragePropertyScorePhase1(
-    propertyList, propRatings, propType: str, score, weightName=None
+    propertyList, propRatings, propType: str, score, weights=None
 ):
-    for prop in propertyList:
-        propId = prop["id"] if isinstance(prop, dict) and "id" in prop else prop
+    # a score of None stands for the user's mean score, which is only known once the
+    # whole list has been seen, so its weight is summed apart ("imputed") and multiplied
+    # in by phase 2. scores and weights are whole numbers, so both sums are exact.
+    # properties are records.Property, or their own id (genres and decades). weights
+    # line up with propertyList and default to 1
+    for prop, weight in zip(propertyList, weights or itertools.repeat(1)):
+        propId = prop.id if isinstance(prop, Property) else prop
         propRating = propRatings.setdefault(
-            propId, {propType: prop, "sum": 0, "count": 0}
+            propId, {propType: prop, "sum": 0, "count": 0, "imputed": 0}
         )
-        if weightName:
-            weight = prop[weightName]
-            propRating["sum"] += score * weight
-            propRating["count"] += weight
+        if score is None:
+            propRating["imputed"] += weight
         else:
-            propRating["sum"] += score
-            propRating["count"] += 1
+            propRating["sum"] += score * weight
+        propRating["count"] += weight
 
     return propRatings
 
 
-def calculateAveragePropertyScorePhase2(minThreshold: int, propType: str, propRatings):
+def calculateAveragePropertyScorePhase2(
+    minThreshold: int, propType: str, propRatings, meanScore=0
+):
     finalPropRatings = [
-        {propType: x[propType], "score": x["sum"] / x["count"]}
+        {
+            propType: x[propType],
+            "score": exactTotal([x["sum"]], [x["imputed"]], meanScore) / x["count"],
+        }
         for x in list(propRatings.values())
         if x["count"] > minThreshold
     ]
@@ -140,145 +318,338 @@ def calculateAveragePropertyScorePhase2(minThreshold: int, propType: str, propRa
     return finalPropRatings
 
 
+def addExactly(partials, x):
+    # adds x to a sum kept as non-overlapping floats, the way math.fsum does (Shewchuk's
+    # algorithm). the sum is exact, so it doesn't depend on the order its terms came in,
+    # and it takes a few floats however many terms there are
+    i = 0
+    for y in partials:
+        if abs(x) < abs(y):
+            x, y = y, x
+        high = x + y
+        low = y - (high - x)
+        if low:
+            partials[i] = low
+            i += 1
+        x = high
+    partials[i:] = [x]
+
+
+def exactProduct(a, b):
+    # a * b as two floats that add up to it exactly (Dekker's algorithm)
+    product = a * b
+    aHigh, aLow = splitFloat(a)
+    bHigh, bLow = splitFloat(b)
+    return product, ((aHigh * bHigh - product) + aHigh * bLow + aLow * bHigh) + aLow * bLow
+
+
+def splitFloat(a):
+    # a as two floats of at most 26 significant bits each
+    scaled = 134217729.0 * a  # 2**27 + 1
+    high = scaled - (scaled - a)
+    return high, a - high
+
+
+def exactTotal(partials, imputed, meanScore):
+    # sum(partials) + sum(imputed) * meanScore, rounded once
+    terms = list(partials)
+    for weight in imputed:
+        if weight:
+            terms.extend(exactProduct(float(weight), float(meanScore)))
+    return math.fsum(terms)
+
+
 def getDecadeFromYear(year):
     return (int(year) // 10) * 10
 
 
-def calculateInitial(userList, meanScore):
-    angleKeys = list(constants.ANGLES.keys())
-    decadeRatings = {}
-    genreRatings = {}
-    tagRatings = {}
-    studioRatings = {}
-    staffRatings = {}
-    recommendations = {}
-    origins = {}
-
-    for ratedAni in userList:
-        score = ratedAni["score"]
-        status = ratedAni["status"] if "status" in ratedAni.keys() else ""
-        if score <= 0:
-            if status == "DROPPED":
-                score = 25
-            else:
-                score = meanScore
-        media = ratedAni["media"]
-        mediaMeanScore = (media.get("meanScore") or 100) * 2
-        popularity = media["popularity"]
-
-        if media.get("startDate") and media["startDate"].get("year"):
-            decadeRatings = calculateAveragePropertyScorePhase1(
-                propertyList=[getDecadeFromYear(media["startDate"]["year"])],
-                propRatings=decadeRatings,
+class UserListAggregator:
+    # folds a user's list into property and recommendation sums in a single pass, so
+    # entries can come straight from a stream. unscored entries count as the user's mean
+    # score, which isn't known until the last entry, so their share of every sum is kept
+    # as a separate weight and multiplied in by finalize. sums are exact, so they come
+    # out the same whatever order the entries arrive in
+
+    def __init__(self, similarMedia=None):
+        # similarMedia maps a media id to its (media id, similarity) neighbours in the
+        # similar titles index, which become candidates next to AniList's recommendations
+        self.similarMedia = similarMedia
+        self.mediaAngle = list(constants.ANGLES.keys())[1]
+        self.scoresTotal = 0
+        self.scoresCount = 0
+        self.userList = []
+        self.userIndex = {}
+        self.decadeRatings = {}
+        self.genreRatings = {}
+        self.tagRatings = {}
+        self.studioRatings = {}
+        self.staffRatings = {}
+        self.recommendations = {}
+        self.origins = {}
+        # (rec id, media id) -> rating / popularity for media origins of unscored entries
+        self.pendingOrigins = {}
+
+    @property
+    def meanScore(self):
+        if self.scoresCount <= 0:
+            return 50
+        return self.scoresTotal / self.scoresCount
+
+    def add(self, ratedAni):
+        score = ratedAni.score
+        status = ratedAni.status or ""
+        media = ratedAni.media
+
+        # keep only what the list filters need, not the media
+        slimEntry = Entry(media.id, score, status, ratedAni.updatedAt)
+        self.userList.append(slimEntry)
+        self.userIndex.setdefault(media.id, slimEntry)
+
+        if score > 0:
+            self.scoresTotal += score
+            self.scoresCount += 1
+        elif status == "DROPPED":
+            score = 25
+        else:
+            score = None
+        mediaMeanScore = (media.meanScore or 100) * 2
+        popularity = media.popularity
+
+        if media.year:
+            calculateAveragePropertyScorePhase1(
+                propertyList=[getDecadeFromYear(media.year)],
+                propRatings=self.decadeRatings,
                 propType="decade",
                 score=score,
             )
 
-        genreRatings = calculateAveragePropertyScorePhase1(
-            propertyList=media["genres"],
-            propRatings=genreRatings,
+        calculateAveragePropertyScorePhase1(
+            propertyList=media.genres,
+            propRatings=self.genreRatings,
             propType="genre",
             score=score,
         )
 
-        studioRatings = calculateAveragePropertyScorePhase1(
-            propertyList=media["studios"]["nodes"],
-            propRatings=studioRatings,
+        calculateAveragePropertyScorePhase1(
+            propertyList=media.studios,
+            propRatings=self.studioRatings,
             propType="studio",
             score=score,
         )
 
-        tagRatings = calculateAveragePropertyScorePhase1(
-            propertyList=media["tags"],
-            propRatings=tagRatings,
+        calculateAveragePropertyScorePhase1(
+            propertyList=media.tags,
+            propRatings=self.tagRatings,
             propType="tag",
             score=score,
-            weightName="rank",
+            weights=media.tagRanks,
         )
 
-        staffRatings = calculateAveragePropertyScorePhase1(
-            propertyList=media["staff"]["nodes"],
-            propRatings=staffRatings,
+        calculateAveragePropertyScorePhase1(
+            propertyList=media.staff,
+            propRatings=self.staffRatings,
             propType="staff",
             score=score,
         )
 
-        for rec in media["recommendations"]["nodes"]:
-            rating = rec["rating"]
-
+        for rating, recMedia in media.recommendations or ():
             # ensure we don't count an opinion held by only one person (and don't count negative values)
             if rating < 1:
                 continue
 
-            recMedia = rec["mediaRecommendation"]
-
             # ensure we do not try to process null values
             if not recMedia:
                 continue
 
-            recPopularity = recMedia["popularity"]
-            recId = recMedia["id"]
-
-            # ensure that we don't recommend things that the user already has on their list
-            # if any(x['media']['id'] == recId for x in userList):
-            #     continue
+            self.addCandidate(
+                media=media,
+                score=score,
+                mediaMeanScore=mediaMeanScore,
+                recId=recMedia.id,
+                recMedia=recMedia,
+                # normalize the rating to mitigate popularity bias
+                normalizedWeight=rating / (popularity + recMedia.popularity),
+            )
 
-            userMatch = next((x for x in userList if x["media"]["id"] == recId), None)
-            if userMatch:
-                origins.setdefault(recMedia["id"], {}).setdefault(angleKeys[0], {})[
-                    media["id"]
-                ] = userMatch["score"]
-
-            normalizedRating = (
-                rating / (popularity + recPopularity) * score
-            )  # normalize the rating to mitigate popularity bias and factor in user score
-            if normalizedRating > 0.005:
-                origins.setdefault(recMedia["id"], {}).setdefault(angleKeys[1], {})[
-                    media["id"]
-                ] = media
-            scaledRating = (
-                normalizedRating * mediaMeanScore
-            )  # scale rating based on mean score
-
-            recommendationRating = recommendations.setdefault(
-                recId, {"recScore": 0, "recMedia": recMedia, "recCount": 0}
+        if self.similarMedia is not None:
+            for recId, similarity in self.similarMedia.get(media.id, ()):
+                self.addCandidate(
+                    media=media,
+                    score=score,
+                    mediaMeanScore=mediaMeanScore,
+                    recId=recId,
+                    recMedia=None,
+                    normalizedWeight=similarity * constants.SIMILAR_MEDIA_WEIGHT,
+                )
+
+    def addCandidate(
+        self, media, score, mediaMeanScore, recId, recMedia, normalizedWeight
+    ):
+        # one edge from a title on the list to a candidate. recMedia is None for titles
+        # from the similar titles index until resolveCandidates loads them
+        recommendationRating = self.recommendations.get(recId)
+        if recommendationRating is None:
+            recommendationRating = self.recommendations[recId] = {
+                "recScore": [],
+                "recMedia": recMedia,
+                "recCount": 0,
+                "imputed": [],
+                "sources": {},
+            }
+        elif recommendationRating["recMedia"] is None:
+            recommendationRating["recMedia"] = recMedia
+        recommendationRating["recCount"] += 1
+        # whether the user has the rec on their list is only known after the last
+        # entry, so remember where it came from
+        recommendationRating["sources"][media.id] = None
+
+        if score is None:
+            # only keep what the output needs, the title, so the entry's media can
+            # be freed
+            mediaOrigins = self.origins.setdefault(recId, {}).setdefault(
+                self.mediaAngle, {}
             )
-            recommendationRating["recScore"] += scaledRating
-            recommendationRating["recCount"] += 1
+            originKey = (recId, media.id)
+            if media.id not in mediaOrigins or originKey in self.pendingOrigins:
+                mediaOrigins[media.id] = media.title
+                self.pendingOrigins[originKey] = max(
+                    self.pendingOrigins.get(originKey, 0), normalizedWeight
+                )
+            addExactly(recommendationRating["imputed"], normalizedWeight * mediaMeanScore)
+            return
+
+        normalizedRating = normalizedWeight * score  # factor in user score
+        if normalizedRating > 0.005:
+            self.origins.setdefault(recId, {}).setdefault(self.mediaAngle, {})[
+                media.id
+            ] = media.title
+            self.pendingOrigins.pop((recId, media.id), None)
+        scaledRating = (
+            normalizedRating * mediaMeanScore
+        )  # scale rating based on mean score
+        addExactly(recommendationRating["recScore"], scaledRating)
+
+    def unresolvedCandidates(self):
+        return [
+            recId
+            for recId, recommendationRating in self.recommendations.items()
+            if recommendationRating["recMedia"] is None
+        ]
+
+    def resolveCandidates(self, mediaById):
+        # candidates whose media isn't in mediaById are left out by finalize
+        for recId in self.unresolvedCandidates():
+            self.recommendations[recId]["recMedia"] = mediaById.get(recId)
+
+    def finalize(self, meanScore=None, userIndex=None):
+        # meanScore and userIndex default to the ones collected from the entries seen
+        angleKeys = list(constants.ANGLES.keys())
+        meanScore = self.meanScore if meanScore is None else meanScore
+        userIndex = self.userIndex if userIndex is None else userIndex
+        origins = self.origins
+
+        for (recId, mediaId), normalizedWeight in self.pendingOrigins.items():
+            if normalizedWeight * meanScore > 0.005:
+                continue
+            mediaOrigins = origins[recId][angleKeys[1]]
+            del mediaOrigins[mediaId]
+            if not mediaOrigins:
+                del origins[recId][angleKeys[1]]
+                if not origins[recId]:
+                    del origins[recId]
+
+        for recId, recommendationRating in self.recommendations.items():
+            userMatch = userIndex.get(recId)
+            if userMatch:
+                origins.setdefault(recId, {})[angleKeys[0]] = dict.fromkeys(
+                    recommendationRating["sources"], userMatch.score
+                )
+
+        finalDecadeRatings = calculateAveragePropertyScorePhase2(
+            minThreshold=0,
+            propType="decade",
+            propRatings=self.decadeRatings,
+            meanScore=meanScore,
+        )
+        finalGenreRatings = calculateAveragePropertyScorePhase2(
+            minThreshold=2,
+            propType="genre",
+            propRatings=self.genreRatings,
+            meanScore=meanScore,
+        )
+        finalTagRatings = calculateAveragePropertyScorePhase2(
+            minThreshold=200,
+            propType="tag",
+            propRatings=self.tagRatings,
+            meanScore=meanScore,
+        )
+        finalStudioRatings = calculateAveragePropertyScorePhase2(
+            minThreshold=2,
+            propType="studio",
+            propRatings=self.studioRatings,
+            meanScore=meanScore,
+        )
+        finalStaffRatings = calculateAveragePropertyScorePhase2(
+            minThreshold=2,
+            propType="staff",
+            propRatings=self.staffRatings,
+            meanScore=meanScore,
+        )
 
-    finalDecadeRatings = calculateAveragePropertyScorePhase2(
-        minThreshold=0, propType="decade", propRatings=decadeRatings
-    )
+        finalRecList = [
+            {
+                "recScore": exactTotal(x["recScore"], x["imputed"], meanScore)
+                / x["recCount"],
+                "recMedia": x["recMedia"],
+            }
+            for x in list(self.recommendations.values())
+            if x["recCount"] > 1 and x["recMedia"] is not None
+        ]
 
-    finalGenreRatings = calculateAveragePropertyScorePhase2(
-        minThreshold=2, propType="genre", propRatings=genreRatings
-    )
-    finalTagRatings = calculateAveragePropertyScorePhase2(
-        minThreshold=200, propType="tag", propRatings=tagRatings
-    )
-    finalStudioRatings = calculateAveragePropertyScorePhase2(
-        minThreshold=2, propType="studio", propRatings=studioRatings
-    )
-    finalStaffRatings = calculateAveragePropertyScorePhase2(
-        minThreshold=2, propType="staff", propRatings=staffRatings
-    )
+        return (
+            {
+                "genres": finalGenreRatings,
+                "tags": finalTagRatings,
+                "studios": finalStudioRatings,
+                "staff": finalStaffRatings,
+                "decades": finalDecadeRatings,
+            },
+            finalRecList,
+            origins,
+        )
+
+
+def calculateInitial(userList, meanScore=None, userIndex=None):
+    # userList can be any iterable of entries, e.g. a stream from the cache. the mean
+    # score and the index are collected along the way unless they're passed in
+    aggregator = UserListAggregator()
+    for ratedAni in userList:
+        aggregator.add(ratedAni)
+    return aggregator.finalize(meanScore=meanScore, userIndex=userIndex)
 
-    finalRecList = [
-        {"recScore": x["recScore"] / x["recCount"], "recMedia": x["recMedia"]}
-        for x in list(recommendations.values())
-        if x["recCount"] > 1
-    ]
 
-    return (
+def compileUserProfile(propertyRatings, userMean):
+    # frozen id -> score tables so scoring a rec is lookups only
+    return MappingProxyType(
         {
-            "genres": finalGenreRatings,
-            "tags": finalTagRatings,
-            "studios": finalStudioRatings,
-            "staff": finalStaffRatings,
-            "decades": finalDecadeRatings,
-        },
-        finalRecList,
-        origins,
+            "decades": MappingProxyType(
+                {x["decade"]: x["score"] for x in propertyRatings["decades"]}
+            ),
+            "genres": MappingProxyType(
+                {x["genre"]: x["score"] for x in propertyRatings["genres"]}
+            ),
+            "tags": MappingProxyType(
+                {x["tag"].id: x["score"] for x in propertyRatings["tags"]}
+            ),
+            "studios": MappingProxyType(
+                {x["studio"].id: x["score"] for x in propertyRatings["studios"]}
+            ),
+            "staff": MappingProxyType(
+                {x["staff"].id: x["score"] for x in propertyRatings["staff"]}
+            ),
+            "userMean": userMean,
+            "originThreshold": -0.2 + 0.853 * userMean + (1.49e-3 * (userMean**2)),
+        }
     )
 
 
@@ -288,25 +659,45 @@ def calculateBiases(
     use,
     recOrigins,
     userMean,
+    userProfile=None,
+    backend="python",
+    limit=None,
 ):
+    if userProfile is None:
+        userProfile = compileUserProfile(
+            propertyRatings=propertyRatings, userMean=userMean
+        )
+    if backend == "numpy":
+        import vectorscoring
+
+        return vectorscoring.calculateBiasesVectorized(
+            recs=recs,
+            use=use,
+            recOrigins=recOrigins,
+            userProfile=userProfile,
+            limit=limit,
+        )
     angleKeys = list(constants.ANGLES.keys())
     finalRecs = []
-    originThreshold = -0.2 + 0.853 * userMean + (1.49e-3 * (userMean ** 2))
+    originThreshold = userProfile["originThreshold"]
+    decadeRatings = userProfile["decades"]
+    genreRatings = userProfile["genres"]
+    tagRatings = userProfile["tags"]
+    studioRatings = userProfile["studios"]
+    staffRatings = userProfile["staff"]
     for rec in recs:
         recMedia = rec["recMedia"]
 
         decadeTotal = 0
         decadeCount = 0
-        if use["decades"] and recMedia.get("startDate") and recMedia["startDate"].get("year"):
-            decades = [getDecadeFromYear(recMedia["startDate"]["year"])]
-            decadeRatings_d = {x["decade"]: x for x in propertyRatings["decades"]}
-            for decade in decades:
-                if decade not in decadeRatings_d:
-                    continue
-                decadeTotal += decadeRatings_d[decade]["score"]
+        if use["decades"] and recMedia.year:
+            decade = getDecadeFromYear(recMedia.year)
+            decadeRating = decadeRatings.get(decade)
+            if decadeRating is not None:
+                decadeTotal += decadeRating
                 decadeCount += 1
-                if decadeRatings_d[decade]["score"] > originThreshold:
-                    recOrigins.setdefault(recMedia["id"], {}).setdefault(
+                if decadeRating > originThreshold:
+                    recOrigins.setdefault(recMedia.id, {}).setdefault(
                         angleKeys[6], {}
                     )[decade] = decade
         decadeScore = decadeTotal / decadeCount if decadeCount > 0 else userMean
@@ -314,15 +705,14 @@ def calculateBiases(
         genreTotal = 0
         genreCount = 0
         if use["genres"]:
-            genres = recMedia["genres"]
-            genreRatings_d = {x["genre"]: x for x in propertyRatings["genres"]}
-            for genre in genres:
-                if genre not in genreRatings_d:
+            for genre in recMedia.genres:
+                genreRating = genreRatings.get(genre)
+                if genreRating is None:
                     continue
-                genreTotal += genreRatings_d[genre]["score"]
+                genreTotal += genreRating
                 genreCount += 1
-                if genreRatings_d[genre]["score"] > originThreshold:
-                    recOrigins.setdefault(recMedia["id"], {}).setdefault(
+                if genreRating > originThreshold:
+                    recOrigins.setdefault(recMedia.id, {}).setdefault(
                         angleKeys[5], {}
                     )[genre] = genre
         genreScore = genreTotal / genreCount if genreCount > 0 else userMean
@@ -330,16 +720,15 @@ def calculateBiases(
         tagTotal = 0
         tagCount = 0
         if use["tags"]:
-            tags = recMedia["tags"]
-            tagRatings_d = {x["tag"]["id"]: x for x in propertyRatings["tags"]}
-            for tag in tags:
-                tagId = tag["id"]
-                if tagId not in tagRatings_d:
+            for tag, rank in zip(recMedia.tags, recMedia.tagRanks):
+                tagId = tag.id
+                tagRating = tagRatings.get(tagId)
+                if tagRating is None:
                     continue
-                tagTotal += tagRatings_d[tagId]["score"] * tag["rank"]
-                tagCount += tag["rank"]
-                if tagRatings_d[tagId]["score"] > originThreshold:
-                    recOrigins.setdefault(recMedia["id"], {}).setdefault(
+                tagTotal += tagRating * rank
+                tagCount += rank
+                if tagRating > originThreshold:
+                    recOrigins.setdefault(recMedia.id, {}).setdefault(
                         angleKeys[2], {}
                     )[tagId] = tag
         tagScore = tagTotal / tagCount if tagCount > 0 else userMean
@@ -347,16 +736,15 @@ def calculateBiases(
         studioTotal = 0
         studioCount = 0
         if use["studios"]:
-            studios = recMedia["studios"]["nodes"]
-            studioRatings_d = {x["studio"]["id"]: x for x in propertyRatings["studios"]}
-            for studio in studios:
-                studioId = studio["id"]
-                if studioId not in studioRatings_d:
+            for studio in recMedia.studios:
+                studioId = studio.id
+                studioRating = studioRatings.get(studioId)
+                if studioRating is None:
                     continue
-                studioTotal += studioRatings_d[studioId]["score"]
+                studioTotal += studioRating
                 studioCount += 1
-                if studioRatings_d[studioId]["score"] > originThreshold:
-                    recOrigins.setdefault(recMedia["id"], {}).setdefault(
+                if studioRating > originThreshold:
+                    recOrigins.setdefault(recMedia.id, {}).setdefault(
                         angleKeys[3], {}
                     )[studioId] = studio
         studioScore = studioTotal / studioCount if studioCount > 0 else userMean
@@ -364,16 +752,15 @@ def calculateBiases(
         staffTotal = 0
         staffCount = 0
         if use["staff"]:
-            staffs = recMedia["staff"]["nodes"]
-            staffRatings_d = {x["staff"]["id"]: x for x in propertyRatings["staff"]}
-            for staff in staffs:
-                staffId = staff["id"]
-                if staffId not in staffRatings_d:
+            for staff in recMedia.staff:
+                staffId = staff.id
+                staffRating = staffRatings.get(staffId)
+                if staffRating is None:
                     continue
-                staffTotal += staffRatings_d[staffId]["score"]
+                staffTotal += staffRating
                 staffCount += 1
-                if staffRatings_d[staffId]["score"] > originThreshold:
-                    recOrigins.setdefault(recMedia["id"], {}).setdefault(
+                if staffRating > originThreshold:
+                    recOrigins.setdefault(recMedia.id, {}).setdefault(
                         angleKeys[4], {}
                     )[staffId] = staff
         staffScore = staffTotal / staffCount if staffCount > 0 else userMean
@@ -389,6 +776,14 @@ def calculateBiases(
                 "recMedia": recMedia,
             }
         )
-    finalRecs.sort(key=lambda x: -x["recScore"])
+    finalRecs = rankRecs(finalRecs, limit=limit)
 
     return finalRecs, recOrigins
+
+
+def rankRecs(recs, limit=None):
+    # best first. with a limit only the best `limit` are kept, through a heap rather than
+    # a full sort; ties keep their order either way
+    if limit is None:
+        return sorted(recs, key=lambda x: -x["recScore"])
+    return heapq.nlargest(limit, recs, key=lambda x: x["recScore"])
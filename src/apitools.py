@@ -1,33 +1,247 @@
+import asyncio
+import importlib.util
+import random
 import time
+import httpx
 from gql import gql, Client
-from gql.transport.httpx import HTTPXTransport
-from gql.transport.exceptions import TransportQueryError
+from gql.transport.httpx import HTTPXAsyncTransport
+from gql.transport.exceptions import TransportError, TransportQueryError
+import constants
+from fetchstats import newFetchStats, printFetchStats, recordFetchStats
+import profiling
 import queries
-from cachefiles import saveUserDataFile
+from cachefiles import (
+    clearPartialChunks,
+    freshMediaIds,
+    loadPartialChunks,
+    saveMedia,
+    savePartialChunk,
+    saveUserList,
+)
+from ratelimit import TokenBucket
 
+userListSummaryDocument = gql(queries.userListSummaryQuery())
+mediaDetailsDocument = gql(queries.mediaDetailsQuery())
+mediaDetailsWithoutRecommendationsDocument = gql(
+    queries.mediaDetailsQuery(withRecommendations=False)
+)
 
-def fetchDataForChunk(client, mediaType: str, chunk: int, userName: str):
-    print(f"fetching for chunk #{chunk}")
-    query = gql(
-        queries.userListQuery()
-    )
+
+class FetchError(Exception):
+    # a request still failed after constants.MAX_RETRIES retries
+    pass
+
+
+# http/2 needs the h2 package (pip install httpx[http2]), and httpx only decodes
+# brotli and zstd responses when brotli and zstandard are installed
+HTTP2 = importlib.util.find_spec("h2") is not None
+ACCEPT_ENCODING = ", ".join(
+    ["gzip", "deflate"]
+    + (["br"] if importlib.util.find_spec("brotli") else [])
+    + (["zstd"] if importlib.util.find_spec("zstandard") else [])
+)
+
+
+async def measureResponse(response):
+    # reads the body in the response hook, while its size on the wire is still known.
+    # requests sent with a "wire" dict in their extensions get the sizes of both bodies
+    await response.aread()
+    wire = response.request.extensions.get("wire")
+    if wire is not None:
+        wire["sent"] = len(response.request.content)
+        wire["received"] = response.num_bytes_downloaded
+        wire["decoded"] = len(response.content)
+
+
+class AniListTransport(HTTPXAsyncTransport):
+    # keeps the status and headers of each response with its own result, so
+    # concurrent requests on one transport can't see each other's rate limit headers
+
+    def __init__(self, url, timeout=constants.HTTP_TIMEOUT_S, **kwargs):
+        super().__init__(
+            url=url,
+            timeout=timeout,
+            http2=HTTP2,
+            headers={"Accept-Encoding": ACCEPT_ENCODING},
+            limits=httpx.Limits(
+                max_keepalive_connections=constants.HTTP_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=constants.HTTP_KEEPALIVE_S,
+            ),
+            event_hooks={"response": [measureResponse]},
+            **kwargs,
+        )
+
+    def _prepare_result(self, response):
+        result = super()._prepare_result(response)
+        result.extensions = {
+            **(result.extensions or {}),
+            "httpStatus": response.status_code,
+            "httpHeaders": response.headers,
+        }
+        return result
+
+
+class AniListClient:
+    # one gql session over a pool of keep-alive connections, opened on first use and
+    # shared by every fetch until closed, so lists fetched together, one after another
+    # or by a long running server don't connect to AniList again each time
+
+    def __init__(self, url=constants.ANILIST_URL, timeout=constants.HTTP_TIMEOUT_S):
+        self.client = Client(
+            transport=AniListTransport(url=url, timeout=timeout),
+            fetch_schema_from_transport=False,
+        )
+        self.session = None
+        self.connecting = asyncio.Lock()
+
+    async def connect(self):
+        async with self.connecting:
+            if self.session is None:
+                self.session = await self.client.connect_async()
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            self.session = None
+            await self.client.close_async()
+
+
+def retryDelayFromHeaders(headers, default):
+    # how long the server wants us to wait, from Retry-After or X-RateLimit-Reset
+    if not headers:
+        return default
+    if headers.get("Retry-After"):
+        try:
+            return max(0.0, float(headers["Retry-After"]))
+        except ValueError:
+            pass
+    secondsToReset = secondsUntilReset(headers)
+    return default if secondsToReset is None else secondsToReset
+
+
+def secondsUntilReset(headers):
+    # from X-RateLimit-Reset, or None when the server didn't send one
+    try:
+        return max(0.0, float(headers["X-RateLimit-Reset"]) - time.time())
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def backoffDelay(attempt):
+    # exponential backoff with full jitter
+    return random.uniform(0, min(constants.BACKOFF_MAX_S, constants.BACKOFF_BASE_S * 2**attempt))
+
+
+def respectRateLimitHeaders(limiter, headers, token):
+    # follow the server's budget if it's lower than ours, and spread what's left of it
+    # over the time until it resets, so requests slow down before the quota runs out
+    # and speed up again as it recovers. holds off once it's spent. token is the limiter
+    # token the response's request went out with: requests sent after it aren't in its
+    # Remaining yet, but are already spent. returns the seconds the limiter was paused for
+    if not headers:
+        return 0.0
+    try:
+        limit = int(headers.get("X-RateLimit-Limit", 0))
+        remaining = headers.get("X-RateLimit-Remaining")
+        remaining = None if remaining is None else int(remaining)
+    except ValueError:
+        return 0.0
+    if 0 < limit < limiter.requestsPerMinute:
+        limiter.requestsPerMinute = limit
+    if remaining is not None:
+        remaining -= limiter.issuedSince(token)
+    if remaining is not None and remaining <= 0:
+        return limiter.pause(retryDelayFromHeaders(headers, default=60 / (limit or 60)))
+    requestsPerMinute = limiter.requestsPerMinute
+    if remaining is not None:
+        secondsToReset = secondsUntilReset(headers)
+        if secondsToReset is None:
+            # without a reset time the window rolls: within one window the quota gets
+            # back what's left plus our own requests still counted in it, which keeps a
+            # client alone on its quota at the full limit
+            remaining += limiter.recentRequests()
+            secondsToReset = constants.RATE_LIMIT_WINDOW_S
+        if secondsToReset > 0:
+            requestsPerMinute = min(requestsPerMinute, remaining / secondsToReset * 60)
+    limiter.setRate(requestsPerMinute)
+    return 0.0
+
+
+async def executeWithRetries(session, limiter, document, variables, stats):
+    # the result's data, or None once every retry failed
     result = None
-    MAX_RETRIES = 3
     retries = 0
-    while result == None and retries <= MAX_RETRIES:
+    while result == None and retries <= constants.MAX_RETRIES:
+        waitStart = time.monotonic()
+        token = await limiter.acquire()
+        requestStart = time.monotonic()
+        stats["queued"] += requestStart - waitStart
+        stats["requests"] += 1
+        wire = {}
         try:
-            result = client.execute(query, variable_values = {"name": userName, "type": mediaType, "chunk": chunk})
+            try:
+                executionResult = await session.execute(
+                    document,
+                    variable_values=variables,
+                    get_execution_result=True,
+                    extra_args={"extensions": {"wire": wire}},
+                )
+            finally:
+                stats["latencies"].append(time.monotonic() - requestStart)
+                stats["bytesSent"] += wire.get("sent", 0)
+                stats["bytesReceived"] += wire.get("received", 0)
+                stats["bytesDecoded"] += wire.get("decoded", 0)
+            result = executionResult.data
+            stats["slept"] += respectRateLimitHeaders(
+                limiter, (executionResult.extensions or {}).get("httpHeaders"), token
+            )
         except TransportQueryError as e:
-            errorCode = e.errors[0]["status"]
+            extensions = e.extensions or {}
+            headers = extensions.get("httpHeaders")
+            errorCode = e.errors[0].get("status") or extensions.get("httpStatus")
             retries += 1
             if errorCode == 429:
+                stats["rateLimited"] += 1
+                delay = retryDelayFromHeaders(headers, default=65)
                 print(
-                    f"got http {errorCode}, server is rate limiting us. waiting to continue fetching data"
+                    f"got http {errorCode}, server is rate limiting us. waiting {delay:.0f} seconds to continue fetching data"
                 )
-                countdownTimer_s(65)
+                stats["slept"] += limiter.pause(delay)
             else:
-                print(f"unhandled http error {errorCode}. trying again in 10 seconds")
-                countdownTimer_s(10)
+                delay = backoffDelay(retries)
+                print(f"unhandled http error {errorCode}. trying again in {delay:.1f} seconds")
+                await asyncio.sleep(delay)
+                stats["slept"] += delay
+        except TransportError as e:
+            retries += 1
+            delay = backoffDelay(retries)
+            reason = f"http {e.code}" if getattr(e, "code", None) else type(e).__name__
+            print(f"request failed with {reason}. trying again in {delay:.1f} seconds")
+            await asyncio.sleep(delay)
+            stats["slept"] += delay
+    stats["retries"] += retries
+    return result
+
+
+async def fetchDataForChunk(
+    session,
+    limiter,
+    mediaType: str,
+    chunk: int,
+    userName: str,
+    stats,
+):
+    print(f"fetching {mediaType} chunk #{chunk}")
+    profiling.count("chunks fetched")
+    result = await executeWithRetries(
+        session=session,
+        limiter=limiter,
+        document=userListSummaryDocument,
+        variables={"name": userName, "type": mediaType, "chunk": chunk},
+        stats=stats,
+    )
+    if result is None:
+        raise FetchError(f"could not fetch {mediaType} chunk #{chunk} of {userName}'s list")
     lists = result["MediaListCollection"]["lists"]
     entries = [
         listEntries
@@ -38,35 +252,237 @@ def fetchDataForChunk(client, mediaType: str, chunk: int, userName: str):
     return entries, result["MediaListCollection"]["hasNextChunk"]
 
 
-def countdownTimer_s(seconds: int):
-    while seconds > 0:
-        print(seconds)
-        time.sleep(1)
-        seconds -= 1
+async def fetchDataForType(
+    session,
+    limiter,
+    mediaType: str,
+    userName: str,
+    stats,
+    prefetch=constants.PREFETCH_CHUNKS,
+):
+    # keep up to `prefetch` chunk requests in flight. we only learn where the list
+    # ends from hasNextChunk, so requests past the end are cancelled or discarded. every
+    # chunk is kept in the store as soon as it arrives, and chunks kept by an earlier
+    # fetch that failed aren't requested again
+    print(f"fetching data for type {mediaType}")
+    saved = loadPartialChunks(userName=userName, mediaType=mediaType)
+    if saved:
+        print(f"resuming {mediaType} from {len(saved)} chunks fetched before")
+        profiling.count("chunks resumed", len(saved))
+    chunkEntries = {chunk: entries for chunk, (entries, _) in saved.items()}
+    lastChunk = min(
+        (chunk for chunk, (_, hasNextChunk) in saved.items() if not hasNextChunk),
+        default=None,
+    )
+    nextChunk = 1
+    pending = {}
+    try:
+        while True:
+            while len(pending) < prefetch:
+                while nextChunk in chunkEntries:
+                    nextChunk += 1
+                if lastChunk is not None and nextChunk > lastChunk:
+                    break
+                task = asyncio.create_task(
+                    fetchDataForChunk(
+                        session=session,
+                        limiter=limiter,
+                        mediaType=mediaType,
+                        chunk=nextChunk,
+                        userName=userName,
+                        stats=stats,
+                    )
+                )
+                pending[task] = nextChunk
+                nextChunk += 1
+            if not pending:
+                break
+            done, _ = await asyncio.wait(
+                pending.keys(), return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                chunk = pending.pop(task)
+                newEntries, hasNextChunk = task.result()
+                chunkEntries[chunk] = newEntries
+                savePartialChunk(
+                    userName=userName,
+                    mediaType=mediaType,
+                    chunk=chunk,
+                    entries=newEntries,
+                    hasNextChunk=hasNextChunk,
+                )
+                if not hasNextChunk and (lastChunk is None or chunk < lastChunk):
+                    lastChunk = chunk
+            if lastChunk is not None:
+                for task, chunk in list(pending.items()):
+                    if chunk > lastChunk:
+                        task.cancel()
+                        del pending[task]
+    finally:
+        # after a failure, so the other requests don't outlive the fetch
+        for task in pending:
+            task.cancel()
 
+    return [entry for chunk in range(1, lastChunk + 1) for entry in chunkEntries[chunk]]
 
-def fetchDataForType(client, mediaType: str, userName: str):
-    print(f"fetching data for type {mediaType}")
-    chunkNum = 0
-    hasNextChunk = True
-    entries = []
-    while hasNextChunk:
-        chunkNum += 1
-        newEntries, hasNextChunk = fetchDataForChunk(
-            client=client, mediaType=mediaType, chunk=chunkNum, userName=userName
+
+async def fetchMediaPage(session, limiter, mediaIds, stats, withRecommendations=True):
+    # details for up to 50 titles, stored as soon as they arrive so a fetch that fails
+    # later doesn't request them again
+    result = await executeWithRetries(
+        session=session,
+        limiter=limiter,
+        document=(
+            mediaDetailsDocument
+            if withRecommendations
+            else mediaDetailsWithoutRecommendationsDocument
+        ),
+        variables={"ids": mediaIds},
+        stats=stats,
+    )
+    if result is None:
+        raise FetchError(f"could not fetch the details of {len(mediaIds)} titles")
+    saveMedia(result["Page"]["media"])
+    return result["Page"]["media"]
+
+
+def forgetFailedPage(task, inFlight):
+    # so lists fetched later request the titles again rather than share the failure
+    if task.cancelled() or task.exception() is not None:
+        for key in [key for key, other in inFlight.items() if other is task]:
+            del inFlight[key]
+
+
+async def fetchMediaById(
+    session, limiter, mediaIds, stats, inFlight=None, withRecommendations=True
+):
+    # inFlight maps (media id, whether with recommendations) to the page requests already
+    # fetching them, so lists fetched side by side don't request the titles they share
+    # twice. a title being fetched with its recommendations also does for a list that
+    # doesn't need them. every page is stored in the media cache as it arrives
+    inFlight = {} if inFlight is None else inFlight
+    kinds = [True] if withRecommendations else [True, False]
+
+    def pendingPage(mediaId):
+        return next(
+            (inFlight[(mediaId, kind)] for kind in kinds if (mediaId, kind) in inFlight),
+            None,
         )
-        entries += newEntries
 
-    return entries
+    newIds = [
+        mediaId for mediaId in dict.fromkeys(mediaIds) if pendingPage(mediaId) is None
+    ]
+    pageSize = 50
+    for i in range(0, len(newIds), pageSize):
+        page = newIds[i : i + pageSize]
+        task = asyncio.ensure_future(
+            fetchMediaPage(
+                session=session,
+                limiter=limiter,
+                mediaIds=page,
+                stats=stats,
+                withRecommendations=withRecommendations,
+            )
+        )
+        for mediaId in page:
+            inFlight[(mediaId, withRecommendations)] = task
+        task.add_done_callback(lambda task: forgetFailedPage(task, inFlight))
+    results = await asyncio.gather(
+        *dict.fromkeys(pendingPage(mediaId) for mediaId in mediaIds)
+    )
+    wanted = set(mediaIds)
+    return [media for page in results for media in page if media["id"] in wanted]
 
 
-def fetchDataForUser(userName: str):
+async def fetchEntriesForUser(
+    userName: str,
+    limiter=None,
+    stats=None,
+    url=constants.ANILIST_URL,
+    mediaTtl=constants.MEDIA_TTL_S,
+    inFlight=None,
+    client=None,
+    withRecommendations=True,
+):
+    # the list itself only carries (media id, status, score, updatedAt). media details
+    # and recommendation edges go to the media cache, and only titles missing from it or
+    # older than mediaTtl (None never expires) are fetched, 50 per request. inFlight is
+    # shared by lists fetched together, see fetchMediaById. returns the slim entries; the
+    # full ones are read back from the cache. chunks of the list are kept until all of
+    # them are in, and the list only replaces the cached one once the caller saves it
+    # with saveUserList.
+    # lists fetched together or one after another share connections by passing the same
+    # AniListClient, which the caller closes; without one a client for url is opened.
+    # withRecommendations=False fetches titles without their recommendations, for lists
+    # scored from the similar titles index alone, and doesn't need them cached
+    limiter = limiter or TokenBucket(constants.REQUESTS_PER_MINUTE)
+    stats = newFetchStats() if stats is None else stats
+    ownClient = client is None
+    client = AniListClient(url=url) if ownClient else client
+    try:
+        session = await client.connect()
+        typeTasks = [
+            asyncio.ensure_future(
+                fetchDataForType(
+                    session=session,
+                    limiter=limiter,
+                    mediaType=mediaType,
+                    userName=userName,
+                    stats=stats,
+                )
+            )
+            for mediaType in ["ANIME", "MANGA"]
+        ]
+        try:
+            anime, manga = await asyncio.gather(*typeTasks)
+        finally:
+            for task in typeTasks:
+                task.cancel()
+        # the chunks are only kept to resume the list itself. media details fetched
+        # before a failure below are in the media cache already, and a fetch after this
+        # one, e.g. with -r, must see changes made to the list since
+        clearPartialChunks(userName=userName)
+        summary = anime + manga
+        mediaIds = [entry["media"]["id"] for entry in summary]
+        cachedIds = freshMediaIds(
+            mediaIds, maxAge=mediaTtl, withRecommendations=withRecommendations
+        )
+        missingIds = [mediaId for mediaId in mediaIds if mediaId not in cachedIds]
+        print(
+            f"{len(summary)} titles for {userName}, {len(missingIds)} of them need fetching"
+        )
+        stats["cacheHits"] += len(mediaIds) - len(missingIds)
+        stats["cacheMisses"] += len(missingIds)
+        await fetchMediaById(
+            session=session,
+            limiter=limiter,
+            mediaIds=missingIds,
+            stats=stats,
+            inFlight=inFlight,
+            withRecommendations=withRecommendations,
+        )
+
+        # titles AniList didn't return any details for can't be scored
+        cachedIds = freshMediaIds(
+            mediaIds, maxAge=None, withRecommendations=withRecommendations
+        )
+    finally:
+        if ownClient:
+            await client.close()
+
+    return [entry for entry in summary if entry["media"]["id"] in cachedIds]
+
+
+def fetchDataForUser(userName: str, mediaTtl=constants.MEDIA_TTL_S):
     print(f"fetching data for user {userName}")
-    transport = HTTPXTransport(url="https://graphql.anilist.co", timeout=120)
-    client = Client(transport=transport, fetch_schema_from_transport=False)
-    entries = fetchDataForType(client=client, mediaType="ANIME", userName=userName)
-    entries += fetchDataForType(client=client, mediaType="MANGA", userName=userName)
+    stats = newFetchStats()
+    with profiling.stage("fetch", user=userName):
+        entries = asyncio.run(
+            fetchEntriesForUser(userName=userName, stats=stats, mediaTtl=mediaTtl)
+        )
+    printFetchStats(stats)
+    recordFetchStats(stats)
 
-    saveUserDataFile(userName, entries)
+    saveUserList(userName, entries)
 
     return entries
@@ -0,0 +1,242 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shlex
+import time
+
+from algorithm import needsRecommendations
+from cachefiles import userListIsFresh
+import constants
+from fetchstats import newFetchStats, printFetchStats, recordFetchStats
+import nextani
+from pipeline import newScoringPool
+from ratelimit import TokenBucket
+
+CHECKPOINT_FILE = "checkpoint.jsonl"
+
+
+class ManifestError(Exception):
+    pass
+
+
+def readManifest(path):
+    # [(line number, job key, nextani.py arguments)] for every job in the manifest. a job
+    # is one line written like nextani.py's arguments; its key is the line with the
+    # arguments normalized, so the checkpoint still matches after reformatting a line.
+    # blank lines and lines starting with # are skipped. two lines with the same key
+    # would write the same files, so they're rejected
+    jobs = []
+    seen = {}
+    with open(path, encoding="utf-8") as f:
+        for lineNumber, line in enumerate(f, start=1):
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            try:
+                argv = shlex.split(line)
+                args = nextani.parser.parse_args(argv)
+                nextani.validateArgs(args, error=raiseManifestError)
+            except (ManifestError, ValueError) as e:
+                raise ManifestError(f"line {lineNumber}: {e}")
+            except SystemExit:
+                # argparse printed what's wrong already
+                raise ManifestError(f"line {lineNumber}: invalid arguments")
+            if args.jobs is not None or args.profile:
+                raise ManifestError(
+                    f"line {lineNumber}: --jobs and --profile apply to the whole batch"
+                )
+            key = shlex.join(argv)
+            if key in seen:
+                raise ManifestError(f"line {lineNumber}: same job as line {seen[key]}")
+            seen[key] = lineNumber
+            jobs.append((lineNumber, key, args))
+    return jobs
+
+
+def jobDirectory(key):
+    # where a job's files are written under the output directory, e.g.
+    # alice_-t_-g_-l_50-3f2a9c1e. jobs write files named after their users, so each
+    # one gets its own directory; the hash tells apart keys that read the same here
+    readable = re.sub(r"[^\w.-]+", "_", key).strip("_.")[:60]
+    return f"{readable}-{hashlib.sha1(key.encode()).hexdigest()[:8]}"
+
+
+def raiseManifestError(message):
+    raise ManifestError(message)
+
+
+def loadCheckpoint(path):
+    # keys of the jobs an earlier run finished. a line cut short by an interruption is
+    # ignored, so that job runs again
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["job"])
+            except (ValueError, KeyError):
+                continue
+    return done
+
+
+def needsFetch(args):
+    withRecommendations = needsRecommendations(args.candidates, args.expand)
+    return args.refresh or not all(
+        userListIsFresh(userName=userName, withRecommendations=withRecommendations)
+        for userName in args.userNames
+    )
+
+
+def recordCheckpoint(f, key, userNames, output, seconds):
+    record = {
+        "job": key,
+        "users": userNames,
+        "output": output,
+        "seconds": round(seconds, 3),
+        "at": time.time(),
+    }
+    f.write(json.dumps(record) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+
+async def runBatch(jobs, directory, workers, concurrency, checkpointFile):
+    # every job shares one limiter, so the whole batch stays within AniList's budget, one
+    # scoring pool, the titles and lists being fetched and the connections to AniList, so
+    # jobs for the same user fetch their list once. up to `concurrency` jobs run at once,
+    # each writing into its own jobDirectory.
+    # returns how many jobs failed; they aren't checkpointed and run again next time
+    limiter = TokenBucket(constants.REQUESTS_PER_MINUTE)
+    stats = newFetchStats()
+    inFlight = {}
+    listFetches = {}
+    pool = newScoringPool(workers)
+    client = None
+    if any(needsFetch(args) for _, _, args in jobs):
+        # the network stack is only imported once there's something to fetch
+        from apitools import AniListClient
+
+        client = AniListClient()
+    slots = asyncio.Semaphore(concurrency)
+    finished = 0
+    failed = 0
+
+    async def runJob(lineNumber, key, args):
+        nonlocal finished, failed
+        async with slots:
+            start = time.perf_counter()
+            # every job scores in the shared pool, or in this process with one worker
+            args.jobs = workers
+            output = os.path.join(directory, jobDirectory(key))
+            try:
+                os.makedirs(output, exist_ok=True)
+                await nextani.recommendAsync(
+                    args,
+                    directory=output,
+                    limiter=limiter,
+                    stats=stats,
+                    inFlight=inFlight,
+                    pool=pool,
+                    client=client,
+                    listFetches=listFetches,
+                )
+            except Exception as e:
+                failed += 1
+                print(f"job on line {lineNumber} ({key}) failed: {e!r}")
+                return
+            recordCheckpoint(
+                checkpointFile, key, args.userNames, output, time.perf_counter() - start
+            )
+            finished += 1
+            print(f"[{finished}/{len(jobs)}] done: {key} -> {output}")
+
+    try:
+        await asyncio.gather(*[runJob(*job) for job in jobs])
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+        if client is not None:
+            await client.close()
+        if stats["requests"]:
+            printFetchStats(stats)
+        recordFetchStats(stats)
+    return failed
+
+
+parser = argparse.ArgumentParser(
+    prog="nextani.py batch",
+    description="Write recs for every job in a manifest, fetching under one shared rate limit and scoring in one pool of processes. Each line of the manifest is one job written like nextani.py's arguments, e.g. 'alice -t -g -l 50' or 'alice bob --group-strategy least-misery'. Finished jobs are checkpointed, so an interrupted batch picks up where it stopped when run again",
+)
+parser.add_argument("manifest", help="File with one job per line; # starts a comment")
+parser.add_argument(
+    "-d",
+    "--output-dir",
+    help="Directory the checkpoint and a directory of recs files per job are written to",
+    default="batch-output",
+)
+parser.add_argument(
+    "-j",
+    "--jobs",
+    help="Number of processes used to score users. Defaults to the number of cpus",
+    type=int,
+)
+parser.add_argument(
+    "-c",
+    "--concurrency",
+    help="Jobs fetched and scored at the same time",
+    type=int,
+    default=constants.BATCH_CONCURRENCY,
+)
+parser.add_argument(
+    "--restart",
+    help="Ignore the checkpoint and run every job again",
+    action="store_true",
+)
+
+
+def main(argv=None):
+    # returns the exit status: 1 when a job failed
+    args = parser.parse_args(argv)
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    try:
+        jobs = readManifest(args.manifest)
+    except OSError as e:
+        parser.error(f"could not read the manifest: {e}")
+    except ManifestError as e:
+        parser.error(f"invalid manifest, {e}")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    checkpointPath = os.path.join(args.output_dir, CHECKPOINT_FILE)
+    if args.restart and os.path.exists(checkpointPath):
+        os.remove(checkpointPath)
+    done = loadCheckpoint(checkpointPath)
+    pending = [job for job in jobs if job[1] not in done]
+    if len(pending) < len(jobs):
+        print(f"skipping {len(jobs) - len(pending)} jobs finished by an earlier run")
+
+    start = time.perf_counter()
+    with open(checkpointPath, "a", encoding="utf-8") as checkpointFile:
+        try:
+            failed = asyncio.run(
+                runBatch(
+                    pending,
+                    directory=args.output_dir,
+                    workers=args.jobs or os.cpu_count() or 1,
+                    concurrency=args.concurrency,
+                    checkpointFile=checkpointFile,
+                )
+            )
+        except KeyboardInterrupt:
+            print(f"interrupted, run the same command again to resume from {checkpointPath}")
+            return 130
+    print(
+        f"{len(pending) - failed} of {len(pending)} jobs done in"
+        f" {time.perf_counter() - start:.1f}s, {failed} failed"
+    )
+    return 1 if failed else 0
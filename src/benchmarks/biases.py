@@ -0,0 +1,78 @@
+import copy
+import sys
+
+from algorithm import (
+    calculateBiases,
+    calculateInitial,
+    calculateMeanScore,
+    compileUserProfile,
+)
+from benchmarks.common import timed
+from benchmarks.synthetic import generateUserList
+from records import entriesFromPayload
+import vectorscoring
+
+USE_KEYS = ["tags", "studios", "staff", "genres", "decades"]
+LIMIT = 100
+
+
+def main(size=5000):
+    userList = entriesFromPayload(generateUserList(size=size))
+    meanScore = calculateMeanScore(userList)
+    propertyRatings, recs, origins = calculateInitial(
+        userList=userList, meanScore=meanScore
+    )
+    userProfile = compileUserProfile(propertyRatings=propertyRatings, userMean=meanScore)
+    print(f"synthetic list: {size} entries, {len(recs)} candidate recs")
+
+    for flags in [(True,) * 5, (False, False, False, False, True), (True, False, True, False, False)]:
+        use = dict(zip(USE_KEYS, flags))
+        print(f"use: {', '.join(k for k in USE_KEYS if use[k])}")
+        (pythonRecs, pythonOrigins), pythonTime = timed(
+            calculateBiases,
+            propertyRatings=propertyRatings,
+            recs=recs,
+            use=use,
+            recOrigins=copy.deepcopy(origins),
+            userMean=meanScore,
+            userProfile=userProfile,
+        )
+        print(f"\tpython backend: {pythonTime:.3f}s")
+        (topRecs, _), topTime = timed(
+            calculateBiases,
+            propertyRatings=propertyRatings,
+            recs=recs,
+            use=use,
+            recOrigins=copy.deepcopy(origins),
+            userMean=meanScore,
+            userProfile=userProfile,
+            limit=LIMIT,
+        )
+        assert topRecs == pythonRecs[:LIMIT]
+        print(f"\tpython backend, top {LIMIT}: {topTime:.3f}s")
+        if not vectorscoring.AVAILABLE:
+            print("\tnumpy backend: skipped, numpy/scipy not installed")
+            continue
+        encoded, encodeTime = timed(vectorscoring.encodeRecs, recs)
+        (numpyRecs, numpyOrigins), numpyTime = timed(
+            vectorscoring.calculateBiasesVectorized,
+            recs=recs,
+            use=use,
+            recOrigins=copy.deepcopy(origins),
+            userProfile=userProfile,
+            encoded=encoded,
+        )
+        numpyTop, _ = vectorscoring.calculateBiasesVectorized(
+            recs=recs,
+            use=use,
+            recOrigins=copy.deepcopy(origins),
+            userProfile=userProfile,
+            encoded=encoded,
+            limit=LIMIT,
+        )
+        assert numpyTop == numpyRecs[:LIMIT]
+        print(f"\tnumpy backend:  {encodeTime:.3f}s encode + {numpyTime:.3f}s score")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
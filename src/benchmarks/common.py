@@ -0,0 +1,26 @@
+import gc
+import os
+import tempfile
+import time
+
+import constants
+import mediastore
+
+
+def timed(func, *args, **kwargs):
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        return result, time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+def useTemporaryStore():
+    # point the media store at a throwaway file so benchmarks never touch the real cache
+    directory = tempfile.mkdtemp(prefix="pyani-bench-")
+    mediastore.closeStore()
+    constants.STORE_FILE = os.path.join(directory, "pyani-cache.sqlite3")
+    return directory
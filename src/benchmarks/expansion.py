@@ -0,0 +1,59 @@
+import random
+import sys
+
+from benchmarks.common import timed
+import constants
+from expansion import RecommendationGraph, expandCandidates
+
+
+def generateGraph(nodeCount, degree, seed=0):
+    # media id -> [(rating, rec id)], ratings skewed towards a few strong edges like on
+    # AniList
+    rng = random.Random(seed)
+    return {
+        mediaId: [
+            (int(rng.paretovariate(1.2)), rng.randint(1, nodeCount)) for _ in range(degree)
+        ]
+        for mediaId in range(1, nodeCount + 1)
+    }
+
+
+def main(nodeCount=100000, listSize=300, seedCount=2000):
+    nodeCount, listSize, seedCount = int(nodeCount), int(listSize), int(seedCount)
+    rng = random.Random(1)
+    listed = set(rng.sample(range(1, nodeCount + 1), listSize))
+    seeds = {
+        mediaId: rng.uniform(0.1, 100)
+        for mediaId in rng.sample(range(1, nodeCount + 1), seedCount)
+        if mediaId not in listed
+    }
+    print(f"{nodeCount} titles, {len(seeds)} direct candidates")
+    for degree in [10, 50, 200]:
+        edges = generateGraph(nodeCount, degree)
+        for depth, budget in [
+            (2, constants.EXPANSION_NODE_BUDGET),
+            (3, constants.EXPANSION_NODE_BUDGET),
+            (3, nodeCount),
+        ]:
+            loads = []
+
+            def loadEdges(mediaIds):
+                loads.append(len(mediaIds))
+                return {mediaId: edges[mediaId] for mediaId in mediaIds}
+
+            found, seconds = timed(
+                expandCandidates,
+                seeds=seeds,
+                exclude=listed,
+                graph=RecommendationGraph(loadEdges=loadEdges),
+                depth=depth,
+                budget=budget,
+            )
+            print(
+                f"\t{degree} edges per title, depth {depth}, budget {budget}: {seconds:.3f}s,"
+                f" {len(found)} new titles, {sum(loads)} titles looked up in {len(loads)} batches"
+            )
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
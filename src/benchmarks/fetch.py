@@ -0,0 +1,67 @@
+import asyncio
+import sys
+import time
+
+from apitools import fetchEntriesForUser, newFetchStats, printFetchStats
+from benchmarks.common import useTemporaryStore
+from benchmarks.mockserver import MockAniList
+from ratelimit import TokenBucket
+
+
+def run(server, requestsPerMinute, spentElsewhere=0):
+    # every run starts from an empty media cache so it fetches the whole list.
+    # spentElsewhere requests of the server's budget were just made by another client
+    useTemporaryStore()
+    server.requestTimes.clear()
+    server.stats.clear()
+    for _ in range(spentElsewhere):
+        server.admit(counted=False)
+    stats = newFetchStats()
+
+    async def fetch():
+        return await fetchEntriesForUser(
+            "benchuser",
+            limiter=TokenBucket(requestsPerMinute),
+            stats=stats,
+            url=server.url,
+        )
+
+    start = time.perf_counter()
+    entries = asyncio.run(fetch())
+    elapsed = time.perf_counter() - start
+    requests = sum(server.stats.values())
+    print(
+        f"\t{len(entries)} entries, {requests} requests in {elapsed:.1f}s"
+        f" ({requests / elapsed * 60:.0f}/min against a {server.requestsPerMinute}/min limit),"
+        f" {server.stats['429']} http 429s, {server.stats['5xx']} http 5xx"
+    )
+    print("\t", end="")
+    printFetchStats(stats)
+    return server.stats["429"]
+
+
+def main(requestsPerMinute=120, latency=1.0, listSize=3000):
+    requestsPerMinute = int(requestsPerMinute)
+    server = MockAniList(
+        requestsPerMinute=requestsPerMinute, latency=latency, listSize=int(listSize)
+    ).start()
+    try:
+        print(f"limiter at the server's budget ({requestsPerMinute}/min, {latency}s latency)")
+        throttled = run(server, requestsPerMinute)
+        assert throttled == 0, "the limiter let requests through over budget"
+
+        print("limiter at twice the server's budget, relying on rate limit headers")
+        run(server, requestsPerMinute * 2)
+
+        print("another client just spent half the server's budget")
+        throttled = run(server, requestsPerMinute, spentElsewhere=requestsPerMinute // 2)
+        assert throttled == 0, "the limiter didn't slow down before the budget ran out"
+
+        print("10% of requests failing with http 502")
+        server.errorRate = 0.1
+        run(server, requestsPerMinute)
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    main(*[float(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,109 @@
+import copy
+import random
+import sys
+
+from benchmarks.common import timed
+from group import STRATEGIES, generateGroupList, loadNumpy
+from records import Entry, Media
+
+STATUSES = ["COMPLETED", "CURRENT", "PLANNING", "DROPPED", "PAUSED", "REPEATING"]
+
+
+def generateGroup(userCount=50, candidateCount=100000, recsPerUser=20000, listSize=2000, seed=0):
+    rng = random.Random(seed)
+    media = [Media(mediaId) for mediaId in range(candidateCount)]
+    userData = []
+    for i in range(userCount):
+        recs = [
+            {"recScore": rng.uniform(0, 100), "recMedia": media[mediaId]}
+            for mediaId in rng.sample(range(candidateCount), recsPerUser)
+        ]
+        userList = [
+            Entry(
+                mediaId=mediaId,
+                score=rng.choice([0, rng.randint(1, 100)]),
+                status=rng.choice(STATUSES),
+            )
+            for mediaId in rng.sample(range(candidateCount), listSize)
+        ]
+        userIndex = {entry.mediaId: entry for entry in userList}
+        userData.append(
+            {"userName": f"user{i}", "list": recs, "userList": userList, "userIndex": userIndex}
+        )
+    return userData
+
+
+def legacyJointList(userData, rewatch=False):
+    # generateJointList and the joint filter from nextani.py as they were before group.py,
+    # reading the records the same way
+    userDicts = [{rec["recMedia"].id: rec for rec in d["list"]} for d in userData]
+    userScores = [
+        {entry.mediaId: entry.score for entry in d["userList"]}
+        for d in userData
+    ]
+    dictsUnion = {}
+    for d in userDicts:
+        dictsUnion = dictsUnion | d
+
+    jointList = [value for (key, value) in dictsUnion.items()]
+    for rec in jointList:
+        score = 0
+        for i, d in enumerate(userDicts):
+            mediaId = rec["recMedia"].id
+            userRating = userScores[i].get(mediaId) or 0
+            if userRating > 0:
+                score += userRating
+            else:
+                score += d.get(mediaId, {"recScore": 0})["recScore"]
+        rec["recScore"] = score / len(userDicts)
+
+    return [
+        r
+        for r in sorted(jointList, key=lambda x: -x["recScore"])
+        if rewatch
+        or not all(
+            getattr(u.get(r["recMedia"].id), "status", "")
+            in {"COMPLETED", "REPEATING", "DROPPED"}
+            for u in [d["userIndex"] for d in userData]
+        )
+    ]
+
+
+def main(userCount=50, candidateCount=100000, target=1.0):
+    userCount, candidateCount = int(userCount), int(candidateCount)
+    userData = generateGroup(userCount=userCount, candidateCount=candidateCount)
+    # the built-in strategies fold every member's scores at once with numpy, imported
+    # here so it isn't timed
+    vectorized = loadNumpy() is not None
+    print(
+        f"{userCount} users, {candidateCount} candidates,"
+        f" numpy {'on' if vectorized else 'off'}"
+    )
+
+    legacy, legacyTime = timed(legacyJointList, copy.deepcopy(userData))
+    print(f"\tgenerateJointList + filter: {legacyTime:.3f}s")
+    # the best of two runs, the first one also paying for allocating its arrays
+    times = {}
+    for name in STRATEGIES:
+        (groupList, first), (_, second) = [
+            timed(generateGroupList, userData, strategy=name) for _ in range(2)
+        ]
+        times[name] = min(first, second)
+        print(f"\t{name}: {times[name]:.3f}s (first run {first:.3f}s), {len(groupList)} titles")
+        if name == "mean":
+            assert [r["recMedia"].id for r in groupList] == [
+                r["recMedia"].id for r in legacy
+            ]
+            assert [r["recScore"] for r in groupList] == [r["recScore"] for r in legacy]
+            topList, times["mean, top 100"] = timed(
+                generateGroupList, userData, strategy=name, limit=100
+            )
+            assert topList == groupList[:100]
+            print(f"\t{name}, top 100: {times['mean, top 100']:.3f}s")
+    if vectorized and userCount * candidateCount <= 50 * 100000:
+        slow = {name: t for name, t in times.items() if t >= target}
+        assert not slow, f"slower than {target}s: {slow}"
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
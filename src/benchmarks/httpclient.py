@@ -0,0 +1,81 @@
+import asyncio
+import sys
+import time
+
+from apitools import (
+    ACCEPT_ENCODING,
+    HTTP2,
+    AniListClient,
+    fetchEntriesForUser,
+    newFetchStats,
+    printFetchStats,
+)
+from benchmarks.common import useTemporaryStore
+from benchmarks.mockserver import MockAniList
+from ratelimit import TokenBucket
+
+
+def run(server, userNames, shared):
+    # lists fetched one after another into an empty media cache, each with a client of
+    # its own or all over one shared client
+    useTemporaryStore()
+    server.requestTimes.clear()
+    server.stats.clear()
+    server.wire.clear()
+    stats = newFetchStats()
+
+    async def fetch():
+        limiter = TokenBucket(server.requestsPerMinute)
+        client = AniListClient(url=server.url) if shared else None
+        try:
+            for userName in userNames:
+                await fetchEntriesForUser(
+                    userName, limiter=limiter, stats=stats, url=server.url, client=client
+                )
+        finally:
+            if client is not None:
+                await client.close()
+
+    start = time.perf_counter()
+    asyncio.run(fetch())
+    elapsed = time.perf_counter() - start
+    requests = stats["requests"]
+    print(
+        f"\t{requests} requests over {server.wire['connections']} connections in"
+        f" {elapsed:.2f}s, {elapsed / requests * 1000:.1f}ms per request,"
+        f" {stats['bytesReceived'] / requests / 1024:.1f}KB received per request"
+    )
+    print("\t", end="")
+    printFetchStats(stats)
+    return server.wire["connections"], stats["bytesReceived"], stats["bytesDecoded"]
+
+
+def main(users=4, listSize=1000, latency=0.0):
+    userNames = [f"benchuser{i}" for i in range(int(users))]
+    server = MockAniList(
+        requestsPerMinute=60000, latency=latency, listSize=int(listSize)
+    ).start()
+    print(f"accepting {ACCEPT_ENCODING}, http/2 {'on' if HTTP2 else 'off (h2 not installed)'}")
+    try:
+        print(f"{len(userNames)} lists, a client per list, uncompressed responses")
+        server.compress = False
+        plainConnections, plainBytes, _ = run(server, userNames, shared=False)
+
+        print(f"{len(userNames)} lists, a client per list, gzip")
+        server.compress = True
+        run(server, userNames, shared=False)
+
+        print(f"{len(userNames)} lists, one shared client, gzip")
+        connections, received, decoded = run(server, userNames, shared=True)
+        assert connections < plainConnections, "the shared client didn't reuse connections"
+        assert received < decoded, "responses weren't compressed"
+        print(
+            f"\t{plainConnections / connections:.1f}x fewer connections,"
+            f" {plainBytes / received:.1f}x fewer bytes received"
+        )
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main(*[float(arg) for arg in sys.argv[1:]])
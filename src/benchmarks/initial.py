@@ -0,0 +1,43 @@
+import sys
+
+from algorithm import calculateInitial, indexUserList
+from benchmarks.common import timed
+from benchmarks.synthetic import generateUserList
+from records import entriesFromPayload
+
+
+def scanMatches(userList):
+    matches = 0
+    for entry in userList:
+        for _, recMedia in entry.media.recommendations:
+            if next((x for x in userList if x.mediaId == recMedia.id), None):
+                matches += 1
+    return matches
+
+
+def indexMatches(userList):
+    userIndex = indexUserList(userList)
+    matches = 0
+    for entry in userList:
+        for _, recMedia in entry.media.recommendations:
+            if userIndex.get(recMedia.id):
+                matches += 1
+    return matches
+
+
+def main(size=5000):
+    userList = entriesFromPayload(generateUserList(size=size))
+    print(f"synthetic list: {size} entries")
+
+    scanCount, scanTime = timed(scanMatches, userList)
+    indexCount, indexTime = timed(indexMatches, userList)
+    assert scanCount == indexCount
+    print(f"userMatch linear scan: {scanTime:.3f}s")
+    print(f"userMatch index:       {indexTime:.3f}s ({scanTime / indexTime:.0f}x)")
+
+    _, initialTime = timed(calculateInitial, userList=userList)
+    print(f"calculateInitial:      {initialTime:.3f}s")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
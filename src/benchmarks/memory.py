@@ -0,0 +1,47 @@
+import os
+import sys
+import tracemalloc
+
+from algorithm import UserListAggregator, calculateInitial, calculateMeanScore
+from benchmarks.common import useTemporaryStore
+from benchmarks.synthetic import generateUserList
+import cachefiles
+import mediastore
+
+
+def peakMemory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+
+def materialized(userName):
+    userList = list(cachefiles.iterUserList(userName))
+    calculateInitial(userList=userList, meanScore=calculateMeanScore(userList))
+
+
+def streamed(userName):
+    aggregator = UserListAggregator()
+    for entry in cachefiles.iterUserList(userName):
+        aggregator.add(entry)
+    aggregator.finalize()
+
+
+def main(size=3000):
+    os.chdir(useTemporaryStore())
+    mediastore.saveUserList(
+        "benchuser",
+        generateUserList(size=size),
+        fetchedOn=cachefiles.getTodayDateStamp(),
+        withMedia=True,
+    )
+    print(f"synthetic list: {size} entries")
+    print(f"\tmaterialized list: {peakMemory(lambda: materialized('benchuser')):.0f}MB peak")
+    print(f"\tstreamed entries:  {peakMemory(lambda: streamed('benchuser')):.0f}MB peak")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3000)
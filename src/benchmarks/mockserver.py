@@ -0,0 +1,221 @@
+import collections
+import gzip
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.synthetic import generateUserList
+
+PER_CHUNK = 500
+
+
+class MockAniList(ThreadingHTTPServer):
+    # answers list summary and media detail queries with synthetic data and enforces a
+    # sliding-window rate limit the same way AniList does (http 429 + graphql error)
+
+    daemon_threads = True
+    # an unthrottled client opens many connections at once, more than the default backlog of 5
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        requestsPerMinute=90,
+        latency=0.0,
+        listSize=600,
+        errorRate=0.0,
+        port=0,
+        overlap=0.0,
+        compress=True,
+    ):
+        super().__init__(("127.0.0.1", port), MockAniListHandler)
+        self.requestsPerMinute = requestsPerMinute
+        self.latency = latency
+        self.errorRate = errorRate
+        self.random = random.Random(0)
+        self.listSize = listSize
+        # share of titles every user's list has in common
+        self.overlap = overlap
+        self.lists = {}
+        self.media = {}
+        self.requestTimes = collections.deque()
+        self.lock = threading.Lock()
+        self.stats = collections.Counter()
+        # gzip json responses for clients that accept it, like AniList does
+        self.compress = compress
+        # connections accepted and response bodies as sent, kept apart from the request
+        # counts in stats
+        self.wire = collections.Counter()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def listFor(self, userName, mediaType):
+        with self.lock:
+            if userName not in self.lists:
+                entries = generateUserList(
+                    size=self.listSize,
+                    seed=zlib.crc32(userName.encode()),
+                    overlap=self.overlap,
+                )
+                half = len(entries) // 2
+                self.lists[userName] = {"ANIME": entries[:half], "MANGA": entries[half:]}
+                for entry in entries:
+                    self.media.setdefault(entry["media"]["id"], entry["media"])
+            return self.lists[userName][mediaType]
+
+    def addEntries(self, userName, mediaType, entries):
+        self.listFor(userName, mediaType).extend(entries)
+        with self.lock:
+            for entry in entries:
+                self.media.setdefault(entry["media"]["id"], entry["media"])
+
+    def admit(self, counted=True):
+        # returns (allowed, remaining, seconds until the oldest request leaves the window).
+        # requests that aren't counted spend the budget but stay out of stats, like
+        # another client's on the same quota
+        with self.lock:
+            now = time.monotonic()
+            while self.requestTimes and now - self.requestTimes[0] >= 60:
+                self.requestTimes.popleft()
+            if len(self.requestTimes) >= self.requestsPerMinute:
+                if counted:
+                    self.stats["429"] += 1
+                return False, 0, 60 - (now - self.requestTimes[0])
+            self.requestTimes.append(now)
+            if counted:
+                self.stats["ok"] += 1
+            reset = 60 - (now - self.requestTimes[0])
+            return True, self.requestsPerMinute - len(self.requestTimes), reset
+
+
+class MockAniListHandler(BaseHTTPRequestHandler):
+    # keeps connections open between requests
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.wire["connections"] += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def sendError(self, status):
+        body = b"<html><body>Bad Gateway</body></html>"
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def sendJson(self, status, payload, headers):
+        body = json.dumps(payload).encode()
+        acceptsGzip = "gzip" in self.headers.get("Accept-Encoding", "")
+        with self.server.lock:
+            self.server.wire["decoded"] += len(body)
+        if self.server.compress and acceptsGzip:
+            body = gzip.compress(body, compresslevel=6)
+        with self.server.lock:
+            self.server.wire["sent"] += len(body)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if self.server.compress and acceptsGzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # speculative chunk requests get cancelled by the client mid-flight
+            pass
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if server.latency:
+            time.sleep(server.latency)
+
+        with server.lock:
+            failed = server.random.random() < server.errorRate
+        if failed:
+            server.stats["5xx"] += 1
+            self.sendError(502)
+            return
+
+        allowed, remaining, reset = server.admit()
+        headers = {
+            "X-RateLimit-Limit": str(server.requestsPerMinute),
+            "X-RateLimit-Remaining": str(remaining),
+        }
+        if not allowed:
+            retryAfter = max(1, int(reset + 0.999))
+            headers["Retry-After"] = str(retryAfter)
+            headers["X-RateLimit-Reset"] = str(int(time.time()) + retryAfter)
+            self.sendJson(
+                429,
+                {
+                    "data": None,
+                    "errors": [
+                        {"message": "Too Many Requests.", "status": 429, "locations": []}
+                    ],
+                },
+                headers,
+            )
+            return
+
+        variables = request.get("variables") or {}
+        query = request.get("query", "")
+        if "MediaDetails" in query:
+            with server.lock:
+                media = [server.media[i] for i in variables["ids"] if i in server.media]
+            if "recommendations" not in query:
+                media = [
+                    {key: value for key, value in m.items() if key != "recommendations"}
+                    for m in media
+                ]
+            self.sendJson(200, {"data": {"Page": {"media": media}}}, headers)
+            return
+
+        entries = [
+            {
+                "score": entry["score"],
+                "status": entry["status"],
+                "updatedAt": entry["updatedAt"],
+                "media": {"id": entry["media"]["id"]},
+            }
+            for entry in server.listFor(variables["name"], variables["type"])
+        ]
+        chunk = variables.get("chunk") or 1
+        chunkEntries = entries[(chunk - 1) * PER_CHUNK : chunk * PER_CHUNK]
+        self.sendJson(
+            200,
+            {
+                "data": {
+                    "MediaListCollection": {
+                        "hasNextChunk": chunk * PER_CHUNK < len(entries),
+                        "lists": [
+                            {
+                                "name": "Completed",
+                                "isCustomList": False,
+                                "entries": chunkEntries,
+                            }
+                        ],
+                    }
+                }
+            },
+            headers,
+        )
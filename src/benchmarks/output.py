@@ -0,0 +1,101 @@
+import copy
+import os
+import sys
+
+from algorithm import calculateBiases, calculateInitial
+from benchmarks.common import timed, useTemporaryStore
+from benchmarks.synthetic import generateUserList
+from records import Property, entriesFromPayload
+import output
+
+USE = {"tags": True, "staff": True, "studios": True, "genres": True, "decades": True}
+
+
+def legacyGenerateOriginStringForType(media, origins, userName=None):
+    # generateOriginStringForType as it was before output formats, for comparison
+    string = f"\t{userName}\n" if userName else ""
+    for angle, text in output.constants.ANGLES.items():
+        if media.id not in origins:
+            continue
+        if angle not in origins[media.id]:
+            continue
+
+        if angle == "userRating":
+            userRating = list(origins[media.id][angle].values())[0]
+            if userRating > 0:
+                string += f"\tYou {text} {userRating}%\n"
+            continue
+
+        string += f"\t{text} "
+        for origin in origins[media.id][angle].values():
+            if angle == "decades":
+                string += f"{origin}s"
+                return string + "\n"
+            name = ""
+            if isinstance(origin, Property):
+                name = origin.name
+            elif type(origin) == str:
+                name = origin
+            string += f"{name}, "
+        string = string[:-2] + "\n"
+    return string
+
+
+def legacyWriteRecList(finalRecs, origins, userNames):
+    fullName = ""
+    for userName in userNames:
+        fullName += f"{userName}-"
+    with open(f"{fullName}legacy-recs.txt", "w", encoding="utf-8") as f:
+        for rec in finalRecs:
+            media = rec["recMedia"]
+            print(f"{media.title} ({media.format}, {media.year}): {rec['recScore']}%", file=f)
+            print(f"\tother users rated it {media.meanScore}%\n", file=f)
+            for i in range(len(userNames)):
+                print(
+                    legacyGenerateOriginStringForType(
+                        media=media, origins=origins[i], userName=userNames[i]
+                    ),
+                    file=f,
+                )
+
+
+def main(size=3000):
+    os.chdir(useTemporaryStore())
+    userList = entriesFromPayload(generateUserList(size=size))
+    for entry in userList:
+        entry.media.format = entry.media.format or "TV"
+    propertyRatings, recs, origins = calculateInitial(userList=userList)
+    finalRecs, finalOrigins = calculateBiases(
+        propertyRatings=propertyRatings,
+        recs=recs,
+        use=USE,
+        recOrigins=copy.deepcopy(origins),
+        userMean=50,
+    )
+    for rec in finalRecs:
+        rec["recMedia"].format = rec["recMedia"].format or "TV"
+    userNames = ["benchuser", "otheruser"]
+    originsPerUser = [finalOrigins, finalOrigins]
+    print(f"{len(finalRecs)} recs for {len(userNames)} users")
+
+    _, legacyTime = timed(legacyWriteRecList, finalRecs, originsPerUser, userNames)
+    print(f"\tprint per line: {legacyTime:.3f}s")
+    for outputFormat in output.WRITERS:
+        if outputFormat not in output.availableFormats():
+            print(f"\t{outputFormat}: skipped, not installed")
+            continue
+        _, writeTime = timed(
+            output.writeRecList, finalRecs, originsPerUser, userNames, outputFormat
+        )
+        extension = output.WRITERS[outputFormat][1]
+        size = os.path.getsize(f"benchuser-otheruser-recs.{extension}")
+        print(f"\t{outputFormat}: {writeTime:.3f}s, {size / 1e6:.1f}MB")
+
+    with open("benchuser-otheruser-legacy-recs.txt", encoding="utf-8") as f:
+        legacy = f.read()
+    with open("benchuser-otheruser-recs.txt", encoding="utf-8") as f:
+        assert f.read() == legacy
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3000)
@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+
+from benchmarks.common import useTemporaryStore
+from benchmarks.mockserver import MockAniList
+import constants
+
+
+USE = {"tags": True, "staff": True, "studios": True, "genres": True, "decades": True}
+
+
+def sequential(userNames):
+    # fetch one list, score it, then move on to the next user
+    from algorithm import scoreRecommendationList
+    from apitools import fetchDataForUser
+
+    results = []
+    for userName in userNames:
+        fetchDataForUser(userName)
+        results.append(scoreRecommendationList(userName=userName, use=USE))
+    return results
+
+
+def pipelined(userNames, jobs):
+    from pipeline import runPipeline
+
+    return runPipeline(userNames=userNames, use=USE, refresh=True, jobs=jobs)
+
+
+def timedRun(server, func, *args):
+    os.chdir(useTemporaryStore())
+    server.stats.clear()
+    start = time.perf_counter()
+    results = func(*args)
+    elapsed = time.perf_counter() - start
+    return results, elapsed, server.stats["ok"]
+
+
+def main(userCount=6, listSize=600, requestsPerMinute=600, latency=0.3):
+    server = MockAniList(
+        requestsPerMinute=int(requestsPerMinute), latency=latency, listSize=int(listSize)
+    ).start()
+    # the fetch code reads its endpoint and budget from constants when it's imported
+    constants.ANILIST_URL = server.url
+    constants.REQUESTS_PER_MINUTE = int(requestsPerMinute)
+    userNames = [f"benchuser{i}" for i in range(int(userCount))]
+    try:
+        print(f"{userCount} users with {listSize} titles each")
+        baseline, elapsed, requests = timedRun(server, sequential, userNames)
+        print(f"\tone user after another: {elapsed:.1f}s, {requests} requests")
+        for jobs in [1, max(2, os.cpu_count() or 1)]:
+            results, elapsed, requests = timedRun(server, pipelined, userNames, jobs)
+            print(f"\tpipeline, {jobs} jobs: {elapsed:.1f}s, {requests} requests")
+            for result, expected in zip(results, baseline):
+                assert [r["recMedia"].id for r in result[0]] == [
+                    r["recMedia"].id for r in expected[0]
+                ]
+                assert [r["recScore"] for r in result[0]] == [
+                    r["recScore"] for r in expected[0]
+                ]
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
@@ -0,0 +1,72 @@
+import asyncio
+import copy
+import sys
+import time
+
+from apitools import fetchEntriesForUser, newFetchStats, printFetchStats
+from benchmarks.common import useTemporaryStore
+from benchmarks.mockserver import MockAniList
+from benchmarks.synthetic import generateUserList
+from cachefiles import loadPartialChunks
+from ratelimit import TokenBucket
+
+
+def timedFetch(server, userName, **kwargs):
+    stats = newFetchStats()
+    start = time.perf_counter()
+    entries = asyncio.run(
+        fetchEntriesForUser(
+            userName=userName,
+            limiter=TokenBucket(server.requestsPerMinute),
+            stats=stats,
+            url=server.url,
+            **kwargs,
+        )
+    )
+    elapsed = time.perf_counter() - start
+    print(f"\t{len(entries)} entries in {elapsed:.1f}s")
+    print("\t", end="")
+    printFetchStats(stats)
+    return entries
+
+
+def main(listSize=2000, requestsPerMinute=90, latency=1.0):
+    useTemporaryStore()
+    server = MockAniList(
+        requestsPerMinute=int(requestsPerMinute), latency=latency, listSize=int(listSize)
+    ).start()
+    try:
+        print(f"cold fetch of a {listSize:.0f} title list")
+        timedFetch(server, "benchuser")
+        # a finished list is asked for again next time, not resumed from its chunks
+        for mediaType in ["ANIME", "MANGA"]:
+            assert not loadPartialChunks("benchuser", mediaType)
+
+        # change three scores, drop one title and add two new ones
+        anime = server.listFor("benchuser", "ANIME")
+        for index in range(3):
+            entry = anime[index] = copy.copy(anime[index])
+            entry["score"] = (entry["score"] + 10) % 100
+            entry["updatedAt"] += 1
+        del anime[10]
+        server.addEntries(
+            "benchuser", "MANGA", generateUserList(size=2, mediaPool=10**6, seed=1)
+        )
+
+        print("refresh after five changes, media cache warm")
+        refreshed = timedFetch(server, "benchuser")
+        expected = server.listFor("benchuser", "ANIME") + server.listFor("benchuser", "MANGA")
+        assert [e["media"]["id"] for e in refreshed] == [e["media"]["id"] for e in expected]
+        assert [e["score"] for e in refreshed] == [e["score"] for e in expected]
+
+        print("refresh with every cached title expired")
+        timedFetch(server, "benchuser", mediaTtl=0)
+
+        print("a second user sharing part of the catalogue")
+        timedFetch(server, "otheruser")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main(*[float(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,60 @@
+import sys
+
+from benchmarks.common import timed, useTemporaryStore
+from benchmarks.synthetic import generateUserList
+import cachefiles
+import mediastore
+import profiling
+
+USE = {"tags": True, "staff": True, "studios": True, "genres": True, "decades": True}
+OTHER_USE = {**USE, "staff": False, "studios": False}
+
+
+def ranked(result):
+    return [(rec["recMedia"].id, rec["recScore"]) for rec in result[0]]
+
+
+def main(listSize=3000):
+    listSize = int(listSize)
+    from algorithm import scoreRecommendationList
+
+    useTemporaryStore()
+    userName = "benchuser"
+    userList = generateUserList(size=listSize)
+    mediastore.saveUserList(
+        userName, userList, fetchedOn=cachefiles.getTodayDateStamp(), withMedia=True
+    )
+    profiling.enable()
+
+    def score(use=USE, resultCache=True):
+        return scoreRecommendationList(userName, use=use, resultCache=resultCache)
+
+    expected, uncached = timed(score, resultCache=False)
+    cold = timed(score)[1]
+    result, hit = timed(score)
+    assert ranked(result) == ranked(expected)
+    otherExpected = score(OTHER_USE, resultCache=False)
+    result, otherFlags = timed(score, OTHER_USE)
+    assert ranked(result) == ranked(otherExpected)
+
+    # a changed score is a different list, which has to be scored again
+    userList[0]["score"] = 100 - userList[0]["score"]
+    mediastore.saveUserList(userName, userList, fetchedOn=cachefiles.getTodayDateStamp())
+    result, changed = timed(score)
+    assert ranked(result) == ranked(score(resultCache=False))
+    counters = profiling.active.counters
+
+    print(f"{listSize} titles")
+    print(f"\tno result cache: {uncached:.3f}s")
+    print(f"\tfirst run, filling the cache: {cold:.3f}s")
+    print(f"\tsame list and flags: {hit:.3f}s ({uncached / hit:.1f}x)")
+    print(f"\tsame list, other flags: {otherFlags:.3f}s ({uncached / otherFlags:.1f}x)")
+    print(f"\tchanged list: {changed:.3f}s")
+    print(
+        f"\t{counters['result cache hits']} hits, {counters['result cache misses']} misses,"
+        f" {mediastore.getStore().execute('SELECT SUM(size) FROM results').fetchone()[0] / 1e6:.1f}MB stored"
+    )
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
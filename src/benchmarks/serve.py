@@ -0,0 +1,81 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import sys
+import threading
+import time
+import urllib.request
+
+from benchmarks.common import useTemporaryStore
+from benchmarks.mockserver import MockAniList
+import constants
+
+USE = {"tags": True, "staff": True, "studios": True, "genres": True, "decades": True}
+
+
+def get(url):
+    start = time.perf_counter()
+    with urllib.request.urlopen(url) as response:
+        payload = json.loads(response.read())
+    return payload, time.perf_counter() - start
+
+
+def main(userCount=3, listSize=1000, concurrency=8):
+    userCount, concurrency = int(userCount), int(concurrency)
+    mock = MockAniList(
+        requestsPerMinute=6000, latency=0.05, listSize=int(listSize), overlap=0.3
+    ).start()
+    # the fetch code reads its endpoint and budget from constants when it's imported
+    constants.ANILIST_URL = mock.url
+    constants.REQUESTS_PER_MINUTE = 6000
+    os.chdir(useTemporaryStore())
+    from algorithm import scoreRecommendationList, unwatchedRecs
+    from server import RecommendationServer, RecommendationService
+
+    service = RecommendationService(url=mock.url).start()
+    server = RecommendationServer(("127.0.0.1", 0), service)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}/recs"
+    userNames = [f"benchuser{i}" for i in range(userCount)]
+    query = "tags=1&staff=1&studios=1&genres=1&limit=50"
+    try:
+        print(f"{userCount} users with {listSize} titles each")
+        payload, cold = get(f"{base}?users={userNames[0]}&{query}")
+        print(f"\tfirst request, fetch + load + score: {cold:.3f}s")
+        payload, warm = get(f"{base}?users={userNames[0]}&{query}")
+        print(f"\twarm request: {warm:.3f}s ({payload['seconds']:.3f}s scoring)")
+
+        # the warm answer is the list nextani.py writes. the store belongs to the
+        # service's thread, so that's where it's scored
+        async def scoreDirectly():
+            return scoreRecommendationList(userNames[0], use=USE, limit=50)
+
+        finalRecs, _, _, userIndex = asyncio.run_coroutine_threadsafe(
+            scoreDirectly(), service.loop
+        ).result()
+        expected = [rec["recMedia"].id for rec in unwatchedRecs(finalRecs, userIndex)][:50]
+        assert [rec["id"] for rec in payload["recs"]] == expected
+
+        users = ",".join(userNames)
+        _, coldGroup = get(f"{base}?users={users}&{query}")
+        _, warmGroup = get(f"{base}?users={users}&{query}")
+        print(f"\tgroup of {userCount}, first request: {coldGroup:.3f}s, warm: {warmGroup:.3f}s")
+
+        urls = [f"{base}?users={userNames[i % userCount]}&{query}" for i in range(concurrency * 4)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            latencies = [seconds for _, seconds in pool.map(get, urls)]
+        elapsed = time.perf_counter() - start
+        print(
+            f"\t{len(urls)} warm requests, {concurrency} at a time: {elapsed:.3f}s,"
+            f" {max(latencies):.3f}s slowest"
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
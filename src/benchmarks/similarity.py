@@ -0,0 +1,55 @@
+import sys
+
+from benchmarks.common import timed, useTemporaryStore
+from benchmarks.synthetic import generateUserList
+import cachefiles
+import mediastore
+
+USE = {"tags": True, "staff": True, "studios": True, "genres": True, "decades": True}
+
+
+def main(userCount=100, listSize=300):
+    userCount, listSize = int(userCount), int(listSize)
+    from algorithm import scoreRecommendationList
+    import similarity
+
+    if not similarity.AVAILABLE:
+        print("building the index requires numpy and scipy")
+        return
+    useTemporaryStore()
+    fetchedOn = cachefiles.getTodayDateStamp()
+    for seed in range(userCount):
+        mediastore.saveUserList(
+            f"benchuser{seed}",
+            generateUserList(size=listSize, seed=seed, overlap=0.3),
+            fetchedOn=fetchedOn,
+            withMedia=True,
+        )
+    (listCount, index), seconds = timed(similarity.buildIndex)
+    (size,) = mediastore.getStore().execute(
+        "SELECT SUM(LENGTH(neighbours)) FROM similar_media"
+    ).fetchone()
+    print(f"{listCount} lists of {listSize} titles")
+    print(f"\tbuilding the index: {seconds:.3f}s, {len(index)} titles, {size / 1024:.0f}KB")
+
+    # a new user the index wasn't built from
+    userName = "newuser"
+    mediastore.saveUserList(
+        userName,
+        generateUserList(size=listSize, seed=userCount, overlap=0.3),
+        fetchedOn=fetchedOn,
+        withMedia=True,
+    )
+    for candidates in ["recs", "similar", "both"]:
+        result, seconds = timed(
+            scoreRecommendationList,
+            userName,
+            use=USE,
+            resultCache=False,
+            candidates=candidates,
+        )
+        print(f"\tscoring with candidates={candidates}: {seconds:.3f}s, {len(result[0])} recs")
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
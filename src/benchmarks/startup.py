@@ -0,0 +1,94 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.common import useTemporaryStore
+from benchmarks.synthetic import generateUserList
+import cachefiles
+import mediastore
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# a run answered from the cache must not load any of these
+NETWORK_MODULES = {"apitools", "gql", "graphql", "httpx", "httpcore", "numpy", "scipy"}
+
+# importing nextani, on top of what a bare interpreter imports. it was about 540ms with
+# the network stack and numpy loaded up front, and is about 75ms without them on the
+# machine the target was set on
+IMPORT_TARGET_MS = 150
+
+
+def importTimeMs(module, repeat=5):
+    # the cumulative time -X importtime reports for `module`, best of `repeat` runs
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=SRC,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        for line in result.stderr.splitlines():
+            fields = line.split("|")
+            if len(fields) == 3 and fields[2].rstrip() == f" {module}":
+                micros = int(fields[1])
+                best = micros if best is None else min(best, micros)
+    return best / 1000
+
+
+def cacheHitRun(userName, directory):
+    # a whole nextani.py run against a fresh cached list, reporting which network
+    # modules it ended up importing
+    script = (
+        "import json, sys, nextani\n"
+        f"nextani.main([{userName!r}])\n"
+        f"print(json.dumps(sorted({{m.split('.')[0] for m in sys.modules}} & set({sorted(NETWORK_MODULES)!r}))))\n"
+    )
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=directory,
+        env={**os.environ, "PYTHONPATH": SRC},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed = time.perf_counter() - start
+    return json.loads(result.stdout.splitlines()[-1]), elapsed
+
+
+def main(listSize=1000):
+    listSize = int(listSize)
+    failures = []
+    directory = useTemporaryStore()
+    userName = "benchuser"
+    mediastore.saveUserList(
+        userName,
+        generateUserList(size=listSize),
+        fetchedOn=cachefiles.getTodayDateStamp(),
+        withMedia=True,
+    )
+    # the run reads pyani-cache.sqlite3 from its working directory, which is this store
+    mediastore.closeStore()
+
+    bare = importTimeMs("site")
+    nextani = importTimeMs("nextani")
+    print(f"import nextani: {nextani:.1f}ms (site: {bare:.1f}ms), target {IMPORT_TARGET_MS}ms")
+    if nextani > IMPORT_TARGET_MS:
+        failures.append(f"importing nextani took {nextani:.1f}ms")
+
+    loaded, elapsed = cacheHitRun(userName, directory)
+    print(f"cache hit run, {listSize} titles: {elapsed:.3f}s, network modules loaded: {loaded or 'none'}")
+    if loaded:
+        failures.append(f"a cache hit run imported {', '.join(loaded)}")
+
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*map(float, sys.argv[1:])))
@@ -0,0 +1,197 @@
+import argparse
+import asyncio
+import copy
+import json
+import os
+import sys
+import time
+
+from benchmarks.common import timed, useTemporaryStore
+from benchmarks.mockserver import MockAniList
+import constants
+from records import entriesFromPayload
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baseline.json")
+USE = {"tags": True, "staff": True, "studios": True, "genres": True, "decades": True}
+USER_NAMES = ["benchuser", "otheruser", "thirduser"]
+
+
+def best(repeat, func, *args, **kwargs):
+    # fastest of `repeat` runs, the least noisy estimate of what the code costs
+    result, seconds = timed(func, *args, **kwargs)
+    for _ in range(repeat - 1):
+        result, again = timed(func, *args, **kwargs)
+        seconds = min(seconds, again)
+    return result, seconds
+
+
+def fetchStage(server, userName):
+    from apitools import fetchEntriesForUser, newFetchStats
+    from ratelimit import TokenBucket
+
+    useTemporaryStore()
+    return asyncio.run(
+        fetchEntriesForUser(
+            userName=userName,
+            limiter=TokenBucket(server.requestsPerMinute),
+            stats=newFetchStats(),
+            url=server.url,
+        )
+    )
+
+
+def loadStage(userName):
+    import cachefiles
+
+    return sum(1 for _ in cachefiles.iterUserList(userName))
+
+
+def runSuite(listSize, repeat):
+    # per-stage timings in seconds against a mock server that doesn't throttle, so only
+    # the client's own work and the configured latency count
+    timings = {}
+    server = MockAniList(
+        requestsPerMinute=100000, latency=0.05, listSize=listSize, overlap=0.3
+    ).start()
+    # the fetch code reads its endpoint and budget from constants when it's imported
+    constants.ANILIST_URL = server.url
+    constants.REQUESTS_PER_MINUTE = 100000
+    from algorithm import UserListAggregator, calculateBiases, compileUserProfile
+    from group import generateGroupList
+    import mediastore
+    import output
+    from pipeline import runPipeline
+
+    try:
+        _, timings["fetch"] = best(repeat, fetchStage, server, USER_NAMES[0])
+
+        directory = useTemporaryStore()
+        os.chdir(directory)
+        userLists = {
+            userName: server.listFor(userName, "ANIME") + server.listFor(userName, "MANGA")
+            for userName in USER_NAMES
+        }
+        for userName, userList in userLists.items():
+            mediastore.saveUserList(
+                userName, userList, fetchedOn=int(time.strftime("%Y%m%d")), withMedia=True
+            )
+        _, timings["load"] = best(repeat, loadStage, USER_NAMES[0])
+        entries = entriesFromPayload(userLists[USER_NAMES[0]])
+
+        def initialStage():
+            aggregator = UserListAggregator()
+            for entry in entries:
+                aggregator.add(entry)
+            return aggregator, aggregator.finalize()
+
+        (aggregator, (propertyRatings, recs, origins)), timings["initial"] = best(
+            repeat, initialStage
+        )
+        userProfile = compileUserProfile(
+            propertyRatings=propertyRatings, userMean=aggregator.meanScore
+        )
+        (finalRecs, finalOrigins), timings["biases"] = best(
+            repeat,
+            lambda: calculateBiases(
+                propertyRatings=propertyRatings,
+                recs=recs,
+                use=USE,
+                recOrigins=copy.deepcopy(origins),
+                userMean=aggregator.meanScore,
+                userProfile=userProfile,
+            ),
+        )
+
+        _, timings["output"] = best(
+            repeat,
+            output.writeRecList,
+            finalRecs=finalRecs,
+            origins=[finalOrigins],
+            userNames=[USER_NAMES[0]],
+        )
+
+        results = runPipeline(userNames=USER_NAMES, use=USE, refresh=False, jobs=1)
+        userData = [
+            {"userName": userName, "list": r[0], "origins": r[1], "userList": r[2], "userIndex": r[3]}
+            for userName, r in zip(USER_NAMES, results)
+        ]
+        _, timings["joint"] = best(repeat, generateGroupList, userData=userData)
+
+        def endToEnd():
+            os.chdir(useTemporaryStore())
+            return runPipeline(
+                userNames=USER_NAMES,
+                use=USE,
+                refresh=True,
+                jobs=1,
+                onResult=lambda userName, result: output.writeRecList(
+                    finalRecs=result[0], origins=[result[1]], userNames=[userName]
+                ),
+            )
+
+        _, timings["end to end"] = best(1, endToEnd)
+    finally:
+        server.stop()
+    return timings
+
+
+def compare(timings, baseline, tolerance):
+    regressions = []
+    print(f"{'stage':<12}{'seconds':>10}{'baseline':>10}{'change':>10}")
+    for name, seconds in timings.items():
+        reference = baseline.get(name)
+        if reference:
+            change = seconds / reference - 1
+            flag = "  REGRESSION" if change > tolerance else ""
+            print(f"{name:<12}{seconds:>10.3f}{reference:>10.3f}{change:>+10.0%}{flag}")
+            if flag:
+                regressions.append(name)
+        else:
+            print(f"{name:<12}{seconds:>10.3f}{'-':>10}{'-':>10}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time every stage against the mock server and compare with the stored baseline"
+    )
+    parser.add_argument("--list-size", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--tolerance",
+        help="Slowdown over the baseline that counts as a regression, 0.25 being 25%%",
+        type=float,
+        default=0.25,
+    )
+    parser.add_argument(
+        "--save", help="Store this run as the new baseline", action="store_true"
+    )
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    args = parser.parse_args(argv)
+
+    cwd = os.getcwd()
+    timings = runSuite(listSize=args.list_size, repeat=args.repeat)
+    os.chdir(cwd)
+
+    stored = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            stored = json.load(f)
+    # baselines are per list size, since timings don't carry over between sizes
+    key = str(args.list_size)
+    regressions = compare(timings, stored.get(key, {}), args.tolerance)
+
+    if args.save:
+        stored[key] = {name: round(seconds, 4) for name, seconds in timings.items()}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(stored, f, indent=2)
+            f.write("\n")
+        print(f"saved baseline to {args.baseline}")
+    elif regressions:
+        print(f"regressions in: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import random
+
+STATUSES = ["COMPLETED", "CURRENT", "DROPPED", "PAUSED", "REPEATING"]
+FORMATS = ["TV", "MOVIE", "OVA", "ONA", "MANGA", "NOVEL"]
+GENRES = [
+    "Action",
+    "Adventure",
+    "Comedy",
+    "Drama",
+    "Fantasy",
+    "Horror",
+    "Mystery",
+    "Romance",
+    "Sci-Fi",
+    "Slice of Life",
+    "Sports",
+    "Thriller",
+]
+
+
+def generateMedia(rng, mediaId, tagCount, staffCount, studioCount):
+    return {
+        "id": mediaId,
+        "title": {"english": None, "userPreferred": f"Synthetic Title {mediaId}"},
+        "staff": {
+            "nodes": [
+                {"id": s, "name": {"userPreferred": f"Staff {s}"}}
+                for s in rng.sample(range(1, staffCount + 1), min(staffCount, 8))
+            ]
+        },
+        "meanScore": rng.randint(40, 90),
+        "format": rng.choice(FORMATS),
+        "popularity": rng.randint(100, 300000),
+        "startDate": {"year": rng.randint(1970, 2025)},
+        "studios": {
+            "nodes": [
+                {"id": s, "name": f"Studio {s}"}
+                for s in rng.sample(range(1, studioCount + 1), min(studioCount, 2))
+            ]
+        },
+        "genres": rng.sample(GENRES, 3),
+        "tags": [
+            {"id": t, "rank": rng.randint(20, 100), "name": f"Tag {t}"}
+            for t in rng.sample(range(1, tagCount + 1), min(tagCount, 10))
+        ],
+    }
+
+
+def generateUserList(
+    size=5000,
+    recsPerEntry=10,
+    mediaPool=None,
+    tagCount=400,
+    staffCount=20000,
+    studioCount=500,
+    seed=0,
+    overlap=0.0,
+):
+    # list entries carrying full media payloads (queries.mediaFields). a media id always
+    # gets the same details, like on AniList, whether it's listed or recommended.
+    # lists generated with the same size and mediaPool share `overlap` of their titles,
+    # whatever their seed
+    rng = random.Random(seed)
+    mediaPool = mediaPool or size * 4
+    sharedIds = random.Random(mediaPool).sample(range(1, mediaPool + 1), int(size * overlap))
+    shared = set(sharedIds)
+    ownIds = [
+        mediaId
+        for mediaId in rng.sample(range(1, mediaPool + 1), min(mediaPool, size * 2))
+        if mediaId not in shared
+    ]
+    mediaIds = sharedIds + ownIds[: size - len(sharedIds)]
+    mediaById = {}
+
+    def mediaFor(mediaId):
+        if mediaId not in mediaById:
+            mediaById[mediaId] = generateMedia(
+                random.Random(mediaId), mediaId, tagCount, staffCount, studioCount
+            )
+        return mediaById[mediaId]
+
+    userList = []
+    for mediaId in mediaIds:
+        media = dict(mediaFor(mediaId))
+        del media["format"]
+        media["recommendations"] = {
+            "nodes": [
+                {
+                    "rating": rng.randint(-5, 200),
+                    "mediaRecommendation": dict(mediaFor(recId)),
+                }
+                for recId in rng.sample(range(1, mediaPool + 1), recsPerEntry)
+            ]
+        }
+        userList.append(
+            {
+                "score": rng.choice([0, rng.randint(10, 100)]),
+                "status": rng.choice(STATUSES),
+                "updatedAt": rng.randint(1500000000, 1750000000),
+                "media": media,
+            }
+        )
+    return userList
@@ -3,6 +3,7 @@ from glob import glob
 import json
 import os
 import constants
+import mediastore
 import re
 
 
@@ -16,47 +17,131 @@ def compareDateStamps(stamp1, stamp2=None, delta=constants.OLD_DATA_THRESHOLD):
     return abs(int(stamp1) - int(stamp2)) <= delta
 
 
-def generateDataFileNameForUser(userName: str):
-    return f"{sanitizeUserName(userName=userName)}-{getTodayDateStamp()}-list.json"
+def saveUserList(userName: str, entries: list):
+    mediastore.saveUserList(
+        sanitizeUserName(userName=userName), entries, fetchedOn=getTodayDateStamp()
+    )
 
 
-def saveUserDataFile(userName: str, entries: list):
-    with open(generateDataFileNameForUser(userName=userName), "w") as file:
-        json.dump(entries, file)
+def saveMedia(mediaList: list):
+    mediastore.saveMediaDetails(mediaList)
+
+
+def freshMediaIds(mediaIds, maxAge, withRecommendations=True):
+    return mediastore.freshMediaIds(
+        mediaIds, maxAge=maxAge, withRecommendations=withRecommendations
+    )
 
 
 def sanitizeUserName(userName: str):
     return re.sub(r'[^a-zA-Z0-9_-]', '', userName)
 
 
-def latestValidUserFileOrNew(userName: str, clean=True):
+def userListIsFresh(userName: str, withRecommendations=True):
+    # a list fetched without recommendations, for --candidates similar, has to be
+    # fetched again before it can be scored from them
+    importLegacyUserFiles(userName=userName)
+    fetchedOn = mediastore.userFetchedOn(sanitizeUserName(userName=userName))
+    return (
+        fetchedOn is not None
+        and compareDateStamps(fetchedOn)
+        and not (
+            withRecommendations
+            and mediastore.userListLacksRecommendations(sanitizeUserName(userName=userName))
+        )
+    )
+
+
+def iterUserList(userName: str, withRecommendations=True):
+    importLegacyUserFiles(userName=userName)
+    return mediastore.iterUserList(
+        sanitizeUserName(userName=userName), withRecommendations=withRecommendations
+    )
+
+
+def userContentHash(userName: str):
+    importLegacyUserFiles(userName=userName)
+    return mediastore.userContentHash(sanitizeUserName(userName=userName))
+
+
+def similarMediaForUser(userName: str):
+    return mediastore.loadSimilarMediaForUser(sanitizeUserName(userName=userName))
+
+
+def savePartialChunk(userName: str, mediaType: str, chunk: int, entries, hasNextChunk):
+    mediastore.savePartialChunk(
+        sanitizeUserName(userName=userName), mediaType, chunk, entries, hasNextChunk
+    )
+
+
+def clearPartialChunks(userName: str):
+    mediastore.clearPartialChunks(sanitizeUserName(userName=userName))
+
+
+def loadPartialChunks(userName: str, mediaType: str, maxAge=constants.PARTIAL_CHUNK_TTL_S):
+    return mediastore.loadPartialChunks(
+        sanitizeUserName(userName=userName), mediaType, maxAge
+    )
+
+
+def importLegacyUserFiles(userName: str):
+    # lists cached as per-user json files by older versions move into the shared store
+    fileName = latestUserFile(userName=userName)
+    if not fileName:
+        return
+    dateStamp = extractDateStampFromFileName(fileName=fileName)
+    fetchedOn = mediastore.userFetchedOn(sanitizeUserName(userName=userName))
+    if fetchedOn is None or fetchedOn < dateStamp:
+        mediastore.saveUserList(
+            sanitizeUserName(userName=userName),
+            iterDataFromFile(fileName),
+            fetchedOn=dateStamp,
+            withMedia=True,
+        )
+    for legacyFile in glob(f"{sanitizeUserName(userName=userName)}-*-list.json"):
+        os.remove(legacyFile)
+
+
+def latestUserFile(userName: str):
     fileNames = glob(f"{sanitizeUserName(userName=userName)}-*-list.json")
-    latestValidFileName = None
-    latestValidDateStamp = None
-    for fileName in fileNames:
-        dateStamp = extractDateStampFromFileName(fileName=fileName)
-        if compareDateStamps(dateStamp):
-            if not latestValidDateStamp or dateStamp > latestValidDateStamp:
-                if clean and latestValidFileName:
-                    os.remove(latestValidFileName)
-                latestValidFileName = fileName
-                latestValidDateStamp = dateStamp
-            elif clean:
-                os.remove(fileName)
-        elif clean:
-            os.remove(fileName)
-    return latestValidFileName or generateDataFileNameForUser(userName=userName)
+    if not fileNames:
+        return None
+    return max(fileNames, key=lambda fileName: extractDateStampFromFileName(fileName=fileName))
 
 
 def extractDateStampFromFileName(fileName):
     return int(fileName.split("-")[-2])
 
 
-def loadDataFromFile(userFile):
+def iterDataFromFile(userFile, chunkSize=1 << 16):
+    # yield the entries of a json array one at a time instead of loading the whole file
     if not os.path.exists(userFile):
-        return None
+        return
 
+    decoder = json.JSONDecoder()
     with open(userFile, "r") as file:
-        userList = json.load(file)
-
-    return userList
+        buffer = file.read(chunkSize)
+        position = buffer.index("[") + 1
+        while True:
+            while True:
+                while position < len(buffer) and buffer[position] in " \t\r\n,":
+                    position += 1
+                if position < len(buffer):
+                    break
+                buffer = file.read(chunkSize)
+                position = 0
+                if not buffer:
+                    return
+            if buffer[position] == "]":
+                return
+            try:
+                entry, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                more = file.read(chunkSize)
+                if not more:
+                    raise
+                buffer = buffer[position:] + more
+                position = 0
+                continue
+            yield entry
+            position = end
@@ -9,3 +9,63 @@ ANGLES = {
 }
 
 OLD_DATA_THRESHOLD = 1
+
+# titles on a user's list with these statuses are left out of their own recs
+WATCHED_STATUSES = {"COMPLETED", "REPEATING", "DROPPED", "CURRENT"}
+
+ANILIST_URL = "https://graphql.anilist.co"
+# AniList's documented budget is 90 requests per minute, but it has been running
+# in a degraded state of 30 per minute
+REQUESTS_PER_MINUTE = 30
+# how long a rate limit window lasts when the server doesn't send X-RateLimit-Reset
+RATE_LIMIT_WINDOW_S = 60
+PREFETCH_CHUNKS = 2
+MAX_RETRIES = 3
+BACKOFF_BASE_S = 1
+BACKOFF_MAX_S = 60
+# chunks of a list whose fetch failed are kept this long for the next fetch to resume from
+PARTIAL_CHUNK_TTL_S = 6 * 60 * 60
+# requests to AniList go over one pool of connections per run (apitools.AniListClient).
+# a request fails after HTTP_TIMEOUT_S without progress, and up to
+# HTTP_KEEPALIVE_CONNECTIONS idle connections are kept open for HTTP_KEEPALIVE_S
+HTTP_TIMEOUT_S = 120
+HTTP_KEEPALIVE_CONNECTIONS = 20
+HTTP_KEEPALIVE_S = 60
+
+STORE_FILE = "pyani-cache.sqlite3"
+STORE_BATCH_SIZE = 500
+
+# media details and recommendation edges change slowly, so they outlive the user lists
+MEDIA_TTL_S = 14 * 24 * 60 * 60
+MEDIA_CACHE_MAX_ENTRIES = 250000
+
+# loaded lists and scored recs are kept in the store too, see resultcache.py. bump the
+# version whenever a change to scoring changes its results, so older ones aren't reused
+ALGORITHM_VERSION = 1
+RESULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# nextani.py serve: how long a loaded user is served before their list is fetched again,
+# and how often that is checked
+SERVE_TTL_S = 60 * 60
+SERVE_CHECK_S = 60
+
+# the similar titles index (similarity.py): titles kept per title, how many users must have
+# scored both of two titles, and how strongly similarities from few users are shrunk
+SIMILAR_MEDIA_NEIGHBOURS = 50
+SIMILAR_MEDIA_MIN_USERS = 3
+SIMILAR_MEDIA_SHRINK = 10
+# scales a similarity to the weight of an AniList recommendation, whose rating is divided
+# by the popularity of both titles
+SIMILAR_MEDIA_WEIGHT = 1e-3
+
+# --expand: titles expanded at most per user when walking the recommendation graph past
+# the direct candidates, the share of its score a title passes on, the fraction of the
+# best candidate's score below which the walk stops, and how many of a title's best rated
+# recommendations are followed
+EXPANSION_NODE_BUDGET = 2000
+EXPANSION_DECAY = 0.5
+EXPANSION_MIN_RATIO = 0.01
+EXPANSION_MAX_EDGES = 10
+
+# nextani.py batch: jobs fetched and scored at the same time
+BATCH_CONCURRENCY = 8
@@ -0,0 +1,101 @@
+import heapq
+
+import constants
+import mediastore
+
+
+class RecommendationGraph:
+    # memoized media id -> ((rating, rec id), ...) over the recommendation edges in the
+    # store. loadEdges(mediaIds) returns the edges of the titles that have them, like
+    # mediastore.loadRecommendationEdges
+
+    def __init__(self, loadEdges=mediastore.loadRecommendationEdges):
+        self.loadEdges = loadEdges
+        self.adjacency = {}
+
+    def __contains__(self, mediaId):
+        return mediaId in self.adjacency
+
+    def load(self, mediaIds):
+        missing = [
+            mediaId for mediaId in dict.fromkeys(mediaIds) if mediaId not in self.adjacency
+        ]
+        loaded = self.loadEdges(missing) if missing else {}
+        for mediaId in missing:
+            self.adjacency[mediaId] = tuple(loaded.get(mediaId, ()))
+
+    def edges(self, mediaId):
+        if mediaId not in self.adjacency:
+            self.load([mediaId])
+        return self.adjacency[mediaId]
+
+
+def expandCandidates(
+    seeds,
+    exclude,
+    graph,
+    depth=2,
+    budget=constants.EXPANSION_NODE_BUDGET,
+    decay=constants.EXPANSION_DECAY,
+    minRatio=constants.EXPANSION_MIN_RATIO,
+    maxEdges=constants.EXPANSION_MAX_EDGES,
+):
+    # best-first walk from the direct candidates, seeds being media id -> score, out to
+    # `depth` hops from the list. a title passes decay * its score on to the titles it
+    # recommends, split by how highly each is rated among its edges, and titles reached
+    # from several places add up what they're given. only the maxEdges best rated edges
+    # of a title are followed. the walk expands the highest scored title next and stops
+    # once `budget` titles were expanded or the best one left scores less than minRatio
+    # of the best seed, so it follows at most budget * maxEdges edges however big or
+    # dense the graph is.
+    # returns media id -> (score, id of the seed it was reached from) for at most
+    # `budget` new titles, none of them seeds or in exclude
+    if not seeds or depth < 2:
+        return {}
+    cutoff = max(seeds.values()) * minRatio
+    scores = dict(seeds)
+    # title -> (the largest share it was given, the seed that came from)
+    reachedFrom = {mediaId: (score, mediaId) for mediaId, score in seeds.items()}
+    heap = [(-score, mediaId, 1) for mediaId, score in seeds.items() if score > cutoff]
+    heapq.heapify(heap)
+    # title -> the score it was last queued with, older heap entries are skipped
+    queued = {mediaId: -negativeScore for negativeScore, mediaId, _ in heap}
+    expanded = set()
+    while heap and len(expanded) < budget:
+        negativeScore, mediaId, hops = heapq.heappop(heap)
+        if mediaId in expanded or -negativeScore != queued[mediaId]:
+            continue
+        if -negativeScore <= cutoff:
+            break
+        expanded.add(mediaId)
+        if mediaId not in graph:
+            # along with the titles most likely to be expanded next
+            upcoming = heapq.nsmallest(constants.STORE_BATCH_SIZE - 1, heap)
+            graph.load([mediaId] + [queuedId for _, queuedId, _ in upcoming])
+        edges = heapq.nlargest(
+            maxEdges,
+            (
+                (rating, recId)
+                for rating, recId in graph.edges(mediaId)
+                if rating >= 1 and recId
+            ),
+            key=lambda edge: edge[0],
+        )
+        if not edges:
+            continue
+        topRating = max(rating for rating, _ in edges)
+        seed = reachedFrom[mediaId][1]
+        for rating, recId in edges:
+            if recId in seeds or recId in exclude:
+                continue
+            share = scores[mediaId] * decay * rating / topRating
+            scores[recId] = scores.get(recId, 0) + share
+            if share > reachedFrom.get(recId, (0, None))[0]:
+                reachedFrom[recId] = (share, seed)
+            if hops + 1 < depth and recId not in expanded:
+                queued[recId] = scores[recId]
+                heapq.heappush(heap, (-scores[recId], recId, hops + 1))
+
+    found = [mediaId for mediaId in scores if mediaId not in seeds]
+    found = heapq.nlargest(budget, found, key=scores.__getitem__)
+    return {mediaId: (scores[mediaId], reachedFrom[mediaId][1]) for mediaId in found}
@@ -0,0 +1,54 @@
+import profiling
+
+
+# request counters shared by every fetch of a run, kept out of apitools so that
+# reporting them doesn't import the network stack
+def newFetchStats():
+    return {
+        "requests": 0,
+        "retries": 0,
+        "rateLimited": 0,
+        "cacheHits": 0,
+        "cacheMisses": 0,
+        "latencies": [],
+        # seconds actually spent sleeping, on 429 pauses and retry backoff, and the time
+        # every request spent queued for the limiter, summed across concurrent requests
+        "slept": 0.0,
+        "queued": 0.0,
+        # request and response bodies as sent, and responses once decompressed
+        "bytesSent": 0,
+        "bytesReceived": 0,
+        "bytesDecoded": 0,
+    }
+
+
+def printFetchStats(stats):
+    latencies = stats["latencies"]
+    meanLatency = sum(latencies) / len(latencies) if latencies else 0
+    print(
+        f"{stats['requests']} requests ({stats['retries']} retries, {stats['rateLimited']} rate limited),"
+        f" {meanLatency:.2f}s mean latency, {max(latencies, default=0):.2f}s max,"
+        f" {stats['slept']:.1f}s slept, {stats['queued']:.1f}s queued across requests,"
+        f" {stats['cacheHits']} cached titles,"
+        f" {formatBytes(stats['bytesSent'])} sent, {formatBytes(stats['bytesReceived'])}"
+        f" received ({formatBytes(stats['bytesDecoded'])} decompressed)"
+    )
+
+
+def formatBytes(count):
+    if count < 1024 * 1024:
+        return f"{count / 1024:.1f}KB"
+    return f"{count / 1024 / 1024:.1f}MB"
+
+
+def recordFetchStats(stats):
+    profiling.count("requests", stats["requests"])
+    profiling.count("retries", stats["retries"])
+    profiling.count("429s", stats["rateLimited"])
+    profiling.count("seconds slept", stats["slept"])
+    profiling.count("seconds queued", stats["queued"])
+    profiling.count("cache hits", stats["cacheHits"])
+    profiling.count("cache misses", stats["cacheMisses"])
+    profiling.count("bytes sent", stats["bytesSent"])
+    profiling.count("bytes received", stats["bytesReceived"])
+    profiling.count("bytes decompressed", stats["bytesDecoded"])
@@ -0,0 +1,224 @@
+from collections import namedtuple
+import heapq
+from itertools import chain
+import math
+from operator import attrgetter, itemgetter
+
+# how one group score is folded out of each member's score for a title. members who
+# neither rated nor were recommended a title count as 0 for it
+#   initial: starting value of the fold
+#   combine(total, score, weight): folds in one member's score
+#   finish(total, count, userCount, totalWeight): turns the fold into the group score,
+#   count being how many members contributed a score
+#   fold(totals, columns, scores, weight): optional, does what combine does for all of
+#   a member's scores at once on numpy arrays, totals[columns] being the titles they
+#   scored. returns which of them now hold the member's score itself rather than a sum
+#   of scores, or None if none do
+GroupStrategy = namedtuple(
+    "GroupStrategy", ["initial", "combine", "finish", "fold"], defaults=[None]
+)
+
+
+def addScores(totals, columns, scores, weight):
+    totals[columns] += scores
+
+
+def addWeightedScores(totals, columns, scores, weight):
+    totals[columns] += scores * weight
+
+
+def keepLowestScores(totals, columns, scores, weight):
+    # like min(total, score), a total only changes when the score is lower
+    lower = scores < totals[columns]
+    totals[columns[lower]] = scores[lower]
+    return lower
+
+
+STRATEGIES = {
+    "mean": GroupStrategy(
+        initial=0,
+        combine=lambda total, score, weight: total + score,
+        finish=lambda total, count, userCount, totalWeight: total / userCount,
+        fold=addScores,
+    ),
+    "least-misery": GroupStrategy(
+        initial=math.inf,
+        combine=lambda total, score, weight: min(total, score),
+        finish=lambda total, count, userCount, totalWeight: (
+            total if count == userCount else 0
+        ),
+        fold=keepLowestScores,
+    ),
+    "weighted": GroupStrategy(
+        initial=0,
+        combine=lambda total, score, weight: total + score * weight,
+        finish=lambda total, count, userCount, totalWeight: total / totalWeight,
+        fold=addWeightedScores,
+    ),
+}
+
+SEEN_STATUSES = {"COMPLETED", "REPEATING", "DROPPED"}
+
+
+def loadNumpy():
+    # numpy is optional, and only imported once a group list is made
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def memberRatings(d):
+    # the member's own ratings, which stand in for their rec scores. a title listed twice
+    # keeps its last score, and unrated titles don't count
+    userScores = {entry.mediaId: entry.score for entry in d["userList"]}
+    return {mediaId: score for mediaId, score in userScores.items() if score > 0}
+
+
+def foldScores(userData, strategy, weights):
+    # (media id -> recMedia, totals, counts) for every candidate, one combine call per
+    # member and title
+    combine = strategy.combine
+    candidates = {}
+    for d in userData:
+        for rec in d["list"]:
+            candidates[rec["recMedia"].id] = rec["recMedia"]
+
+    totals = dict.fromkeys(candidates, strategy.initial)
+    counts = dict.fromkeys(candidates, 0)
+    for d, weight in zip(userData, weights):
+        memberScores = {rec["recMedia"].id: rec["recScore"] for rec in d["list"]}
+        for mediaId, score in memberRatings(d).items():
+            if mediaId in candidates:
+                memberScores[mediaId] = score
+        for mediaId, score in memberScores.items():
+            totals[mediaId] = combine(totals[mediaId], score, weight)
+            counts[mediaId] += 1
+    return candidates, list(totals.values()), list(counts.values())
+
+
+def foldScoresVectorized(np, userData, strategy, weights):
+    # the same as foldScores for strategies with a fold: every candidate gets a column,
+    # in the order it was first recommended, and each member's scores are folded in at
+    # once. a title still gets its members' scores in member order, so the totals are
+    # the same floats, and totals that are a member's rating stay ints
+    getMedia, getScore = itemgetter("recMedia"), itemgetter("recScore")
+    getId = attrgetter("id")
+    allRecs = list(chain.from_iterable(d["list"] for d in userData))
+    if not allRecs:
+        return {}, [], []
+    allMedia = list(map(getMedia, allRecs))
+    allIds = np.fromiter(map(getId, allMedia), np.int64, len(allMedia))
+    ids, inverse = np.unique(allIds, return_inverse=True)
+    # where each title was first and last recommended
+    positions = np.arange(len(allIds))
+    first = np.full(len(ids), len(allIds), np.int64)
+    np.minimum.at(first, inverse, positions)
+    last = np.full(len(ids), -1, np.int64)
+    np.maximum.at(last, inverse, positions)
+    order = np.argsort(first)
+    column = np.empty(len(ids), np.int64)
+    column[order] = np.arange(len(ids))
+    # a title recommended twice keeps the recMedia it was last recommended with
+    candidates = dict(
+        zip(
+            ids[order].tolist(),
+            map(allMedia.__getitem__, last[order].tolist()),
+        )
+    )
+
+    totals = np.full(len(candidates), strategy.initial, dtype=np.float64)
+    counts = np.zeros(len(candidates), np.int64)
+    whole = np.zeros(len(candidates), bool)
+    # where each of the current member's titles is in their arrays, -1 for none
+    slot = np.full(len(candidates), -1, np.int64)
+    start = 0
+    for d, weight in zip(userData, weights):
+        end = start + len(d["list"])
+        columns = column[inverse[start:end]]
+        scores = np.fromiter(map(getScore, d["list"]), np.float64, len(d["list"]))
+        start = end
+        positions = np.arange(len(columns))
+        np.maximum.at(slot, columns, positions)
+        # a member's last rec for a title wins, like in a dict
+        lastRec = slot[columns] == positions
+        isRating = np.zeros(len(columns), bool)
+        ratings = memberRatings(d)
+        ratedIds = np.fromiter(ratings, np.int64, len(ratings))
+        ratedScores = np.fromiter(ratings.values(), np.float64, len(ratings))
+        # only ratings of candidates count
+        found = np.minimum(np.searchsorted(ids, ratedIds), len(ids) - 1)
+        isCandidate = ids[found] == ratedIds
+        ratedColumns = column[found[isCandidate]]
+        ratedScores = ratedScores[isCandidate]
+        # a rating replaces the member's rec score for the title, or adds one
+        recommended = slot[ratedColumns]
+        replacing = recommended >= 0
+        scores[recommended[replacing]] = ratedScores[replacing]
+        isRating[recommended[replacing]] = True
+        slot[columns] = -1
+        columns = np.concatenate([columns[lastRec], ratedColumns[~replacing]])
+        scores = np.concatenate([scores[lastRec], ratedScores[~replacing]])
+        isRating = np.concatenate([isRating[lastRec], np.ones((~replacing).sum(), bool)])
+
+        replaced = strategy.fold(totals, columns, scores, weight)
+        counts[columns] += 1
+        if replaced is not None:
+            whole[columns[replaced]] = isRating[replaced]
+    totals = [
+        int(total) if isWhole else total
+        for total, isWhole in zip(totals.tolist(), whole.tolist())
+    ]
+    return candidates, totals, counts.tolist()
+
+
+def generateGroupList(
+    userData, strategy="mean", weights=None, rewatch=False, limit=None
+):
+    # userData holds each member's scored recs ("list"), "userList" and "userIndex". a
+    # member's score for a title is their own rating if they gave one, otherwise their
+    # rec score for it. every index is built once per member, and members only visit the
+    # titles they have a score for, so the cost grows with the sum of the lists rather
+    # than members x candidates. strategies with a fold, like the built-in ones, do it
+    # with numpy when it's installed rather than call combine for every member and
+    # title. titles every member has already seen are left out unless rewatch is set.
+    # with a limit only the best `limit` titles are kept, picked through a heap instead
+    # of sorting every candidate
+    if isinstance(strategy, str):
+        strategy = STRATEGIES[strategy]
+    userCount = len(userData)
+    weights = weights or [1] * userCount
+
+    np = loadNumpy() if strategy.fold else None
+    if np is not None:
+        candidates, totals, counts = foldScoresVectorized(np, userData, strategy, weights)
+    else:
+        candidates, totals, counts = foldScores(userData, strategy, weights)
+
+    seenByAll = None
+    for d in userData:
+        seen = {
+            mediaId
+            for mediaId, entry in d["userIndex"].items()
+            if entry.status in SEEN_STATUSES
+        }
+        seenByAll = seen if seenByAll is None else seenByAll & seen
+
+    totalWeight = sum(weights)
+    finish = strategy.finish
+    scores = [
+        finish(total, count, userCount, totalWeight) for total, count in zip(totals, counts)
+    ]
+    kept = [
+        index
+        for index, mediaId in enumerate(candidates)
+        if rewatch or mediaId not in seenByAll
+    ]
+    # stable, so titles scored the same stay in the order they were first recommended
+    if limit is not None:
+        kept = heapq.nlargest(limit, kept, key=scores.__getitem__)
+    else:
+        kept.sort(key=scores.__getitem__, reverse=True)
+    media = list(candidates.values())
+    return [{"recScore": scores[index], "recMedia": media[index]} for index in kept]
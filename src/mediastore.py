@@ -0,0 +1,672 @@
+from array import array
+import hashlib
+import itertools
+import json
+import sqlite3
+import threading
+import time
+import constants
+from records import Entry, Media, internProperty, newPropertyTables
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    id INTEGER PRIMARY KEY,
+    title_english TEXT,
+    title_user_preferred TEXT,
+    format TEXT,
+    mean_score INTEGER,
+    popularity INTEGER,
+    start_year INTEGER,
+    has_recommendations INTEGER NOT NULL DEFAULT 0,
+    fetched_at REAL,
+    last_used REAL
+);
+CREATE INDEX IF NOT EXISTS media_last_used ON media (last_used);
+CREATE TABLE IF NOT EXISTS tags (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE IF NOT EXISTS staff (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE IF NOT EXISTS studios (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE IF NOT EXISTS media_genres (
+    media_id INTEGER, position INTEGER, genre TEXT, PRIMARY KEY (media_id, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS media_tags (
+    media_id INTEGER, position INTEGER, tag_id INTEGER, rank INTEGER,
+    PRIMARY KEY (media_id, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS media_staff (
+    media_id INTEGER, position INTEGER, staff_id INTEGER, PRIMARY KEY (media_id, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS media_studios (
+    media_id INTEGER, position INTEGER, studio_id INTEGER, PRIMARY KEY (media_id, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS recommendations (
+    media_id INTEGER, position INTEGER, rating INTEGER, recommendation_id INTEGER,
+    PRIMARY KEY (media_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS recommendations_target ON recommendations (recommendation_id);
+CREATE TABLE IF NOT EXISTS users (user_name TEXT PRIMARY KEY, fetched_on INTEGER);
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY, payload BLOB, size INTEGER, last_used REAL
+);
+CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+CREATE TABLE IF NOT EXISTS similar_media (
+    media_id INTEGER PRIMARY KEY, neighbours BLOB, built_at REAL
+);
+CREATE TABLE IF NOT EXISTS partial_chunks (
+    user_name TEXT, media_type TEXT, chunk INTEGER, entries TEXT, has_next_chunk INTEGER,
+    fetched_at REAL, PRIMARY KEY (user_name, media_type, chunk)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS list_entries (
+    user_name TEXT, position INTEGER, media_id INTEGER, score INTEGER, status TEXT,
+    updated_at INTEGER, PRIMARY KEY (user_name, position)
+) WITHOUT ROWID;
+"""
+
+# a connection belongs to the thread that opened it, and scoring runs off the event
+# loop's thread
+stores = threading.local()
+
+
+def getStore():
+    # one lazily opened connection per thread
+    connection = getattr(stores, "connection", None)
+    if connection is None:
+        connection = stores.connection = sqlite3.connect(constants.STORE_FILE)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(media)")}
+        if columns and "last_used" not in columns:
+            connection.execute("ALTER TABLE media ADD COLUMN last_used REAL")
+        connection.executescript(SCHEMA)
+    return connection
+
+
+def closeStore():
+    # the next getStore on this thread opens constants.STORE_FILE again
+    connection = getattr(stores, "connection", None)
+    if connection is not None:
+        connection.close()
+        stores.connection = None
+
+
+def batches(items):
+    iterator = iter(items)
+    while batch := list(itertools.islice(iterator, constants.STORE_BATCH_SIZE)):
+        yield batch
+
+
+def saveMedia(conn, mediaList):
+    # upsert media rows and replace their genres, tags, staff and studios. fields missing
+    # from a payload (top level media have no format, recs have no recommendations) keep
+    # whatever an earlier payload stored
+    now = time.time()
+    mediaById = {}
+    for media in mediaList:
+        mediaById[media["id"]] = {**mediaById.get(media["id"], {}), **media}
+    ids = [(mediaId,) for mediaId in mediaById]
+    conn.executemany(
+        """INSERT INTO media (id, title_english, title_user_preferred, format, mean_score,
+            popularity, start_year, fetched_at, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET
+            title_english = excluded.title_english,
+            title_user_preferred = excluded.title_user_preferred,
+            format = COALESCE(excluded.format, media.format),
+            mean_score = excluded.mean_score,
+            popularity = excluded.popularity,
+            start_year = excluded.start_year,
+            fetched_at = excluded.fetched_at,
+            last_used = excluded.last_used""",
+        [
+            (
+                media["id"],
+                media["title"]["english"],
+                media["title"]["userPreferred"],
+                media.get("format"),
+                media.get("meanScore"),
+                media["popularity"],
+                (media.get("startDate") or {}).get("year"),
+                now,
+                now,
+            )
+            for media in mediaById.values()
+        ],
+    )
+    for table in ["media_genres", "media_tags", "media_staff", "media_studios"]:
+        conn.executemany(f"DELETE FROM {table} WHERE media_id = ?", ids)
+    conn.executemany(
+        "INSERT INTO media_genres VALUES (?, ?, ?)",
+        [
+            (media["id"], position, genre)
+            for media in mediaById.values()
+            for position, genre in enumerate(media["genres"])
+        ],
+    )
+    tags = [(media["id"], tag) for media in mediaById.values() for tag in media["tags"]]
+    conn.executemany(
+        "INSERT OR REPLACE INTO tags VALUES (?, ?)", [(t["id"], t["name"]) for _, t in tags]
+    )
+    conn.executemany(
+        "INSERT INTO media_tags VALUES (?, ?, ?, ?)",
+        [
+            (media["id"], position, tag["id"], tag["rank"])
+            for media in mediaById.values()
+            for position, tag in enumerate(media["tags"])
+        ],
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO staff VALUES (?, ?)",
+        [
+            (staff["id"], staff["name"]["userPreferred"])
+            for media in mediaById.values()
+            for staff in media["staff"]["nodes"]
+        ],
+    )
+    conn.executemany(
+        "INSERT INTO media_staff VALUES (?, ?, ?)",
+        [
+            (media["id"], position, staff["id"])
+            for media in mediaById.values()
+            for position, staff in enumerate(media["staff"]["nodes"])
+        ],
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO studios VALUES (?, ?)",
+        [
+            (studio["id"], studio["name"])
+            for media in mediaById.values()
+            for studio in media["studios"]["nodes"]
+        ],
+    )
+    conn.executemany(
+        "INSERT INTO media_studios VALUES (?, ?, ?)",
+        [
+            (media["id"], position, studio["id"])
+            for media in mediaById.values()
+            for position, studio in enumerate(media["studios"]["nodes"])
+        ],
+    )
+
+    withRecommendations = [m for m in mediaById.values() if "recommendations" in m]
+    conn.executemany(
+        "DELETE FROM recommendations WHERE media_id = ?",
+        [(media["id"],) for media in withRecommendations],
+    )
+    conn.executemany(
+        "INSERT INTO recommendations VALUES (?, ?, ?, ?)",
+        [
+            (
+                media["id"],
+                position,
+                rec["rating"],
+                rec["mediaRecommendation"]["id"] if rec["mediaRecommendation"] else None,
+            )
+            for media in withRecommendations
+            for position, rec in enumerate(media["recommendations"]["nodes"])
+        ],
+    )
+    conn.executemany(
+        "UPDATE media SET has_recommendations = 1 WHERE id = ?",
+        [(media["id"],) for media in withRecommendations],
+    )
+
+
+def withRecommendedMedia(mediaList):
+    # recommended media first, so the listed payloads (which have the edges) merge on top
+    return [
+        rec["mediaRecommendation"]
+        for media in mediaList
+        for rec in media.get("recommendations", {"nodes": []})["nodes"]
+        if rec["mediaRecommendation"]
+    ] + list(mediaList)
+
+
+def saveMediaDetails(mediaList):
+    # media fetched with their recommendation edges, along with the recommended media.
+    # media fetched without them keep the edges stored before
+    conn = getStore()
+    with conn:
+        saveMedia(conn, withRecommendedMedia(mediaList))
+        evictMedia(conn)
+
+
+def freshMediaIds(mediaIds, maxAge, withRecommendations=True):
+    # ids cached within maxAge seconds, that have their recommendation edges cached
+    # unless withRecommendations is False
+    conn = getStore()
+    minFetchedAt = 0 if maxAge is None else time.time() - maxAge
+    edgesWanted = 1 if withRecommendations else 0
+    fresh = set()
+    for batch in batches(list(dict.fromkeys(mediaIds))):
+        placeholders = ",".join("?" * len(batch))
+        fresh.update(
+            row[0]
+            for row in conn.execute(
+                f"""SELECT id FROM media WHERE has_recommendations >= ?
+                AND fetched_at >= ? AND id IN ({placeholders})""",
+                [edgesWanted, minFetchedAt, *batch],
+            )
+        )
+    return fresh
+
+
+def userListLacksRecommendations(userName: str):
+    # whether titles on the cached list were fetched without their recommendation edges,
+    # e.g. for --candidates similar, or lost them to eviction
+    return (
+        getStore().execute(
+            """SELECT 1 FROM list_entries JOIN media ON media.id = list_entries.media_id
+            WHERE list_entries.user_name = ? AND media.has_recommendations = 0 LIMIT 1""",
+            (userName,),
+        ).fetchone()
+        is not None
+    )
+
+
+def touchMedia(conn, mediaIds):
+    now = time.time()
+    conn.executemany(
+        "UPDATE media SET last_used = ? WHERE id = ?",
+        [(now, mediaId) for mediaId in mediaIds],
+    )
+
+
+def evictMedia(conn, maxEntries=None):
+    # drop the least recently used media once the store grows past maxEntries. titles on
+    # someone's list and the titles they recommend are never evicted, and media whose
+    # edges pointed at an evicted title lose their edges so they get fetched again
+    maxEntries = constants.MEDIA_CACHE_MAX_ENTRIES if maxEntries is None else maxEntries
+    (count,) = conn.execute("SELECT COUNT(*) FROM media").fetchone()
+    if count <= maxEntries:
+        return 0
+    evicted = [
+        row[0]
+        for row in conn.execute(
+            """SELECT id FROM media
+            WHERE id NOT IN (SELECT media_id FROM list_entries)
+            AND id NOT IN (
+                SELECT recommendation_id FROM recommendations
+                WHERE media_id IN (SELECT media_id FROM list_entries)
+            )
+            ORDER BY last_used LIMIT ?""",
+            (count - maxEntries,),
+        )
+    ]
+    for batch in batches(evicted):
+        placeholders = ",".join("?" * len(batch))
+        conn.execute(
+            f"""UPDATE media SET has_recommendations = 0 WHERE id IN (
+                SELECT media_id FROM recommendations
+                WHERE recommendation_id IN ({placeholders})
+            )""",
+            batch,
+        )
+        conn.execute(
+            f"""DELETE FROM recommendations WHERE media_id IN (
+                SELECT id FROM media WHERE has_recommendations = 0
+            ) OR media_id IN ({placeholders})""",
+            batch,
+        )
+        for table in ["media_genres", "media_tags", "media_staff", "media_studios"]:
+            conn.execute(f"DELETE FROM {table} WHERE media_id IN ({placeholders})", batch)
+        conn.execute(f"DELETE FROM media WHERE id IN ({placeholders})", batch)
+    return len(evicted)
+
+
+def saveUserList(userName: str, entries, fetchedOn: int, withMedia=False):
+    # list entries only reference media by id. withMedia also stores the media payloads
+    # nested in the entries, for lists that didn't come through saveMediaDetails.
+    # entries can be any iterable and are written a batch at a time
+    conn = getStore()
+    with conn:
+        conn.execute("DELETE FROM list_entries WHERE user_name = ?", (userName,))
+        position = 0
+        for batch in batches(entries):
+            if withMedia:
+                saveMedia(conn, withRecommendedMedia([entry["media"] for entry in batch]))
+            conn.executemany(
+                "INSERT INTO list_entries VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        userName,
+                        position + offset,
+                        entry["media"]["id"],
+                        entry["score"],
+                        entry.get("status"),
+                        entry.get("updatedAt"),
+                    )
+                    for offset, entry in enumerate(batch)
+                ],
+            )
+            position += len(batch)
+        conn.execute(
+            "INSERT OR REPLACE INTO users VALUES (?, ?)", (userName, int(fetchedOn))
+        )
+        # the list is complete, so the chunks an interrupted fetch kept are done with
+        conn.execute("DELETE FROM partial_chunks WHERE user_name = ?", (userName,))
+        evictMedia(conn)
+
+
+def savePartialChunk(
+    userName: str, mediaType: str, chunk: int, entries, hasNextChunk: bool
+):
+    # one chunk of a list being fetched, so a fetch that fails halfway can resume
+    conn = getStore()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO partial_chunks VALUES (?, ?, ?, ?, ?, ?)",
+            (userName, mediaType, chunk, json.dumps(entries), int(hasNextChunk), time.time()),
+        )
+
+
+def clearPartialChunks(userName: str):
+    # once every chunk of a list is in, a later fetch has to ask for the list again
+    conn = getStore()
+    with conn:
+        conn.execute("DELETE FROM partial_chunks WHERE user_name = ?", (userName,))
+
+
+def loadPartialChunks(userName: str, mediaType: str, maxAge: float):
+    # chunk -> (entries, hasNextChunk) kept by an earlier fetch of this list. once the
+    # oldest is older than maxAge seconds, chunks fetched since may not line up with it
+    # anymore, so they're all dropped
+    conn = getStore()
+    with conn:
+        conn.execute(
+            """DELETE FROM partial_chunks WHERE user_name = ? AND media_type = ?
+            AND (
+                SELECT MIN(fetched_at) FROM partial_chunks
+                WHERE user_name = ? AND media_type = ?
+            ) < ?""",
+            (userName, mediaType, userName, mediaType, time.time() - maxAge),
+        )
+    return {
+        chunk: (json.loads(entries), bool(hasNextChunk))
+        for chunk, entries, hasNextChunk in conn.execute(
+            """SELECT chunk, entries, has_next_chunk FROM partial_chunks
+            WHERE user_name = ? AND media_type = ? ORDER BY chunk""",
+            (userName, mediaType),
+        )
+    }
+
+
+def userContentHash(userName: str):
+    # changes whenever the user's list changes or any title on it, or recommended from
+    # it, is stored again
+    conn = getStore()
+    digest = hashlib.sha256()
+    digest.update(
+        repr(
+            conn.execute(
+                """SELECT media_id, score, status, updated_at FROM list_entries
+                WHERE user_name = ? ORDER BY position""",
+                (userName,),
+            ).fetchall()
+        ).encode()
+    )
+    digest.update(
+        repr(
+            conn.execute(
+                """SELECT COUNT(*), MAX(fetched_at) FROM media
+                WHERE id IN (SELECT media_id FROM list_entries WHERE user_name = ?)
+                OR id IN (
+                    SELECT recommendation_id FROM recommendations
+                    WHERE media_id IN (SELECT media_id FROM list_entries WHERE user_name = ?)
+                )""",
+                (userName, userName),
+            ).fetchone()
+        ).encode()
+    )
+    return digest.hexdigest()
+
+
+def loadResult(key: str):
+    conn = getStore()
+    row = conn.execute("SELECT payload FROM results WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    with conn:
+        conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+    return row[0]
+
+
+def saveResult(key: str, payload: bytes):
+    conn = getStore()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+            (key, payload, len(payload), time.time()),
+        )
+        evictResults(conn)
+
+
+def evictResults(conn, maxBytes=None):
+    # drop the least recently used results once together they're bigger than maxBytes
+    maxBytes = constants.RESULT_CACHE_MAX_BYTES if maxBytes is None else maxBytes
+    (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()
+    evicted = []
+    if total > maxBytes:
+        for key, size in conn.execute("SELECT key, size FROM results ORDER BY last_used"):
+            evicted.append((key,))
+            total -= size
+            if total <= maxBytes:
+                break
+    conn.executemany("DELETE FROM results WHERE key = ?", evicted)
+    return len(evicted)
+
+
+def iterScoredLists():
+    # (user name, [(media id, score)]) for every cached list, scored entries only
+    rows = getStore().execute(
+        """SELECT user_name, media_id, score FROM list_entries
+        WHERE score > 0 ORDER BY user_name, position"""
+    )
+    for userName, group in itertools.groupby(rows, key=lambda row: row[0]):
+        yield userName, [(mediaId, score) for _, mediaId, score in group]
+
+
+def packNeighbours(neighbours):
+    # [(media id, similarity)] as every id followed by every similarity, 8 bytes each
+    return (
+        array("i", [mediaId for mediaId, _ in neighbours]).tobytes()
+        + array("f", [similarity for _, similarity in neighbours]).tobytes()
+    )
+
+
+def unpackNeighbours(blob):
+    ids = array("i")
+    similarities = array("f")
+    half = len(blob) // 2
+    ids.frombytes(blob[:half])
+    similarities.frombytes(blob[half:])
+    return tuple(zip(ids, similarities))
+
+
+def saveSimilarMedia(neighboursById):
+    # replaces the whole index, see similarity.py
+    conn = getStore()
+    now = time.time()
+    with conn:
+        conn.execute("DELETE FROM similar_media")
+        for batch in batches(neighboursById.items()):
+            conn.executemany(
+                "INSERT INTO similar_media VALUES (?, ?, ?)",
+                [
+                    (mediaId, packNeighbours(neighbours), now)
+                    for mediaId, neighbours in batch
+                ],
+            )
+
+
+def loadSimilarMediaForUser(userName: str):
+    # media id -> ((neighbour id, similarity), ...) for the titles on the user's list
+    rows = getStore().execute(
+        """SELECT media_id, neighbours FROM similar_media
+        WHERE media_id IN (SELECT media_id FROM list_entries WHERE user_name = ?)""",
+        (userName,),
+    )
+    return {mediaId: unpackNeighbours(blob) for mediaId, blob in rows}
+
+
+def similarMediaVersion():
+    # changes whenever the index is rebuilt
+    return getStore().execute(
+        "SELECT COUNT(*), MAX(built_at) FROM similar_media"
+    ).fetchone()
+
+
+def userFetchedOn(userName: str):
+    row = getStore().execute(
+        "SELECT fetched_on FROM users WHERE user_name = ?", (userName,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def loadMedia(mediaIds, mediaCache=None, withRecommendations=True, properties=None):
+    # build records.Media for the given ids. every id maps to a single shared Media and
+    # every tag, staff member and studio to a single shared Property (see
+    # records.newPropertyTables), so a title recommended from many entries is only held
+    # in memory once
+    conn = getStore()
+    mediaCache = {} if mediaCache is None else mediaCache
+    properties = newPropertyTables() if properties is None else properties
+    tags, staff, studios = properties["tags"], properties["staff"], properties["studios"]
+    genres = properties["genres"]
+    missing = [mediaId for mediaId in dict.fromkeys(mediaIds) if mediaId not in mediaCache]
+    for batch in batches(missing):
+        placeholders = ",".join("?" * len(batch))
+        found = {}
+        for row in conn.execute(
+            f"""SELECT id, title_english, title_user_preferred, format, mean_score,
+                popularity, start_year FROM media
+            WHERE id IN ({placeholders})""",
+            batch,
+        ):
+            found[row[0]] = (row, [], [], [], [], [])
+        placeholders = ",".join("?" * len(found))
+        for mediaId, genre in conn.execute(
+            f"""SELECT media_id, genre FROM media_genres WHERE media_id IN ({placeholders})
+            ORDER BY media_id, position""",
+            list(found),
+        ):
+            found[mediaId][1].append(genres.setdefault(genre, genre))
+        for mediaId, tagId, rank, name in conn.execute(
+            f"""SELECT media_id, tag_id, rank, name FROM media_tags JOIN tags ON tags.id = tag_id
+            WHERE media_id IN ({placeholders}) ORDER BY media_id, position""",
+            list(found),
+        ):
+            found[mediaId][2].append(internProperty(tags, tagId, name))
+            found[mediaId][3].append(rank)
+        for mediaId, staffId, name in conn.execute(
+            f"""SELECT media_id, staff_id, name FROM media_staff JOIN staff ON staff.id = staff_id
+            WHERE media_id IN ({placeholders}) ORDER BY media_id, position""",
+            list(found),
+        ):
+            found[mediaId][4].append(internProperty(staff, staffId, name))
+        for mediaId, studioId, name in conn.execute(
+            f"""SELECT media_id, studio_id, name FROM media_studios
+            JOIN studios ON studios.id = studio_id
+            WHERE media_id IN ({placeholders}) ORDER BY media_id, position""",
+            list(found),
+        ):
+            found[mediaId][5].append(internProperty(studios, studioId, name))
+        for mediaId in batch:
+            if mediaId not in found:
+                continue
+            row, mediaGenres, mediaTags, tagRanks, mediaStaff, mediaStudios = found[mediaId]
+            mediaCache[mediaId] = Media(
+                id=mediaId,
+                titleEnglish=row[1],
+                titleUserPreferred=row[2],
+                format=row[3],
+                meanScore=row[4],
+                popularity=row[5],
+                year=row[6],
+                genres=tuple(mediaGenres),
+                tags=tuple(mediaTags),
+                tagRanks=tuple(tagRanks),
+                staff=tuple(mediaStaff),
+                studios=tuple(mediaStudios),
+            )
+
+    if withRecommendations:
+        candidates = [
+            mediaId
+            for mediaId in dict.fromkeys(mediaIds)
+            if mediaId in mediaCache and mediaCache[mediaId].recommendations is None
+        ]
+        edges = loadRecommendationEdges(candidates)
+        recMedia = loadMedia(
+            [recId for recs in edges.values() for _, recId in recs if recId is not None],
+            mediaCache=mediaCache,
+            withRecommendations=False,
+            properties=properties,
+        )
+        for mediaId, recs in edges.items():
+            mediaCache[mediaId].recommendations = tuple(
+                (rating, recMedia.get(recId) if recId else None) for rating, recId in recs
+            )
+
+    return mediaCache
+
+
+def loadRecommendationEdges(mediaIds):
+    # media id -> [(rating, recommendation id)] in AniList's order, for the given titles
+    # whose edges are stored. recommendation ids can be None
+    conn = getStore()
+    withEdges = []
+    for batch in batches(mediaIds):
+        placeholders = ",".join("?" * len(batch))
+        withEdges += [
+            row[0]
+            for row in conn.execute(
+                f"""SELECT id FROM media
+                WHERE has_recommendations = 1 AND id IN ({placeholders})""",
+                batch,
+            )
+        ]
+    edges = {mediaId: [] for mediaId in withEdges}
+    for batch in batches(withEdges):
+        placeholders = ",".join("?" * len(batch))
+        for mediaId, rating, recId in conn.execute(
+            f"""SELECT media_id, rating, recommendation_id FROM recommendations
+            WHERE media_id IN ({placeholders}) ORDER BY media_id, position""",
+            batch,
+        ):
+            edges[mediaId].append((rating, recId))
+    return edges
+
+
+def recommendationGraphVersion():
+    # changes whenever any title's recommendations are stored again
+    return getStore().execute(
+        "SELECT COUNT(*), MAX(fetched_at) FROM media WHERE has_recommendations = 1"
+    ).fetchone()
+
+
+def iterUserList(userName: str, withRecommendations=True):
+    # records.Entry for every title, hydrated a batch at a time so only one batch of
+    # media is alive at once unless the caller keeps them. properties are shared by the
+    # whole list
+    conn = getStore()
+    rows = conn.execute(
+        """SELECT media_id, score, status, updated_at FROM list_entries
+        WHERE user_name = ? ORDER BY position""",
+        (userName,),
+    ).fetchall()
+    properties = newPropertyTables()
+    for batch in batches(rows):
+        mediaById = loadMedia(
+            [row[0] for row in batch],
+            withRecommendations=withRecommendations,
+            properties=properties,
+        )
+        with conn:
+            touchMedia(conn, mediaById.keys())
+        for mediaId, score, status, updatedAt in batch:
+            if mediaId in mediaById:
+                yield Entry(
+                    mediaId=mediaId,
+                    score=score,
+                    status=status,
+                    updatedAt=updatedAt,
+                    media=mediaById[mediaId],
+                )
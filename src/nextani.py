@@ -1,7 +1,22 @@
 import argparse
+import asyncio
+import itertools
+import sys
+import time
 
-from algorithm import generateJointList, getRecommendationList
-from output import writeRecList
+from algorithm import CANDIDATE_SOURCES, numpyBackendAvailable, unwatchedRecs
+import constants
+from group import STRATEGIES, generateGroupList
+from output import WRITERS, availableFormats, writeRecList
+from pipeline import runPipelineAsync
+import profiling
+
+
+def parseWeights(value):
+    try:
+        return [float(weight) for weight in value.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid weights: {value}")
 
 
 parser = argparse.ArgumentParser()
@@ -13,7 +28,13 @@ parser.add_argument(
 parser.add_argument(
     "-r",
     "--refresh",
-    help="Force refresh user data from anilist's servers. This may take a while. Note if no cached data exists for the given user, this will happen anyway",
+    help=f"Force refresh the user's list from anilist's servers. Titles fetched less than {constants.MEDIA_TTL_S // (24 * 60 * 60)} days ago are reused; only new and older titles are downloaded again. This may take a while. Note if no cached data exists for the given user, this will happen anyway",
+    action="store_true",
+)
+parser.add_argument(
+    "-i",
+    "--incremental",
+    help="When refreshing, reuse every cached title no matter how old and only fetch titles that aren't cached yet. Scores and statuses are still updated for every title",
     action="store_true",
 )
 parser.add_argument(
@@ -40,13 +61,125 @@ parser.add_argument(
     help="Use common genres in the recommendation algorithm",
     action="store_true",
 )
-args = parser.parse_args()
+parser.add_argument(
+    "--backend",
+    help="Scoring backend. numpy scores all recommendations in one batched pass and requires numpy and scipy",
+    choices=["python", "numpy"],
+    default="python",
+)
+parser.add_argument(
+    "--candidates",
+    help="Where recs come from: AniList's recommendations, titles that users in the cache scored like the ones on your list (build that index with nextani.py index first), or both",
+    choices=list(CANDIDATE_SOURCES.keys()),
+    default="recs",
+)
+parser.add_argument(
+    "--expand",
+    help="Also recommend titles up to this many recommendations away from your list (2 or 3), walking the recommendations already in the cache without fetching more. Lists of other users in the cache make for a bigger graph",
+    type=int,
+    choices=[1, 2, 3],
+    default=1,
+)
+parser.add_argument(
+    "-j",
+    "--jobs",
+    help="Number of processes used to score users in parallel. Defaults to one per user, up to the number of cpus",
+    type=int,
+)
+parser.add_argument(
+    "-l",
+    "--limit",
+    help="Only rank and write the best N recommendations of each list",
+    type=int,
+)
+parser.add_argument(
+    "--no-result-cache",
+    help="Score every list again rather than reusing the result of an earlier run with the same list and options",
+    dest="resultCache",
+    action="store_false",
+)
+parser.add_argument(
+    "-o",
+    "--format",
+    help="Format of the recs files: human readable text, JSON Lines, CSV or msgpack (requires msgpack)",
+    choices=list(WRITERS.keys()),
+    default="text",
+)
+parser.add_argument(
+    "-p",
+    "--properties",
+    help="Also write what your ratings say about each tag, studio, genre, decade and staff member to [username]-[property].txt",
+    action="store_true",
+)
+parser.add_argument(
+    "--group-strategy",
+    help="How a joint list combines the users' scores: their mean, the lowest one (least misery), or a mean weighted by --weights",
+    choices=list(STRATEGIES.keys()),
+    default="mean",
+)
+parser.add_argument(
+    "--weights",
+    help="Comma separated weights, one per username in the same order, for --group-strategy weighted. e.g. 2,1,1",
+    type=parseWeights,
+)
+parser.add_argument(
+    "--profile",
+    help="Print how long each stage took, peak memory and counters such as requests, retries and cache hits",
+    action="store_true",
+)
+parser.add_argument(
+    "--profile-trace",
+    help="With --profile, also write every timed stage to this file as a chrome trace (chrome://tracing or ui.perfetto.dev), with the summary in otherData",
+    metavar="FILE",
+)
+parser.add_argument(
+    "--profile-cprofile",
+    help="With --profile, also run the scoring stages under cProfile and dump the stats to this file, e.g. for snakeviz or python -m pstats",
+    metavar="FILE",
+)
 
-userData = [{"userName": n, "list": [], "origins": {}} for n in args.userNames]
 
-for index, userName in enumerate(args.userNames):
-    tempList, tempOrigins, tempUserList = getRecommendationList(
-        userName=userName,
+def writeUserRecList(userName, result, limit=None, outputFormat="text", directory="."):
+    tempList, tempOrigins, tempUserList, tempUserIndex = result
+    # the list comes ranked, so filtering lazily stops as soon as the limit is reached
+    with profiling.stage("write", user=userName):
+        writeRecList(
+            userNames=[userName],
+            finalRecs=itertools.islice(unwatchedRecs(tempList, tempUserIndex), limit),
+            origins=[tempOrigins],
+            outputFormat=outputFormat,
+            directory=directory,
+        )
+
+
+def validateArgs(args, error=parser.error):
+    if args.backend == "numpy" and not numpyBackendAvailable():
+        error("the numpy backend requires numpy and scipy to be installed")
+    if args.jobs is not None and args.jobs < 1:
+        error("--jobs must be at least 1")
+    if args.limit is not None and args.limit < 1:
+        error("--limit must be at least 1")
+    if args.format not in availableFormats():
+        error(f"the {args.format} format requires {args.format} to be installed")
+    if (args.profile_trace or args.profile_cprofile) and not args.profile:
+        error("--profile-trace and --profile-cprofile need --profile")
+    if args.weights is not None:
+        if args.group_strategy != "weighted":
+            error("--weights only applies to --group-strategy weighted")
+        if len(args.weights) != len(args.userNames):
+            error("--weights needs exactly one weight per username")
+        if any(weight < 0 for weight in args.weights) or sum(args.weights) <= 0:
+            error("--weights must not be negative and must not all be 0")
+
+
+async def recommendAsync(args, directory=".", **shared):
+    # writes every user's recs, and the joint list for several users, into directory.
+    # shared is passed on to runPipelineAsync, e.g. a limiter shared with other runs
+    userData = [{"userName": n, "list": [], "origins": {}} for n in args.userNames]
+
+    # users are fetched and scored side by side; each list is written as soon as it's done
+    results = await runPipelineAsync(
+        userNames=args.userNames,
         use={
             "tags": args.tags,
             "staff": args.staff,
@@ -55,40 +188,86 @@ for index, userName in enumerate(args.userNames):
             "decades": True,
         },
         refresh=args.refresh,
+        backend=args.backend,
+        incremental=args.incremental,
+        jobs=args.jobs,
+        onResult=lambda userName, result: writeUserRecList(
+            userName=userName,
+            result=result,
+            limit=args.limit,
+            outputFormat=args.format,
+            directory=directory,
+        ),
+        limit=args.limit,
+        propertyFiles=args.properties,
+        resultCache=args.resultCache,
+        candidates=args.candidates,
+        expand=args.expand,
+        directory=directory,
+        **shared,
     )
-    writeRecList(
-        userNames=[userName],
-        finalRecs=[
-            rec
-            for rec in sorted(tempList, key=lambda x: -x["recScore"])
-            if not {a["media"]["id"]: a["status"] for a in tempUserList}.get(
-                rec["recMedia"]["id"], ""
-            )
-            in {"COMPLETED", "REPEATING", "DROPPED", "CURRENT"}
-        ],
-        origins=[tempOrigins],
-    )
-    userData[index]["list"] = tempList
-    userData[index]["origins"] = tempOrigins
-    userData[index]["userList"] = tempUserList
-
-if len(args.userNames) > 1:
-    rewatch = False
-    writeRecList(
-        userNames=[d["userName"] for d in userData],
-        finalRecs=[
-            r
-            for r in sorted(
-                generateJointList(userData=userData), key=lambda x: -x["recScore"]
+    for index, (tempList, tempOrigins, tempUserList, tempUserIndex) in enumerate(results):
+        userData[index]["list"] = tempList
+        userData[index]["origins"] = tempOrigins
+        userData[index]["userList"] = tempUserList
+        userData[index]["userIndex"] = tempUserIndex
+
+    if len(args.userNames) > 1:
+        with profiling.stage("group"):
+            groupList = generateGroupList(
+                userData=userData,
+                strategy=args.group_strategy,
+                weights=args.weights,
+                rewatch=False,
+                limit=args.limit,
             )
-            if rewatch
-            or not all(
-                u.get(r["recMedia"]["id"], "") in {"COMPLETED", "REPEATING", "DROPPED"}
-                for u in [
-                    {a["media"]["id"]: a["status"] for a in b}
-                    for b in [d["userList"] for d in userData]
-                ]
+        with profiling.stage("write", user="group"):
+            writeRecList(
+                userNames=[d["userName"] for d in userData],
+                finalRecs=groupList,
+                origins=[d["origins"] for d in userData],
+                outputFormat=args.format,
+                directory=directory,
             )
-        ],
-        origins=[d["origins"] for d in userData],
-    )
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # "nextani.py serve" runs the http service instead, "nextani.py index" builds the
+    # similar titles index and "nextani.py batch" runs a manifest of users. "nextani.py
+    # -- serve" still means the user called serve
+    if argv[:1] == ["serve"]:
+        import server
+
+        server.main(argv[1:])
+        return
+    if argv[:1] == ["index"]:
+        import similarity
+
+        similarity.main(argv[1:])
+        return
+    if argv[:1] == ["batch"]:
+        import batch
+
+        sys.exit(batch.main(argv[1:]))
+    args = parser.parse_args(argv)
+    validateArgs(args)
+
+    if args.profile:
+        profiler = profiling.enable(cprofile=bool(args.profile_cprofile))
+    start = time.perf_counter()
+
+    asyncio.run(recommendAsync(args))
+
+    if args.profile:
+        wallTime = time.perf_counter() - start
+        profiling.disable()
+        profiling.printSummary(profiler, wallTime=wallTime)
+        if args.profile_trace:
+            profiling.writeTrace(profiler, args.profile_trace, wallTime=wallTime)
+        if args.profile_cprofile:
+            profiling.writeCProfile(profiler, args.profile_cprofile)
+
+
+if __name__ == "__main__":
+    main()
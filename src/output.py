@@ -1,67 +1,202 @@
+import csv
+import io
+import json
+import os
 import constants
+from records import Property
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
-def generateOriginStringForType(media, origins, userName=None):
-    string = f"\t{userName}\n" if userName else ""
-    for angle, text in constants.ANGLES.items():
-        if media["id"] not in origins:
-            continue
-        if angle not in origins[media["id"]]:
+
+def originName(origin):
+    # origins are titles and genres (strings), or records.Property
+    if isinstance(origin, str):
+        return origin
+    if isinstance(origin, Property):
+        return origin.name
+    return ""
+
+
+def propertyName(origin):
+    return origin.name
+
+
+# angle -> how to name one of its origins, skipping the checks originName has to make
+ORIGIN_NAMES = {
+    "media": lambda origin: origin,
+    "tags": propertyName,
+    "studios": propertyName,
+    "staff": propertyName,
+    "genres": lambda origin: origin,
+}
+
+
+def describeOrigins(media, origins):
+    # (angle, names) pairs explaining why a title was recommended, in constants.ANGLES
+    # order. names are display strings, except for userRating where it's the score
+    described = []
+    mediaOrigins = origins.get(media.id)
+    if not mediaOrigins:
+        return described
+    for angle in constants.ANGLES:
+        if angle not in mediaOrigins:
             continue
 
         if angle == "userRating":
-            userRating = list(origins[media["id"]][angle].values())[0]
+            userRating = next(iter(mediaOrigins[angle].values()))
             if userRating > 0:
-                string += f"\tYou {text} {userRating}%\n"
+                described.append((angle, [userRating]))
             continue
 
-        string += f"\t{text} "
-        for origin in origins[media["id"]][angle].values():
-            if angle == "decades":
-                string += f"{origin}s"
-                return string + "\n"
-            name = ""
-            if "title" in origin:
-                name = getEnglishTitleOrUserPreferred(origin["title"])
-            elif "name" in origin:
-                name = (
-                    origin["name"]
-                    if isinstance(origin["name"], str)
-                    else origin["name"]["userPreferred"]
+        if angle == "decades":
+            decade = next(iter(mediaOrigins[angle].values()))
+            described.append((angle, [f"{decade}s"]))
+            break
+
+        nameOf = ORIGIN_NAMES.get(angle, originName)
+        names = [nameOf(origin) for origin in mediaOrigins[angle].values()]
+        described.append((angle, names))
+    return described
+
+
+def generateOriginStringForType(media, origins, userName=None):
+    parts = [f"\t{userName}\n"] if userName else []
+    for angle, names in describeOrigins(media=media, origins=origins):
+        text = constants.ANGLES[angle]
+        if angle == "userRating":
+            parts.append(f"\tYou {text} {names[0]}%\n")
+        else:
+            parts.append(f"\t{text} {', '.join(names)}\n")
+    return "".join(parts)
+
+
+def recordForRec(rank, rec, origins, userNames):
+    # one rec as plain data, for the machine-readable formats
+    media = rec["recMedia"]
+    return {
+        "rank": rank,
+        "id": media.id,
+        "title": media.title,
+        "format": media.format,
+        "year": media.year,
+        "score": rec["recScore"],
+        "meanScore": media.meanScore,
+        "origins": {
+            userName: dict(describeOrigins(media=media, origins=userOrigins))
+            for userName, userOrigins in zip(userNames, origins)
+        },
+    }
+
+
+def iterRecords(finalRecs, origins, userNames):
+    for rank, rec in enumerate(finalRecs, start=1):
+        yield recordForRec(rank=rank, rec=rec, origins=origins, userNames=userNames)
+
+
+def writeTextRecList(f, finalRecs, origins, userNames):
+    # the whole list is built in memory and written in one go
+    parts = []
+    for rec in finalRecs:
+        media = rec["recMedia"]
+        parts.append(f"{media.title} ({media.format}, {media.year}): {rec['recScore']}%\n")
+        parts.append(f"\tother users rated it {media.meanScore}%\n\n")
+
+        for i in range(len(userNames)):
+            parts.append(
+                generateOriginStringForType(
+                    media=media, origins=origins[i], userName=userNames[i]
                 )
-            elif type(origin) == str:
-                name = origin
-            string += f"{name}, "
-        string = string[:-2] + "\n"
-    return string
+            )
+            parts.append("\n")
+    f.write("".join(parts))
+
+
+def writeJsonLinesRecList(f, finalRecs, origins, userNames):
+    f.write(
+        "".join(
+            json.dumps(record, ensure_ascii=False) + "\n"
+            for record in iterRecords(finalRecs, origins, userNames)
+        )
+    )
+
 
+def writeCsvRecList(f, finalRecs, origins, userNames):
+    # one column per user and angle, with names joined by "|"
+    originColumns = [
+        (userName, angle) for userName in userNames for angle in constants.ANGLES
+    ]
+    columns = ["rank", "id", "title", "format", "year", "score", "meanScore"]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(
+        columns + [f"{userName}.{angle}" for userName, angle in originColumns]
+    )
+    for record in iterRecords(finalRecs, origins, userNames):
+        writer.writerow(
+            [record[key] for key in columns]
+            + [
+                "|".join(map(str, record["origins"][userName].get(angle, [])))
+                for userName, angle in originColumns
+            ]
+        )
+    f.write(buffer.getvalue())
 
-def getEnglishTitleOrUserPreferred(title):
-    return title["english"] if title["english"] else title["userPreferred"]
 
+def writeMsgpackRecList(f, finalRecs, origins, userNames):
+    # a stream of msgpack maps, one per rec, readable with msgpack.Unpacker
+    packer = msgpack.Packer()
+    f.write(
+        b"".join(
+            packer.pack(record) for record in iterRecords(finalRecs, origins, userNames)
+        )
+    )
 
-def writeRecList(finalRecs, origins, userNames):
+
+# format -> (writer, file extension, binary)
+WRITERS = {
+    "text": (writeTextRecList, "txt", False),
+    "jsonl": (writeJsonLinesRecList, "jsonl", False),
+    "csv": (writeCsvRecList, "csv", False),
+    "msgpack": (writeMsgpackRecList, "msgpack", True),
+}
+
+
+def availableFormats():
+    return [name for name in WRITERS if name != "msgpack" or msgpack is not None]
+
+
+def writeRecList(finalRecs, origins, userNames, outputFormat="text", directory="."):
+    writer, extension, binary = WRITERS[outputFormat]
+    if outputFormat == "msgpack" and msgpack is None:
+        raise RuntimeError("the msgpack output format requires msgpack to be installed")
     fullName = ""
     for userName in userNames:
         fullName += f"{userName}-"
-    with open(f"{fullName}recs.txt", "w", encoding="utf-8") as f:
-        for rec in finalRecs:
-
-            media = rec["recMedia"]
-            title = getEnglishTitleOrUserPreferred(media["title"])
-            mediaFormat = media["format"]
-            year = media["startDate"]["year"]
-            score = rec["recScore"]
-            print(f"{title} ({mediaFormat}, {year}): {score}%", file=f)
-
-            if "meanScore" in media:
-                meanScore = media["meanScore"]
-                print(f"\tother users rated it {meanScore}%\n", file=f)
-
-            for i in range(len(userNames)):
-                print(
-                    generateOriginStringForType(
-                        media=media, origins=origins[i], userName=userNames[i]
-                    ),
-                    file=f,
-                )
+    fileName = os.path.join(directory, f"{fullName}recs.{extension}")
+    if binary:
+        with open(fileName, "wb") as f:
+            writer(f, finalRecs, origins, userNames)
+    else:
+        with open(fileName, "w", encoding="utf-8") as f:
+            writer(f, finalRecs, origins, userNames)
+
+
+def writePropertyFiles(userName, propertyRatings, directory="."):
+    # what the user's ratings say about each property, one text file per property
+    properties = [
+        ("tags", lambda x: x["tag"].name),
+        ("studios", lambda x: x["studio"].name),
+        ("genres", lambda x: x["genre"]),
+        ("decades", lambda x: x["decade"]),
+        ("staff", lambda x: x["staff"].name),
+    ]
+    for key, nameOf in properties:
+        with open(
+            os.path.join(directory, f"{userName}-{key}.txt"), "w", encoding="utf-8"
+        ) as f:
+            f.write(
+                "".join(f"{nameOf(x)}: {x['score']}%\n" for x in propertyRatings[key])
+            )
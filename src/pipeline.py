@@ -0,0 +1,238 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import functools
+import multiprocessing
+import os
+from algorithm import needsRecommendations, scoreRecommendationList
+from cachefiles import saveUserList, userListIsFresh
+import constants
+from fetchstats import newFetchStats, printFetchStats, recordFetchStats
+import profiling
+from ratelimit import TokenBucket
+from records import detachedRecs
+
+
+def defaultJobs(userCount: int):
+    return max(1, min(userCount, os.cpu_count() or 1))
+
+
+def scoreUser(
+    userName,
+    use,
+    backend,
+    limit,
+    propertyFiles,
+    resultCache=True,
+    candidates="recs",
+    expand=1,
+    directory=".",
+    profile=None,
+):
+    # runs in a worker process. cached media link to each other through their
+    # recommendations, which would make the result a deep graph to pickle, and nothing
+    # after scoring reads them. profile holds the parent's profiling options, and what
+    # was measured here is sent back with the result
+    if profile is not None:
+        profiling.enable(**profile)
+    try:
+        finalRecs, finalOrigins, userList, userIndex = scoreRecommendationList(
+            userName=userName,
+            use=use,
+            backend=backend,
+            limit=limit,
+            propertyFiles=propertyFiles,
+            resultCache=resultCache,
+            candidates=candidates,
+            expand=expand,
+            directory=directory,
+        )
+        measured = profiling.snapshot()
+    finally:
+        profiling.disable()
+    return (detachedRecs(finalRecs), finalOrigins, userList, userIndex), measured
+
+
+def newScoringPool(jobs):
+    # spawn rather than fork, so workers never inherit the parent's sqlite connection
+    if jobs <= 1:
+        return None
+    return ProcessPoolExecutor(
+        max_workers=jobs, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+def forgetFailedFetch(task, listFetches):
+    # so the next run to need the list fetches it again rather than share the failure
+    if task.cancelled() or task.exception() is not None:
+        for key in [key for key, other in listFetches.items() if other is task]:
+            del listFetches[key]
+
+
+async def runPipelineAsync(
+    userNames,
+    use,
+    refresh,
+    backend="python",
+    incremental=False,
+    jobs=None,
+    onResult=None,
+    limit=None,
+    propertyFiles=False,
+    resultCache=True,
+    candidates="recs",
+    expand=1,
+    directory=".",
+    limiter=None,
+    stats=None,
+    inFlight=None,
+    pool=None,
+    client=None,
+    listFetches=None,
+):
+    # every stale list is fetched at once under one shared limiter, and each user is
+    # scored as soon as their list is cached. scoring is cpu bound, so with more than one
+    # job it runs in a process pool, and with one on a thread of its own so the loop
+    # keeps fetching meanwhile. onResult(userName, result) is called in the order
+    # users finish; the results come back in the order of userNames. a limit only trims
+    # the scored lists of a single user, since a joint list needs every member's full list.
+    # resultCache reuses lists scored before, see resultcache.py. several runs can share
+    # one limiter, fetch stats, in flight requests, process pool and AniListClient by
+    # passing them in; stats passed in are left for the caller to print and a client
+    # passed in for the caller to close. runs sharing listFetches fetch each user's list
+    # once between them, see fetchUserList
+    jobs = jobs or defaultJobs(len(userNames))
+    scoringLimit = limit if len(userNames) == 1 else None
+    loop = asyncio.get_running_loop()
+    limiter = limiter or TokenBucket(constants.REQUESTS_PER_MINUTE)
+    ownStats = stats is None
+    stats = newFetchStats() if ownStats else stats
+    inFlight = {} if inFlight is None else inFlight
+    listFetches = {} if listFetches is None else listFetches
+    mediaTtl = None if incremental else constants.MEDIA_TTL_S
+    # lists scored from the similar titles index alone don't fetch recommendations
+    withRecommendations = needsRecommendations(candidates, expand)
+    profileOptions = (
+        {"cprofile": profiling.active.cprofile is not None}
+        if profiling.active is not None
+        else None
+    )
+
+    ownPool = pool is None
+    if ownPool:
+        pool = newScoringPool(jobs)
+    scorer = ThreadPoolExecutor(max_workers=1) if pool is None else None
+    ownClient = client is None
+
+    async def fetchUserList(userName):
+        nonlocal client
+        # the network stack is only imported once there's something to fetch
+        from apitools import AniListClient, fetchEntriesForUser
+
+        if client is None:
+            client = AniListClient()
+        print(f"fetching data for user {userName}")
+        with profiling.stage("fetch", user=userName):
+            entries = await fetchEntriesForUser(
+                userName=userName,
+                limiter=limiter,
+                stats=stats,
+                mediaTtl=mediaTtl,
+                inFlight=inFlight,
+                client=client,
+                withRecommendations=withRecommendations,
+            )
+            saveUserList(userName, entries)
+
+    async def processUser(userName):
+        # a list fetched, or being fetched, by a run sharing listFetches is reused even
+        # with refresh, when it had the same media ttl and any recommendations needed
+        kinds = [True] if withRecommendations else [True, False]
+        fetch = next(
+            (
+                listFetches[(userName, kind, mediaTtl)]
+                for kind in kinds
+                if (userName, kind, mediaTtl) in listFetches
+            ),
+            None,
+        )
+        if fetch is None and (
+            refresh
+            or not userListIsFresh(userName=userName, withRecommendations=withRecommendations)
+        ):
+            fetch = asyncio.ensure_future(fetchUserList(userName))
+            listFetches[(userName, withRecommendations, mediaTtl)] = fetch
+            fetch.add_done_callback(lambda task: forgetFailedFetch(task, listFetches))
+        if fetch is not None:
+            # another run waiting on the same fetch isn't cancelled along with this one
+            await asyncio.shield(fetch)
+        score = functools.partial(
+            scoreUser if pool else scoreRecommendationList,
+            userName=userName,
+            use=use,
+            backend=backend,
+            limit=scoringLimit,
+            propertyFiles=propertyFiles,
+            resultCache=resultCache,
+            candidates=candidates,
+            expand=expand,
+            directory=directory,
+        )
+        if pool:
+            result, measured = await loop.run_in_executor(
+                pool, functools.partial(score, profile=profileOptions)
+            )
+            profiling.merge(measured)
+        else:
+            result = await loop.run_in_executor(scorer, score)
+        if onResult:
+            onResult(userName, result)
+        return result
+
+    try:
+        results = await asyncio.gather(*[processUser(userName) for userName in userNames])
+    finally:
+        if ownPool and pool:
+            pool.shutdown(cancel_futures=True)
+        if scorer is not None:
+            scorer.shutdown(cancel_futures=True)
+        if ownClient and client is not None:
+            await client.close()
+    if ownStats:
+        if stats["requests"]:
+            printFetchStats(stats)
+        recordFetchStats(stats)
+    return results
+
+
+def runPipeline(
+    userNames,
+    use,
+    refresh,
+    backend="python",
+    incremental=False,
+    jobs=None,
+    onResult=None,
+    limit=None,
+    propertyFiles=False,
+    resultCache=True,
+    candidates="recs",
+    expand=1,
+    directory=".",
+):
+    return asyncio.run(
+        runPipelineAsync(
+            userNames=userNames,
+            use=use,
+            refresh=refresh,
+            backend=backend,
+            incremental=incremental,
+            jobs=jobs,
+            onResult=onResult,
+            limit=limit,
+            propertyFiles=propertyFiles,
+            resultCache=resultCache,
+            candidates=candidates,
+            expand=expand,
+            directory=directory,
+        )
+    )
@@ -0,0 +1,204 @@
+from collections import Counter
+import contextlib
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# the running Profiler while --profile is on. every helper below is a no-op without one,
+# so instrumented code costs a global lookup when profiling is off
+active = None
+
+NO_STAGE = contextlib.nullcontext()
+
+
+class Profiler:
+    def __init__(self, cprofile=False):
+        # stage name -> [calls, seconds, peak memory in MB]
+        self.stages = {}
+        self.counters = Counter()
+        # chrome trace events, see writeTrace
+        self.events = []
+        self.cprofile = cProfile.Profile() if cprofile else None
+        # raw cProfile stats collected in worker processes
+        self.cprofileStats = []
+
+    def record(self, name, start, seconds, args=None):
+        memory = peakMemoryMB()
+        stage = self.stages.setdefault(name, [0, 0.0, 0.0])
+        stage[0] += 1
+        stage[1] += seconds
+        stage[2] = max(stage[2], memory)
+        self.events.append(
+            {
+                "name": name,
+                "ph": "X",
+                "ts": start * 1e6,
+                "dur": seconds * 1e6,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": {**(args or {}), "peakMemoryMB": round(memory, 1)},
+            }
+        )
+
+
+def peakMemoryMB():
+    # peak resident memory of this process so far. needs the resource module (not on windows)
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def enable(cprofile=False):
+    global active
+    active = Profiler(cprofile=cprofile)
+    return active
+
+
+def disable():
+    global active
+    profiler, active = active, None
+    return profiler
+
+
+@contextlib.contextmanager
+def timedStage(profiler, name, scoring, args):
+    profileScoring = scoring and profiler.cprofile is not None
+    start = time.perf_counter()
+    if profileScoring:
+        profiler.cprofile.enable()
+    try:
+        yield
+    finally:
+        if profileScoring:
+            profiler.cprofile.disable()
+        profiler.record(name, start, time.perf_counter() - start, args)
+
+
+def stage(name, scoring=False, **args):
+    # times the block as one call of stage `name`. scoring stages also run under cProfile
+    # when that was asked for. args end up in the trace event
+    if active is None:
+        return NO_STAGE
+    return timedStage(active, name, scoring, args)
+
+
+def timedIter(name, iterable, **args):
+    # times only what it takes to produce the items, as one call of stage `name`
+    if active is None:
+        return iterable
+    return timedItems(active, name, iterable, args)
+
+
+def timedItems(profiler, name, iterable, args):
+    start = time.perf_counter()
+    seconds = 0.0
+    iterator = iter(iterable)
+    while True:
+        itemStart = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            break
+        finally:
+            seconds += time.perf_counter() - itemStart
+        yield item
+    profiler.record(name, start, seconds, args)
+
+
+def count(name, n=1):
+    if active is not None:
+        active.counters[name] += n
+
+
+def snapshot():
+    # the active profiler as plain data, to send back from a worker process
+    if active is None:
+        return None
+    cprofileStats = list(active.cprofileStats)
+    if active.cprofile is not None:
+        active.cprofile.create_stats()
+        cprofileStats.append(active.cprofile.stats)
+    return {
+        "stages": active.stages,
+        "counters": dict(active.counters),
+        "events": active.events,
+        "cprofileStats": cprofileStats,
+    }
+
+
+def merge(data):
+    if active is None or data is None:
+        return
+    for name, (calls, seconds, memory) in data["stages"].items():
+        stage = active.stages.setdefault(name, [0, 0.0, 0.0])
+        stage[0] += calls
+        stage[1] += seconds
+        stage[2] = max(stage[2], memory)
+    active.counters.update(data["counters"])
+    active.events.extend(data["events"])
+    active.cprofileStats.extend(data["cprofileStats"])
+
+
+def printSummary(profiler, wallTime=None):
+    print(f"{'stage':<14}{'calls':>8}{'seconds':>10}{'peak MB':>10}")
+    for name, (calls, seconds, memory) in profiler.stages.items():
+        print(f"{name:<14}{calls:>8}{seconds:>10.3f}{memory:>10.1f}")
+    if wallTime is not None:
+        print(f"{'wall time':<22}{wallTime:>10.3f}{peakMemoryMB():>10.1f}")
+    if profiler.counters:
+        print(f"{'counter':<22}{'value':>10}")
+        for name, value in sorted(profiler.counters.items()):
+            value = f"{value:.1f}" if isinstance(value, float) else value
+            print(f"{name:<22}{value:>10}")
+
+
+def writeTrace(profiler, fileName, wallTime=None):
+    # chrome trace event format, viewable in chrome://tracing or ui.perfetto.dev. the
+    # summary rides along in otherData
+    trace = {
+        "traceEvents": profiler.events,
+        "displayTimeUnit": "ms",
+        "otherData": {
+            "stages": {
+                name: {"calls": calls, "seconds": seconds, "peakMemoryMB": memory}
+                for name, (calls, seconds, memory) in profiler.stages.items()
+            },
+            "counters": dict(profiler.counters),
+            "wallTime": wallTime,
+        },
+    }
+    with open(fileName, "w", encoding="utf-8") as f:
+        json.dump(trace, f)
+
+
+class RawStats:
+    # what pstats.Stats needs to load stats gathered by another process's cProfile
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def writeCProfile(profiler, fileName):
+    allStats = list(profiler.cprofileStats)
+    if profiler.cprofile is not None:
+        profiler.cprofile.create_stats()
+        allStats.append(profiler.cprofile.stats)
+    allStats = [stats for stats in allStats if stats]
+    if not allStats:
+        return
+    merged = pstats.Stats(RawStats(allStats[0]))
+    for stats in allStats[1:]:
+        merged.add(RawStats(stats))
+    merged.dump_stats(fileName)
@@ -1,82 +1,95 @@
-def userListQuery():
-    return f"""query MediaListCollection($name: String, $type: MediaType, $chunk: Int) {{
-    MediaListCollection (userName: $name, type: $type, status_not: PLANNING, chunk: $chunk, perChunk: 60) {{
+def mediaFields(withRecommendations=True):
+    # withRecommendations=False leaves out every title's recommendations and the details
+    # of the titles they point at, for lists scored from the similar titles index alone
+    return f"""
+    id
+    title {{
+      english
+      userPreferred
+    }}
+    staff (page: 1, perPage: 20, sort: FAVOURITES_DESC) {{
+      nodes {{
+        id
+        name {{
+          userPreferred
+        }}
+      }}
+    }}
+    meanScore
+    format
+    popularity
+    startDate {{
+      year
+    }}
+    studios (isMain: true) {{
+      nodes {{
+        name
+        id
+      }}
+    }}
+    genres
+    tags {{
+      id
+      rank
+      name
+    }}
+{recommendationFields() if withRecommendations else ""}"""
+
+
+def recommendationFields():
+    return f"""    recommendations (sort: RATING_DESC) {{
+      nodes {{
+        rating
+        mediaRecommendation {{
+          id
+          title {{
+            english
+            userPreferred
+          }}
+          staff (page: 1, perPage: 20, sort: FAVOURITES_DESC) {{
+            nodes {{
+              id
+              name {{
+                userPreferred
+              }}
+            }}
+          }}
+          meanScore
+          format
+          popularity
+          startDate {{
+            year
+          }}
+          studios (isMain: true) {{
+            nodes {{
+              name
+              id
+            }}
+          }}
+          genres
+          tags {{
+            id
+            rank
+            name
+          }}
+        }}
+      }}
+    }}
+"""
+
+
+def userListSummaryQuery():
+    return f"""query MediaListSummary($name: String, $type: MediaType, $chunk: Int) {{
+    MediaListCollection (userName: $name, type: $type, status_not: PLANNING, chunk: $chunk, perChunk: 500) {{
       hasNextChunk
       lists {{
-        name
         isCustomList
         entries {{
           score(format: POINT_100)
           status
+          updatedAt
           media {{
             id
-            title {{
-              english
-              userPreferred
-            }}
-            staff (page: 1, perPage: 20, sort: FAVOURITES_DESC) {{
-              nodes {{
-                id
-                name {{
-                  userPreferred
-                }}
-              }}
-            }}
-            meanScore
-            popularity
-            startDate {{
-              year
-            }}
-            studios (isMain: true) {{
-              nodes {{
-                name
-                id
-              }}
-            }}
-            genres
-            tags {{
-              id
-              rank
-              name
-            }}
-            recommendations (sort: RATING_DESC) {{
-              nodes {{
-                rating
-                mediaRecommendation {{
-                  id
-                  title {{
-                    english
-                    userPreferred
-                  }}
-                  staff (page: 1, perPage: 20, sort: FAVOURITES_DESC) {{
-                    nodes {{
-                      id
-                      name {{
-                        userPreferred
-                      }}
-                    }}
-                  }}
-                  meanScore
-                  format
-                  popularity
-                  startDate {{
-                    year
-                  }}
-                  studios (isMain: true) {{
-                    nodes {{
-                      name
-                      id
-                    }}
-                  }}
-                  genres
-                  tags {{
-                    id
-                    rank
-                    name
-                  }}
-                }}
-              }}
-            }}
           }}
         }}
       }}
@@ -84,6 +97,14 @@ def userListQuery():
   }}"""
 
 
+def mediaDetailsQuery(withRecommendations=True):
+    return f"""query MediaDetails($ids: [Int]) {{
+    Page (page: 1, perPage: 50) {{
+      media (id_in: $ids) {{{mediaFields(withRecommendations)}}}
+    }}
+  }}"""
+
+
 # def userMeanScoresQuery():
 #     return f"""query User($name: String) {{
 #   User (name: $name) {{
@@ -0,0 +1,72 @@
+import asyncio
+from collections import deque
+import time
+
+import constants
+
+
+class TokenBucket:
+    # shared request budget for every fetch running on the same event loop
+
+    def __init__(self, requestsPerMinute, burst=1):
+        # the most the rate is ever set to, lowered to the server's budget once it's known
+        self.requestsPerMinute = requestsPerMinute
+        self.rate = requestsPerMinute / 60
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blockedUntil = 0
+        self.lock = asyncio.Lock()
+        # when the tokens of the last rate limit window were handed out, and how many
+        # were handed out in all
+        self.handedOut = deque()
+        self.issued = 0
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        # returns the token's number, see issuedSince
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blockedUntil:
+                    await asyncio.sleep(self.blockedUntil - now)
+                    continue
+                self.refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.handedOut.append(now)
+                    self.forgetOlderThanWindow(now)
+                    self.issued += 1
+                    return self.issued
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def forgetOlderThanWindow(self, now):
+        while self.handedOut and self.handedOut[0] <= now - constants.RATE_LIMIT_WINDOW_S:
+            self.handedOut.popleft()
+
+    def issuedSince(self, token):
+        # tokens handed out after the given one
+        return self.issued - token
+
+    def recentRequests(self):
+        # tokens handed out within the last rate limit window
+        self.forgetOlderThanWindow(time.monotonic())
+        return len(self.handedOut)
+
+    def setRate(self, requestsPerMinute):
+        self.refill(max(time.monotonic(), self.updated))
+        self.rate = requestsPerMinute / 60
+
+    def pause(self, seconds):
+        # stop handing out tokens, e.g. after the server told us to back off. returns how
+        # much longer every request now has to sleep, which is less than seconds when a
+        # pause was already running
+        now = time.monotonic()
+        added = max(0.0, now + seconds - max(self.blockedUntil, now))
+        self.blockedUntil = max(self.blockedUntil, now + seconds)
+        self.tokens = 0
+        self.updated = max(self.updated, self.blockedUntil)
+        return added
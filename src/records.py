@@ -0,0 +1,189 @@
+# the in-memory model scoring works on. lists and media are read from the store into
+# these once, at load time. a tag, staff member or studio is one shared Property however
+# many titles it appears on, and everything is compared and looked up by integer id
+
+
+class Property:
+    # a tag, staff member or studio
+    __slots__ = ("id", "name")
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+    def __repr__(self):
+        return f"Property({self.id!r}, {self.name!r})"
+
+
+class Media:
+    # tagRanks holds the rank of each of tags, in the same order. recommendations is a
+    # tuple of (rating, Media or None) pairs, or None when they weren't loaded
+    __slots__ = (
+        "id",
+        "titleEnglish",
+        "titleUserPreferred",
+        "format",
+        "meanScore",
+        "popularity",
+        "year",
+        "genres",
+        "tags",
+        "tagRanks",
+        "staff",
+        "studios",
+        "recommendations",
+    )
+
+    def __init__(
+        self,
+        id,
+        titleEnglish=None,
+        titleUserPreferred=None,
+        format=None,
+        meanScore=None,
+        popularity=None,
+        year=None,
+        genres=(),
+        tags=(),
+        tagRanks=(),
+        staff=(),
+        studios=(),
+        recommendations=None,
+    ):
+        self.id = id
+        self.titleEnglish = titleEnglish
+        self.titleUserPreferred = titleUserPreferred
+        self.format = format
+        self.meanScore = meanScore
+        self.popularity = popularity
+        self.year = year
+        self.genres = genres
+        self.tags = tags
+        self.tagRanks = tagRanks
+        self.staff = staff
+        self.studios = studios
+        self.recommendations = recommendations
+
+    @property
+    def title(self):
+        return self.titleEnglish if self.titleEnglish else self.titleUserPreferred
+
+    def withoutRecommendations(self):
+        # a copy that doesn't hold on to the recommendation graph, e.g. to pickle it
+        media = Media.__new__(Media)
+        for name in Media.__slots__:
+            setattr(media, name, getattr(self, name))
+        media.recommendations = None
+        return media
+
+    def __repr__(self):
+        return f"Media({self.id!r}, {self.title!r})"
+
+
+class Entry:
+    # one title on a user's list. media is None once scoring no longer needs it
+    __slots__ = ("mediaId", "score", "status", "updatedAt", "media")
+
+    def __init__(self, mediaId, score, status, updatedAt=None, media=None):
+        self.mediaId = mediaId
+        self.score = score
+        self.status = status
+        self.updatedAt = updatedAt
+        self.media = media
+
+    def __repr__(self):
+        return f"Entry({self.mediaId!r}, {self.score!r}, {self.status!r})"
+
+
+def detachedRecs(recs):
+    # scored recs whose media don't hold on to the recommendation graph, e.g. to pickle
+    # them
+    return [
+        rec
+        if rec["recMedia"].recommendations is None
+        else {**rec, "recMedia": rec["recMedia"].withoutRecommendations()}
+        for rec in recs
+    ]
+
+
+def newPropertyTables():
+    # id -> Property for each kind, shared by everything loaded together. genres map to
+    # one shared string each
+    return {"tags": {}, "staff": {}, "studios": {}, "genres": {}}
+
+
+def internProperty(table, propId, name):
+    prop = table.get(propId)
+    if prop is None:
+        prop = table[propId] = Property(propId, name)
+    return prop
+
+
+def mediaFromPayload(payload, mediaCache=None, properties=None):
+    # a media dict as the GraphQL queries return it (queries.mediaFields) as a Media.
+    # like mediastore.loadMedia, a media id maps to one shared Media
+    mediaCache = {} if mediaCache is None else mediaCache
+    properties = newPropertyTables() if properties is None else properties
+    media = mediaCache.get(payload["id"])
+    if media is None:
+        title = payload.get("title") or {}
+        media = mediaCache[payload["id"]] = Media(
+            id=payload["id"],
+            titleEnglish=title.get("english"),
+            titleUserPreferred=title.get("userPreferred"),
+            format=payload.get("format"),
+            meanScore=payload.get("meanScore"),
+            popularity=payload.get("popularity"),
+            year=(payload.get("startDate") or {}).get("year"),
+            genres=tuple(
+                properties["genres"].setdefault(genre, genre)
+                for genre in payload.get("genres") or ()
+            ),
+            tags=tuple(
+                internProperty(properties["tags"], tag["id"], tag.get("name"))
+                for tag in payload.get("tags") or ()
+            ),
+            tagRanks=tuple(tag["rank"] for tag in payload.get("tags") or ()),
+            staff=tuple(
+                internProperty(
+                    properties["staff"],
+                    staff["id"],
+                    (staff.get("name") or {}).get("userPreferred"),
+                )
+                for staff in (payload.get("staff") or {}).get("nodes") or ()
+            ),
+            studios=tuple(
+                internProperty(properties["studios"], studio["id"], studio.get("name"))
+                for studio in (payload.get("studios") or {}).get("nodes") or ()
+            ),
+        )
+    elif media.format is None:
+        # top level list media come without a format, recommended ones with it
+        media.format = payload.get("format")
+    if media.recommendations is None and payload.get("recommendations"):
+        media.recommendations = tuple(
+            (
+                rec["rating"],
+                mediaFromPayload(rec["mediaRecommendation"], mediaCache, properties)
+                if rec["mediaRecommendation"]
+                else None,
+            )
+            for rec in payload["recommendations"]["nodes"]
+        )
+    return media
+
+
+def entriesFromPayload(userList):
+    # list entries as the GraphQL queries return them as Entry records
+    mediaCache = {}
+    properties = newPropertyTables()
+    return [
+        Entry(
+            mediaId=entry["media"]["id"],
+            score=entry["score"],
+            status=entry.get("status", ""),
+            updatedAt=entry.get("updatedAt"),
+            media=mediaFromPayload(entry["media"], mediaCache, properties),
+        )
+        for entry in userList
+    ]
@@ -0,0 +1,38 @@
+import hashlib
+import pickle
+
+import cachefiles
+import constants
+import mediastore
+import profiling
+
+
+def contentKey(userName, candidates="recs", expand=1):
+    # what a user's results are computed from: their list and the titles it reaches as
+    # they are stored right now, the similar titles index and the whole recommendation
+    # graph if they're used, and the version of the scoring code
+    key = f"{cachefiles.userContentHash(userName=userName)}-v{constants.ALGORITHM_VERSION}"
+    if candidates != "recs":
+        count, builtAt = mediastore.similarMediaVersion()
+        key = f"{key}-{candidates}-{count}-{builtAt}"
+    if expand > 1:
+        count, fetchedAt = mediastore.recommendationGraphVersion()
+        key = f"{key}-expand{expand}-{count}-{fetchedAt}"
+    return key
+
+
+def resultKey(kind, *parts):
+    return f"{kind}-{hashlib.sha256(repr(parts).encode()).hexdigest()}"
+
+
+def get(key):
+    payload = mediastore.loadResult(key)
+    if payload is None:
+        profiling.count("result cache misses")
+        return None
+    profiling.count("result cache hits")
+    return pickle.loads(payload)
+
+
+def put(key, value):
+    mediastore.saveResult(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
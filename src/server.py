@@ -0,0 +1,382 @@
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from algorithm import (
+    CANDIDATE_SOURCES,
+    loadUserState,
+    needsRecommendations,
+    numpyBackendAvailable,
+    rankUserState,
+    unwatchedRecs,
+)
+from cachefiles import saveUserList, userListIsFresh
+import constants
+from fetchstats import newFetchStats, printFetchStats
+from group import STRATEGIES, generateGroupList
+from output import iterRecords
+from ratelimit import TokenBucket
+from resultcache import contentKey
+
+TRUE_VALUES = {"1", "true", "yes", "on"}
+
+
+class LoadError(Exception):
+    pass
+
+
+class RecommendationService:
+    # keeps every requested user's loaded list, property ratings and candidates in memory
+    # and reloads them once they're older than ttl seconds. fetches run on one background
+    # thread with its own event loop, since the limiter has to outlive single requests to
+    # keep the server within AniList's budget. loading a list into memory is cpu bound, so
+    # it runs on one loader thread of its own and the loop keeps fetching meanwhile. each
+    # of the two threads keeps its own sqlite connection, see mediastore.getStore
+
+    def __init__(
+        self,
+        ttl=constants.SERVE_TTL_S,
+        backend="python",
+        incremental=False,
+        url=constants.ANILIST_URL,
+        candidates="recs",
+        expand=1,
+    ):
+        self.ttl = ttl
+        self.backend = backend
+        self.candidates = candidates
+        self.expand = expand
+        self.mediaTtl = None if incremental else constants.MEDIA_TTL_S
+        self.url = url
+        # user name -> (UserState, time.monotonic() when it was loaded)
+        self.users = {}
+        # user name -> task loading them, only touched on the loop
+        self.loading = {}
+        self.loop = asyncio.new_event_loop()
+        self.loader = ThreadPoolExecutor(max_workers=1)
+        self.limiter = None
+        # the connections to AniList, opened on the first fetch and kept while serving
+        self.client = None
+
+    def start(self):
+        started = threading.Event()
+        threading.Thread(target=self.run, args=(started,), daemon=True).start()
+        started.wait()
+        return self
+
+    def run(self, started):
+        asyncio.set_event_loop(self.loop)
+        self.limiter = TokenBucket(constants.REQUESTS_PER_MINUTE)
+        self.loop.create_task(self.refreshExpired())
+        self.loop.call_soon(started.set)
+        self.loop.run_forever()
+
+    def preload(self, userNames):
+        # starts loading without waiting; requests for these users join the same load
+        asyncio.run_coroutine_threadsafe(self.load(userNames), self.loop)
+
+    def getStates(self, userNames):
+        # called from request threads. warm users are answered right away, the others
+        # wait until they're fetched if needed and loaded
+        missing = [userName for userName in userNames if userName not in self.users]
+        if missing:
+            errors = asyncio.run_coroutine_threadsafe(
+                self.load(missing), self.loop
+            ).result()
+            if errors:
+                userName, error = next(iter(errors.items()))
+                raise LoadError(f"could not load {userName}: {error}")
+        return [self.users[userName][0] for userName in userNames]
+
+    async def load(self, userNames, refresh=False):
+        # returns user name -> exception for the users that couldn't be loaded. users
+        # loaded together share their media requests, like in runPipeline
+        inFlight = {}
+        tasks = {}
+        for userName in dict.fromkeys(userNames):
+            if userName not in self.loading:
+                if not refresh and userName in self.users:
+                    continue
+                self.loading[userName] = self.loop.create_task(
+                    self.loadUser(userName, refresh, inFlight)
+                )
+            tasks[userName] = self.loading[userName]
+        results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+        return {
+            userName: result
+            for userName, result in zip(tasks, results)
+            if isinstance(result, Exception)
+        }
+
+    async def loadUser(self, userName, refresh, inFlight):
+        try:
+            withRecommendations = needsRecommendations(self.candidates, self.expand)
+            if refresh or not userListIsFresh(
+                userName=userName, withRecommendations=withRecommendations
+            ):
+                from apitools import AniListClient, fetchEntriesForUser
+
+                if self.client is None:
+                    self.client = AniListClient(url=self.url)
+                print(f"fetching data for user {userName}")
+                stats = newFetchStats()
+                entries = await fetchEntriesForUser(
+                    userName=userName,
+                    limiter=self.limiter,
+                    stats=stats,
+                    url=self.url,
+                    mediaTtl=self.mediaTtl,
+                    inFlight=inFlight,
+                    client=self.client,
+                    withRecommendations=withRecommendations,
+                )
+                printFetchStats(stats)
+                saveUserList(userName, entries)
+            state = await self.loop.run_in_executor(self.loader, self.loadState, userName)
+            self.users[userName] = (state, time.monotonic())
+        finally:
+            del self.loading[userName]
+
+    def loadState(self, userName):
+        # runs on the loader thread
+        return loadUserState(
+            userName=userName,
+            contentKey=contentKey(userName, candidates=self.candidates, expand=self.expand),
+            candidates=self.candidates,
+            expand=self.expand,
+        )
+
+    async def refreshExpired(self):
+        # users keep being served from their old state while they're refreshed. a failed
+        # refresh is tried again after another ttl rather than on every check
+        while True:
+            await asyncio.sleep(min(self.ttl, constants.SERVE_CHECK_S))
+            now = time.monotonic()
+            expired = [
+                userName
+                for userName, (_, loadedAt) in self.users.items()
+                if now - loadedAt >= self.ttl
+            ]
+            if not expired:
+                continue
+            errors = await self.load(expired, refresh=True)
+            for userName, error in errors.items():
+                print(f"could not refresh {userName}: {error}")
+                state, _ = self.users[userName]
+                self.users[userName] = (state, time.monotonic())
+
+    def recommend(self, userNames, use, limit=None, strategy="mean", weights=None):
+        # the same lists nextani.py writes, as records (see output.recordForRec)
+        states = self.getStates(userNames)
+        if len(states) == 1:
+            state = states[0]
+            finalRecs, origins = rankUserState(
+                state=state, use=use, backend=self.backend, limit=limit
+            )
+            recs = itertools.islice(unwatchedRecs(finalRecs, state.userIndex), limit)
+            allOrigins = [origins]
+        else:
+            userData = []
+            for state in states:
+                finalRecs, origins = rankUserState(
+                    state=state, use=use, backend=self.backend
+                )
+                userData.append(
+                    {
+                        "userName": state.userName,
+                        "list": finalRecs,
+                        "origins": origins,
+                        "userList": state.userList,
+                        "userIndex": state.userIndex,
+                    }
+                )
+            recs = generateGroupList(
+                userData=userData,
+                strategy=strategy,
+                weights=weights,
+                rewatch=False,
+                limit=limit,
+            )
+            allOrigins = [d["origins"] for d in userData]
+        return list(iterRecords(recs, allOrigins, userNames))
+
+    def status(self):
+        now = time.monotonic()
+        return {
+            userName: {"age": round(now - loadedAt, 1), "titles": len(state.userList)}
+            for userName, (state, loadedAt) in list(self.users.items())
+        }
+
+
+def parseRecsQuery(query):
+    # /recs query parameters -> recommend() arguments. raises ValueError on bad input
+    params = {key: values[-1] for key, values in parse_qs(query).items()}
+    userNames = [name.strip() for name in params.get("users", "").split(",") if name.strip()]
+    if not userNames:
+        raise ValueError("users is required, e.g. users=name1,name2")
+
+    limit = params.get("limit")
+    if limit is not None:
+        if not limit.isdigit() or int(limit) < 1:
+            raise ValueError("limit must be at least 1")
+        limit = int(limit)
+
+    strategy = params.get("strategy", "mean")
+    if strategy not in STRATEGIES:
+        raise ValueError(f"strategy must be one of {', '.join(STRATEGIES)}")
+
+    weights = params.get("weights")
+    if weights is not None:
+        try:
+            weights = [float(weight) for weight in weights.split(",")]
+        except ValueError:
+            raise ValueError(f"invalid weights: {params['weights']}")
+        if strategy != "weighted":
+            raise ValueError("weights only applies to strategy=weighted")
+        if len(weights) != len(userNames):
+            raise ValueError("weights needs exactly one weight per user")
+        if any(weight < 0 for weight in weights) or sum(weights) <= 0:
+            raise ValueError("weights must not be negative and must not all be 0")
+
+    use = {
+        angle: params.get(angle, "").lower() in TRUE_VALUES
+        for angle in ["tags", "staff", "studios", "genres"]
+    }
+    use["decades"] = True
+    return {
+        "userNames": userNames,
+        "use": use,
+        "limit": limit,
+        "strategy": strategy,
+        "weights": weights,
+    }
+
+
+class RecommendationHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def sendJson(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        service = self.server.service
+        if url.path == "/users":
+            self.sendJson(200, service.status())
+            return
+        if url.path != "/recs":
+            self.sendJson(404, {"error": f"unknown path {url.path}"})
+            return
+        try:
+            request = parseRecsQuery(url.query)
+        except ValueError as e:
+            self.sendJson(400, {"error": str(e)})
+            return
+        start = time.perf_counter()
+        try:
+            recs = service.recommend(**request)
+        except LoadError as e:
+            self.sendJson(502, {"error": str(e)})
+            return
+        except Exception as e:
+            print(f"could not answer {self.path}: {e!r}")
+            self.sendJson(500, {"error": f"internal error: {e!r}"})
+            return
+        self.sendJson(
+            200,
+            {
+                "users": request["userNames"],
+                "seconds": round(time.perf_counter() - start, 4),
+                "recs": recs,
+            },
+        )
+
+
+class RecommendationServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        super().__init__(address, RecommendationHandler)
+        self.service = service
+
+
+parser = argparse.ArgumentParser(
+    prog="nextani.py serve",
+    description="Answer GET /recs?users=name1,name2&tags=1&staff=1&studios=1&genres=1&limit=50 with JSON, keeping every user's list in memory between requests. GET /users lists who is loaded",
+)
+parser.add_argument(
+    "userNames",
+    help="Anilist username(s) to load right away rather than on their first request",
+    nargs="*",
+)
+parser.add_argument("--host", default="127.0.0.1")
+parser.add_argument("--port", type=int, default=8080)
+parser.add_argument(
+    "--ttl",
+    help="Seconds a loaded user is served before their list is fetched again in the background",
+    type=float,
+    default=constants.SERVE_TTL_S,
+)
+parser.add_argument(
+    "-i",
+    "--incremental",
+    help="When refreshing, reuse every cached title no matter how old",
+    action="store_true",
+)
+parser.add_argument(
+    "--backend",
+    help="Scoring backend, see nextani.py --help",
+    choices=["python", "numpy"],
+    default="python",
+)
+parser.add_argument(
+    "--candidates",
+    help="Where recs come from, see nextani.py --help",
+    choices=list(CANDIDATE_SOURCES.keys()),
+    default="recs",
+)
+parser.add_argument(
+    "--expand",
+    help="How many recommendations away from a list recs may be, see nextani.py --help",
+    type=int,
+    choices=[1, 2, 3],
+    default=1,
+)
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    if args.backend == "numpy" and not numpyBackendAvailable():
+        parser.error("the numpy backend requires numpy and scipy to be installed")
+    if args.ttl <= 0:
+        parser.error("--ttl must be positive")
+
+    service = RecommendationService(
+        ttl=args.ttl,
+        backend=args.backend,
+        incremental=args.incremental,
+        candidates=args.candidates,
+        expand=args.expand,
+    ).start()
+    if args.userNames:
+        service.preload(args.userNames)
+    server = RecommendationServer((args.host, args.port), service)
+    print(f"serving recommendations on http://{args.host}:{server.server_address[1]}/recs")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,137 @@
+import argparse
+import time
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = None
+    sparse = None
+
+import constants
+import mediastore
+
+AVAILABLE = np is not None and sparse is not None
+
+# entries of the item x item block computed at once, about 64MB of float64
+BLOCK_CELLS = 8_000_000
+
+
+def ratingMatrix(scoredLists, minUsers):
+    # users x titles CSC matrices of scores centered on each user's mean, and of which
+    # titles were scored, for the titles at least minUsers users scored. users with fewer
+    # than two scores say nothing about how titles relate to each other
+    scoredLists = [entries for entries in scoredLists if len(entries) > 1]
+    raters = {}
+    for entries in scoredLists:
+        for mediaId in {mediaId for mediaId, _ in entries}:
+            raters[mediaId] = raters.get(mediaId, 0) + 1
+    mediaIds = sorted(mediaId for mediaId, count in raters.items() if count >= minUsers)
+    column = {mediaId: index for index, mediaId in enumerate(mediaIds)}
+    rows, columns, values = [], [], []
+    for row, entries in enumerate(scoredLists):
+        # a title listed twice keeps its first score, like indexUserList
+        scores = {}
+        for mediaId, score in entries:
+            scores.setdefault(mediaId, score)
+        mean = sum(scores.values()) / len(scores)
+        for mediaId, score in scores.items():
+            if mediaId in column:
+                rows.append(row)
+                columns.append(column[mediaId])
+                values.append(score - mean)
+    shape = (len(scoredLists), len(mediaIds))
+    centered = sparse.csc_matrix((values, (rows, columns)), shape=shape, dtype=np.float64)
+    rated = sparse.csc_matrix(
+        (np.ones(len(values)), (rows, columns)), shape=shape, dtype=np.float64
+    )
+    return mediaIds, centered, rated
+
+
+def buildNeighbours(
+    scoredLists,
+    neighbours=constants.SIMILAR_MEDIA_NEIGHBOURS,
+    minUsers=constants.SIMILAR_MEDIA_MIN_USERS,
+    shrink=constants.SIMILAR_MEDIA_SHRINK,
+):
+    # media id -> [(media id, similarity)] of its most similar titles, best first. the
+    # similarity is the cosine of two titles' mean centered scores over every user,
+    # shrunk towards 0 when few users scored both, so only positive, well supported
+    # pairs are kept
+    mediaIds, centered, rated = ratingMatrix(scoredLists, minUsers)
+    count = len(mediaIds)
+    if not count:
+        return {}
+    norms = np.sqrt(np.asarray(centered.multiply(centered).sum(axis=0)).ravel())
+    norms[norms == 0] = np.inf
+    centeredT = centered.T.tocsr()
+    ratedT = rated.T.tocsr()
+    ids = np.array(mediaIds)
+    result = {}
+    blockSize = max(1, BLOCK_CELLS // count)
+    for start in range(0, count, blockSize):
+        stop = min(start + blockSize, count)
+        products = (centeredT[start:stop] @ centered).toarray()
+        coRated = (ratedT[start:stop] @ rated).toarray()
+        similarity = products / norms[start:stop, None] / norms[None, :]
+        similarity *= coRated / (coRated + shrink)
+        similarity[coRated < minUsers] = 0
+        similarity[np.arange(stop - start), np.arange(start, stop)] = 0
+        keep = min(neighbours, count - 1)
+        if keep < 1:
+            break
+        top = np.argpartition(-similarity, keep - 1, axis=1)[:, :keep]
+        for offset, columns in enumerate(top):
+            scores = similarity[offset, columns]
+            order = np.argsort(-scores, kind="stable")
+            best = [
+                (int(ids[columns[i]]), float(scores[i])) for i in order if scores[i] > 0
+            ]
+            if best:
+                result[int(ids[start + offset])] = best
+    return result
+
+
+def buildIndex(
+    neighbours=constants.SIMILAR_MEDIA_NEIGHBOURS,
+    minUsers=constants.SIMILAR_MEDIA_MIN_USERS,
+):
+    # rebuilds the index in the store from every cached list. returns how many lists
+    # went into it and the index
+    scoredLists = [entries for _, entries in mediastore.iterScoredLists()]
+    index = buildNeighbours(scoredLists, neighbours=neighbours, minUsers=minUsers)
+    mediastore.saveSimilarMedia(index)
+    return len(scoredLists), index
+
+
+parser = argparse.ArgumentParser(
+    prog="nextani.py index",
+    description="Build the similar titles index from every list in the cache, for nextani.py --candidates similar or both. Requires numpy and scipy",
+)
+parser.add_argument(
+    "--neighbours",
+    help="Most similar titles kept per title",
+    type=int,
+    default=constants.SIMILAR_MEDIA_NEIGHBOURS,
+)
+parser.add_argument(
+    "--min-users",
+    help="Users that must have scored both titles for them to count as similar",
+    type=int,
+    default=constants.SIMILAR_MEDIA_MIN_USERS,
+)
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    if not AVAILABLE:
+        parser.error("building the index requires numpy and scipy to be installed")
+    if args.neighbours < 1 or args.min_users < 1:
+        parser.error("--neighbours and --min-users must be at least 1")
+    start = time.perf_counter()
+    listCount, index = buildIndex(neighbours=args.neighbours, minUsers=args.min_users)
+    pairs = sum(len(neighbours) for neighbours in index.values())
+    print(
+        f"indexed {len(index)} titles from {listCount} lists, {pairs} similar titles"
+        f" ({pairs * 8 / 1024:.0f}KB) in {time.perf_counter() - start:.1f}s"
+    )
@@ -0,0 +1,141 @@
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = None
+    sparse = None
+
+AVAILABLE = np is not None and sparse is not None
+
+# (use/ANGLES key, rec property list getter, property id getter, weights getter). the
+# weights getter returns one weight per property, in order
+COMPONENTS = [
+    (
+        "decades",
+        lambda m: [(int(m.year) // 10) * 10] if m.year else [],
+        None,
+        None,
+    ),
+    ("genres", lambda m: m.genres, None, None),
+    ("tags", lambda m: m.tags, lambda p: p.id, lambda m: m.tagRanks),
+    ("studios", lambda m: m.studios, lambda p: p.id, None),
+    ("staff", lambda m: m.staff, lambda p: p.id, None),
+]
+
+
+def encodeRecs(recs):
+    # one CSR matrix per component: recs x every property seen in the candidates,
+    # holding tag rank weights and one-hots otherwise. independent of the profile
+    # and the use flags, so it can be reused across both
+    recMedias = [rec["recMedia"] for rec in recs]
+    encoded = {
+        "recMedias": recMedias,
+        "recScores": np.fromiter(
+            (rec["recScore"] for rec in recs), dtype=np.float64, count=len(recs)
+        ),
+    }
+    for key, getProps, getId, getWeights in COMPONENTS:
+        propLists = [getProps(recMedia) for recMedia in recMedias]
+        props = [prop for propList in propLists for prop in propList]
+        ids = [getId(prop) for prop in props] if getId else props
+        weights = (
+            np.fromiter(
+                (
+                    weight
+                    for recMedia in recMedias
+                    for weight in getWeights(recMedia)
+                ),
+                np.float64,
+                len(props),
+            )
+            if getWeights
+            else np.ones(len(props), dtype=np.float64)
+        )
+        vocab = list(dict.fromkeys(ids))
+        columns = {propId: col for col, propId in enumerate(vocab)}
+        indices = np.fromiter((columns[i] for i in ids), np.int64, len(ids))
+        indptr = np.zeros(len(recMedias) + 1, dtype=np.int64)
+        np.cumsum(
+            np.fromiter((len(p) for p in propLists), np.int64, len(propLists)),
+            out=indptr[1:],
+        )
+        encoded[key] = {
+            "matrix": sparse.csr_matrix(
+                (weights, indices, indptr), shape=(len(recMedias), len(vocab))
+            ),
+            "vocab": vocab,
+            "ids": ids,
+            "props": props,
+        }
+    return encoded
+
+
+def calculateBiasesVectorized(
+    recs, use, recOrigins, userProfile, encoded=None, limit=None
+):
+    if not AVAILABLE:
+        raise RuntimeError("the numpy scoring backend requires numpy and scipy")
+    if encoded is None:
+        encoded = encodeRecs(recs)
+
+    userMean = userProfile["userMean"]
+    originThreshold = userProfile["originThreshold"]
+    recMedias = encoded["recMedias"]
+    finalScores = encoded["recScores"].copy()
+
+    for key, _, _, _ in COMPONENTS:
+        if not use[key]:
+            finalScores *= userMean
+            continue
+        component = encoded[key]
+        ratings = userProfile[key]
+        matrix = component["matrix"]
+        known = np.fromiter(
+            (propId in ratings for propId in component["vocab"]),
+            dtype=bool,
+            count=len(component["vocab"]),
+        )
+        scores = np.fromiter(
+            (ratings.get(propId, 0.0) for propId in component["vocab"]),
+            dtype=np.float64,
+            count=len(component["vocab"]),
+        )
+        totals = matrix @ scores
+        counts = matrix @ known.astype(np.float64)
+        componentScores = np.full(len(recMedias), userMean, dtype=np.float64)
+        np.divide(totals, counts, out=componentScores, where=counts > 0)
+        finalScores *= componentScores
+
+        # origins in rec order then property order, matching the python backend
+        hotEntries = np.flatnonzero((known & (scores > originThreshold))[matrix.indices])
+        if len(hotEntries):
+            rows = np.searchsorted(matrix.indptr, hotEntries, side="right") - 1
+            ids = component["ids"]
+            props = component["props"]
+            lastRow = None
+            for row, entry in zip(rows.tolist(), hotEntries.tolist()):
+                if row != lastRow:
+                    angleOrigins = recOrigins.setdefault(
+                        recMedias[row].id, {}
+                    ).setdefault(key, {})
+                    lastRow = row
+                angleOrigins[ids[entry]] = props[entry]
+
+    if limit is not None and limit < len(finalScores):
+        # the best `limit` in the same order a stable sort would give, ties included
+        if limit <= 0:
+            order = np.empty(0, dtype=np.intp)
+        else:
+            cutoff = np.partition(finalScores, len(finalScores) - limit)[
+                len(finalScores) - limit
+            ]
+            candidates = np.flatnonzero(finalScores >= cutoff)
+            order = candidates[np.argsort(-finalScores[candidates], kind="stable")][:limit]
+    else:
+        order = np.argsort(-finalScores, kind="stable")
+    finalRecs = [
+        {"recScore": score, "recMedia": recMedias[i]}
+        for i, score in zip(order.tolist(), finalScores[order].tolist())
+    ]
+
+    return finalRecs, recOrigins
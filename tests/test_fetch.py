@@ -0,0 +1,23 @@
+import pytest
+
+from benchmarks.fetch import run
+from benchmarks.mockserver import MockAniList
+
+REQUESTS_PER_MINUTE = 300
+
+
+@pytest.fixture
+def server():
+    server = MockAniList(requestsPerMinute=REQUESTS_PER_MINUTE, listSize=600).start()
+    yield server
+    server.stop()
+
+
+def test_limiter_at_budget_is_never_throttled(server):
+    assert run(server, REQUESTS_PER_MINUTE) == 0
+    assert server.stats["ok"] > 1
+
+
+def test_retries_stay_within_budget(server):
+    server.errorRate = 0.1
+    assert run(server, REQUESTS_PER_MINUTE) == 0
@@ -0,0 +1,23 @@
+from benchmarks.common import useTemporaryStore
+from benchmarks.startup import IMPORT_TARGET_MS, cacheHitRun, importTimeMs
+from benchmarks.synthetic import generateUserList
+import cachefiles
+import mediastore
+
+
+def test_cache_hit_run_skips_network_and_numpy():
+    directory = useTemporaryStore()
+    mediastore.saveUserList(
+        "testuser",
+        generateUserList(size=200),
+        fetchedOn=cachefiles.getTodayDateStamp(),
+        withMedia=True,
+    )
+    # the run reads pyani-cache.sqlite3 from its working directory, which is this store
+    mediastore.closeStore()
+    loaded, _ = cacheHitRun("testuser", directory)
+    assert loaded == []
+
+
+def test_import_stays_under_target():
+    assert importTimeMs("nextani") <= IMPORT_TARGET_MS
@@ -0,0 +1,52 @@
+import copy
+
+import pytest
+
+from algorithm import (
+    calculateBiases,
+    calculateInitial,
+    calculateMeanScore,
+    compileUserProfile,
+)
+from benchmarks.synthetic import generateUserList
+from records import entriesFromPayload
+import vectorscoring
+
+TOLERANCE = 1e-9
+
+
+@pytest.mark.skipif(not vectorscoring.AVAILABLE, reason="numpy/scipy not installed")
+@pytest.mark.parametrize(
+    "flags",
+    [(True,) * 5, (False, False, False, False, True), (True, False, True, False, False)],
+)
+def test_numpy_backend_matches_python(flags):
+    userList = entriesFromPayload(generateUserList(size=300))
+    meanScore = calculateMeanScore(userList)
+    propertyRatings, recs, origins = calculateInitial(userList=userList, meanScore=meanScore)
+    userProfile = compileUserProfile(propertyRatings=propertyRatings, userMean=meanScore)
+    use = dict(zip(["tags", "studios", "staff", "genres", "decades"], flags))
+
+    pythonRecs, pythonOrigins = calculateBiases(
+        propertyRatings=propertyRatings,
+        recs=recs,
+        use=use,
+        recOrigins=copy.deepcopy(origins),
+        userMean=meanScore,
+        userProfile=userProfile,
+    )
+    numpyRecs, numpyOrigins = vectorscoring.calculateBiasesVectorized(
+        recs=recs,
+        use=use,
+        recOrigins=copy.deepcopy(origins),
+        userProfile=userProfile,
+        encoded=vectorscoring.encodeRecs(recs),
+    )
+
+    pythonScores = {rec["recMedia"].id: rec["recScore"] for rec in pythonRecs}
+    numpyScores = {rec["recMedia"].id: rec["recScore"] for rec in numpyRecs}
+    assert len(pythonScores) > 0
+    assert pythonScores.keys() == numpyScores.keys()
+    for recId, score in pythonScores.items():
+        assert numpyScores[recId] == pytest.approx(score, rel=TOLERANCE, abs=TOLERANCE)
+    assert pythonOrigins == numpyOrigins